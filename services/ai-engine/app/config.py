@@ -7,6 +7,10 @@ from pydantic_settings import BaseSettings
 from functools import lru_cache
 from typing import Optional
 
+# Version of the pipeline's outputs and cached features (ai_edits, feature
+# store, style stats); bump it to invalidate everything computed before
+PIPELINE_VERSION = "2.0"
+
 
 class Settings(BaseSettings):
     supabase_url: str = ""
@@ -18,6 +22,13 @@ class Settings(BaseSettings):
     jpeg_quality: int = 95
     web_quality: int = 92
     thumb_quality: int = 80
+    feature_cache_dir: str = "/tmp/apelier-features"
+    feature_cache_max_mb: int = 512  # local per-hash cache, pruned least recently used first
+    compiled_preset_cache_size: int = 32  # per-worker LRU size for PresetPlans and compiled presets
+    preset_engine: str = "per_step"  # "per_step" | "compiled" (preset_compiler LUTs)
+    style_tile_budget_mb: int = 256
+    style_workers: int = 0
+    style_train_concurrency: int = 8
 
     class Config:
         env_file = ".env"
@@ -145,6 +156,33 @@ class SupabaseClient:
             return None
         return r.content
 
+    def storage_download_range(self, bucket: str, path: str, start: int, end: int) -> Optional[bytes]:
+        """Download bytes [start, end] (inclusive) of an object via an HTTP Range request.
+
+        Servers that ignore Range reply 200 with the whole object, which is still a valid result.
+        """
+        url = self._storage_url(f"/object/{bucket}/{path}")
+        headers = {
+            "apikey": self.api_key,
+            "Authorization": f"Bearer {self.api_key}",
+            "Range": f"bytes={start}-{end}",
+        }
+        r = httpx.get(url, headers=headers, timeout=30, follow_redirects=True)
+        if r.status_code == 416:
+            return b""
+        if r.status_code not in (200, 206):
+            return None
+        return r.content
+
+    def storage_etag(self, bucket: str, path: str) -> Optional[str]:
+        """ETag of a stored object from a HEAD request (changes whenever the object is replaced)."""
+        url = self._storage_url(f"/object/{bucket}/{path}")
+        headers = {"apikey": self.api_key, "Authorization": f"Bearer {self.api_key}"}
+        r = httpx.head(url, headers=headers, timeout=30, follow_redirects=True)
+        if r.status_code != 200:
+            return None
+        return r.headers.get("etag")
+
     def storage_upload(self, bucket: str, path: str, data: bytes, content_type: str = "image/jpeg") -> bool:
         url = self._storage_url(f"/object/{bucket}/{path}")
         headers = {
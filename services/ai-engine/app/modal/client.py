@@ -94,13 +94,21 @@ class ModalClient:
         style_profile_id: str,
         pairs: list[dict],
         epochs: int = 200,
+        patience: int = 20,
+        min_delta: float = 1e-4,
+        time_budget_s: float = 1200,
     ) -> dict:
         """Train a 3D LUT style model.
 
+        Stops early once the held-out loss hasn't improved by min_delta for
+        `patience` epochs, or when time_budget_s runs out; `epochs` is the cap.
+
         Args:
             pairs: [{"original_key": "...", "edited_key": "..."}, ...]
         Returns:
-            {"status": "success", "model_key": "...", "model_filename": "..."}
+            {"status": "success", "model_key": "...", "model_filename": "...",
+             "epochs_run": N, "best_epoch": N, "stopped": "converged" | "time_budget" | "max_epochs",
+             "loss_curve": {"train": [...], "val": [...]}, ...}
         """
         url = self._endpoint_url("train_style")
         body = {
@@ -109,12 +117,17 @@ class ModalClient:
             "style_profile_id": style_profile_id,
             "pairs": pairs,
             "epochs": epochs,
+            "patience": patience,
+            "min_delta": min_delta,
+            "time_budget_s": time_budget_s,
         }
         try:
-            logger.info(f"Training style: {len(pairs)} pairs, {epochs} epochs")
+            logger.info(f"Training style: {len(pairs)} pairs, up to {epochs} epochs")
             resp = await self._client.post(url, json=body, timeout=1800)
             result = resp.json()
-            logger.info(f"Training complete: {result.get('training_time_s', '?')}s")
+            logger.info(f"Training complete: {result.get('training_time_s', '?')}s, "
+                        f"{result.get('epochs_run', '?')}/{epochs} epochs "
+                        f"(best {result.get('best_epoch', '?')}, {result.get('stopped', '?')})")
             return result
         except Exception as e:
             logger.error(f"Style training failed: {e}")
@@ -169,6 +182,44 @@ class ModalClient:
             logger.error(f"Batch style failed: {e}")
             return {"status": "error", "message": str(e)}
 
+    async def predict_luts(
+        self,
+        proxies: list[dict],
+        model_filename: str,
+        lut_dtype: str = "float16",
+    ) -> dict:
+        """Predict per-image style LUTs from 256×256 proxies (no full-res I/O on Modal).
+
+        Args:
+            proxies: [{"id": "...", "image": "<base64 PNG>"}, ...]
+        Returns:
+            {"status": "success", "lut_dim": 33, "lut_dtype": "float16",
+             "luts": [{"id": "...", "status": "success", "lut": "<base64>"}, ...]}
+        """
+        url = self._endpoint_url("predict_luts")
+        body = {
+            "proxies": proxies,
+            "model_filename": model_filename,
+            "lut_dtype": lut_dtype,
+        }
+        try:
+            logger.info(f"Predicting LUTs: {len(proxies)} proxies")
+            resp = await self._client.post(url, json=body)
+            return resp.json()
+        except Exception as e:
+            logger.error(f"LUT prediction failed: {e}")
+            return {"status": "error", "message": str(e)}
+
+    async def style_metrics(self) -> dict:
+        """Model cache metrics (hits, loads, evictions) of a warm style container."""
+        try:
+            url = self._endpoint_url("style_metrics")
+            resp = await self._client.get(url, timeout=30)
+            return resp.json()
+        except Exception as e:
+            logger.warning(f"Style metrics failed: {e}")
+            return {"status": "error", "message": str(e)}
+
     # ─── Phase 2: Face Retouching ─────────────────────────────────────
 
     async def face_retouch(
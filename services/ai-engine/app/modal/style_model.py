@@ -0,0 +1,500 @@
+"""
+Phase 1 style model — the torch side of the Modal style endpoints.
+
+The 3D LUT predictor network, LUT application, the training loop and the
+batched inference pipeline, shared by modal_app.py (which adds it to the
+container images) and the tests. Nothing here imports modal, and torch is
+imported inside the functions that need it, so the module loads without
+either.
+"""
+
+import io
+
+
+def open_image_bytes(img_bytes: bytes) -> "Image.Image":
+    """Open image bytes as PIL RGB Image, with rawpy fallback for DNG/RAW files."""
+    from PIL import Image
+    try:
+        return Image.open(io.BytesIO(img_bytes)).convert("RGB")
+    except Exception:
+        pass
+    # Fallback: rawpy for camera RAW formats
+    import rawpy, tempfile, os
+    with tempfile.NamedTemporaryFile(suffix='.dng', delete=False) as f:
+        f.write(img_bytes)
+        tmp_path = f.name
+    try:
+        with rawpy.imread(tmp_path) as raw:
+            rgb = raw.postprocess(use_camera_wb=True, no_auto_bright=False, output_bps=8)
+            return Image.fromarray(rgb)
+    finally:
+        os.unlink(tmp_path)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# LUT MODEL
+# ═══════════════════════════════════════════════════════════════════════════
+
+# ---------------------------------------------------------------------------
+# 3D LUT Network Architecture
+# Lightweight CNN → predicts a 33×33×33 3D colour LUT
+# Based on Zeng et al. 2020 "Learning Image-Adaptive 3D Lookup Tables"
+# <600K params, resolution-independent, <2s inference on A10G
+# ---------------------------------------------------------------------------
+
+LUT_DIM = 33  # 33×33×33 = 35,937 points × 3 channels
+
+
+def _build_lut_model():
+    """Build the 3D LUT predictor network."""
+    import torch
+    import torch.nn as nn
+
+    class LUTGenerator(nn.Module):
+        """Predicts a 3D LUT from a downsampled input image."""
+        def __init__(self, lut_dim=LUT_DIM):
+            super().__init__()
+            self.lut_dim = lut_dim
+
+            # Backbone: 5 conv blocks, input 256×256×3
+            self.backbone = nn.Sequential(
+                nn.Conv2d(3, 32, 3, stride=2, padding=1), nn.ReLU(inplace=True),   # 128
+                nn.Conv2d(32, 64, 3, stride=2, padding=1), nn.ReLU(inplace=True),  # 64
+                nn.Conv2d(64, 128, 3, stride=2, padding=1), nn.ReLU(inplace=True), # 32
+                nn.Conv2d(128, 128, 3, stride=2, padding=1), nn.ReLU(inplace=True),# 16
+                nn.Conv2d(128, 128, 3, stride=2, padding=1), nn.ReLU(inplace=True),# 8
+                nn.AdaptiveAvgPool2d(1),  # → 128×1×1
+            )
+
+            # Head: predict LUT values
+            n_out = lut_dim * lut_dim * lut_dim * 3
+            self.head = nn.Sequential(
+                nn.Linear(128, 256), nn.ReLU(inplace=True),
+                nn.Linear(256, n_out),
+            )
+
+            # Initialize LUT to identity (no-op transform)
+            self._init_identity_lut()
+
+        def _init_identity_lut(self):
+            """Set final bias to identity LUT so untrained model = no change."""
+            import torch
+            with torch.no_grad():
+                identity = torch.zeros(self.lut_dim, self.lut_dim, self.lut_dim, 3)
+                coords = torch.linspace(0, 1, self.lut_dim)
+                for r_i, r in enumerate(coords):
+                    for g_i, g in enumerate(coords):
+                        for b_i, b in enumerate(coords):
+                            identity[r_i, g_i, b_i] = torch.tensor([r, g, b])
+                self.head[-1].bias.data = identity.reshape(-1)
+                nn.init.zeros_(self.head[-1].weight)
+
+        def forward(self, x):
+            feat = self.backbone(x).squeeze(-1).squeeze(-1)  # B×128
+            lut_flat = self.head(feat)  # B × (D³×3)
+            lut = lut_flat.reshape(-1, self.lut_dim, self.lut_dim, self.lut_dim, 3)
+            return lut
+
+    return LUTGenerator()
+
+
+LUT_APPLY_BAND_PIXELS = 1 << 22  # ~4 MP per band: ~50 MB of float32 grid + output
+
+
+def _apply_lut(image_tensor, lut):
+    """Apply 3D LUT to image using trilinear interpolation.
+    image_tensor: (H, W, 3) float32 [0,1]
+    lut: (D, D, D, 3) float32
+    Returns: (H, W, 3) float32 [0,1]
+
+    One trilinear grid_sample over the LUT volume (differentiable w.r.t.
+    the LUT, so training uses it too). Temporaries are one grid and one
+    output the size of the image, instead of eight gathered corner tensors.
+    """
+    import torch.nn.functional as F
+
+    # Volume axes (D, H, W) = (r, g, b); grid_sample's (x, y, z) index (W, H, D) → (b, g, r)
+    volume = lut.permute(3, 0, 1, 2).unsqueeze(0)                # 1×3×D×D×D
+    grid = (image_tensor.flip(-1) * 2 - 1)[None, None]          # 1×1×H×W×3 in [-1, 1]
+    out = F.grid_sample(volume, grid, mode="bilinear", padding_mode="border", align_corners=True)
+    return out[0, :, 0].permute(1, 2, 0).clamp(0, 1)
+
+
+def _apply_lut_u8(image_u8, lut, band_pixels: int = LUT_APPLY_BAND_PIXELS):
+    """
+    Inference-only _apply_lut on a (H, W, 3) uint8 RGB tensor → uint8 tensor.
+
+    Works in row bands of about band_pixels, so peak memory is the uint8
+    input and output plus one band's float workspace, whatever the image
+    size. Runs on CPU or GPU.
+    """
+    import torch
+
+    H, W, _ = image_u8.shape
+    out = torch.empty_like(image_u8)
+    rows = max(1, band_pixels // max(1, W))
+    with torch.no_grad():
+        for y0 in range(0, H, rows):
+            band = image_u8[y0:y0 + rows].to(lut.dtype) / 255.0
+            # Same float32 scale + truncation as (result * 255).astype(uint8)
+            out[y0:y0 + rows] = (_apply_lut(band, lut) * 255).to(torch.uint8)
+    return out
+
+
+def _apply_lut_reference(image_tensor, lut):
+    """Original 8-corner gather implementation of _apply_lut, kept as the test reference
+    (tests/test_style_model.py).
+    image_tensor: (H, W, 3) float32 [0,1]
+    lut: (D, D, D, 3) float32
+    Returns: (H, W, 3) float32 [0,1]
+    """
+    import torch
+    import torch.nn.functional as F
+
+    H, W, _ = image_tensor.shape
+    D = lut.shape[0]
+
+    # Scale pixel values to LUT coordinates
+    img = image_tensor.clone() * (D - 1)
+    r, g, b = img[..., 0], img[..., 1], img[..., 2]
+
+    # Floor and ceil indices
+    r0, g0, b0 = r.long().clamp(0, D-2), g.long().clamp(0, D-2), b.long().clamp(0, D-2)
+    r1, g1, b1 = r0 + 1, g0 + 1, b0 + 1
+
+    # Fractional parts
+    fr, fg, fb = r - r0.float(), g - g0.float(), b - b0.float()
+
+    # Trilinear interpolation (8 corners)
+    def lookup(ri, gi, bi):
+        return lut[ri, gi, bi]
+
+    c000 = lookup(r0, g0, b0)
+    c001 = lookup(r0, g0, b1)
+    c010 = lookup(r0, g1, b0)
+    c011 = lookup(r0, g1, b1)
+    c100 = lookup(r1, g0, b0)
+    c101 = lookup(r1, g0, b1)
+    c110 = lookup(r1, g1, b0)
+    c111 = lookup(r1, g1, b1)
+
+    fr = fr.unsqueeze(-1)
+    fg = fg.unsqueeze(-1)
+    fb = fb.unsqueeze(-1)
+
+    c00 = c000 * (1 - fr) + c100 * fr
+    c01 = c001 * (1 - fr) + c101 * fr
+    c10 = c010 * (1 - fr) + c110 * fr
+    c11 = c011 * (1 - fr) + c111 * fr
+
+    c0 = c00 * (1 - fg) + c10 * fg
+    c1 = c01 * (1 - fg) + c11 * fg
+
+    result = c0 * (1 - fb) + c1 * fb
+    return result.clamp(0, 1)
+
+
+# ---------------------------------------------------------------------------
+# TRAINING LOOP
+# ---------------------------------------------------------------------------
+TRAIN_SIZE = 256                             # training images are resized to TRAIN_SIZE²
+TRAIN_PATIENCE = 20          # epochs without improvement before stopping
+TRAIN_MIN_DELTA = 1e-4       # smallest monitored-loss drop that counts as improvement
+TRAIN_TIME_BUDGET_S = 1200   # training-loop budget, inside the 1800 s function timeout
+TRAIN_BATCH_SIZE = 8         # pairs per optimiser step (GPU memory is bounded by this, not pair count)
+TRAIN_LOADER_WORKERS = 2     # DataLoader worker processes preparing the next batches (GPU only)
+
+
+class _PairDataset:
+    """
+    Map-style dataset over training pairs held as TRAIN_SIZE² uint8 arrays.
+
+    Pairs stay on the host in uint8 (~200 KB each); tensors are built per
+    item, so only the batches in flight ever reach the device. Duck-typed
+    rather than a torch Dataset subclass so this module imports without torch.
+    """
+
+    def __init__(self, originals: list, editeds: list):
+        self.originals = originals
+        self.editeds = editeds
+
+    def __len__(self) -> int:
+        return len(self.originals)
+
+    def __getitem__(self, i: int):
+        return _training_tensor(self.originals[i]), _training_tensor(self.editeds[i])
+
+
+def _pair_loader(dataset, device, batch_size: int, shuffle: bool):
+    """DataLoader with pinned-memory prefetch on CUDA; plain in-process loading on CPU."""
+    from torch.utils.data import DataLoader
+
+    cuda = device.type == "cuda"
+    workers = TRAIN_LOADER_WORKERS if cuda else 0
+    return DataLoader(
+        dataset,
+        batch_size=max(1, min(batch_size, len(dataset))),
+        shuffle=shuffle,
+        pin_memory=cuda,
+        num_workers=workers,
+        persistent_workers=workers > 0,
+        prefetch_factor=2 if workers else None,
+    )
+
+
+def _lut_losses(model, x, y):
+    """Predicted LUTs and the mean L1 of each LUT-styled image against its edit."""
+    luts = model(x)  # B × D × D × D × 3
+    losses = []
+    for j in range(len(x)):
+        # x is B×3×H×W, _apply_lut needs H×W×3
+        img_out = _apply_lut(x[j].permute(1, 2, 0), luts[j])
+        losses.append((img_out - y[j].permute(1, 2, 0)).abs().mean())
+    return luts, losses
+
+
+def _validation_loss(model, loader, device) -> float:
+    """Mean L1 between LUT-styled held-out originals and their edits."""
+    import torch
+
+    model.eval()
+    losses = []
+    with torch.no_grad():
+        for x, y in loader:
+            _, batch_losses = _lut_losses(model, x.to(device, non_blocking=True), y.to(device, non_blocking=True))
+            losses += [loss.item() for loss in batch_losses]
+    return sum(losses) / len(losses)
+
+
+def _train_lut_model(train_ds, val_ds, device, epochs: int, patience: int = TRAIN_PATIENCE,
+                     min_delta: float = TRAIN_MIN_DELTA, time_budget_s: float = TRAIN_TIME_BUDGET_S,
+                     batch_size: int = TRAIN_BATCH_SIZE, log_every: int = 20):
+    """
+    Mini-batch LUT model training with early stopping → (model, info).
+
+    Batches stream from the datasets through _pair_loader, so device memory
+    holds the model plus a few batches whatever the number of pairs. The
+    monitored loss is the validation loss when val_ds is given, else the
+    epoch's mean train loss; the best epoch's weights are returned. Runs on
+    any torch device (the tests use the CPU).
+    """
+    import time
+    import torch
+    import torch.optim as optim
+
+    model = _build_lut_model().to(device)
+    optimizer = optim.Adam(model.parameters(), lr=1e-4)
+    loader = _pair_loader(train_ds, device, batch_size, shuffle=True)
+    val_loader = _pair_loader(val_ds, device, batch_size, shuffle=False) if val_ds else None
+
+    # Optional: perceptual loss using VGG features
+    # Keeping it simple with L1 + colour histogram loss for now
+    # VGG adds ~500MB model download on first run
+
+    train_curve, val_curve = [], []
+    best_loss = float("inf")
+    best_epoch = 0
+    best_state = None
+    stopped = "max_epochs"
+    t0 = time.time()
+    for epoch in range(epochs):
+        model.train()
+        total_loss = 0
+        n_batches = 0
+
+        for x_batch, y_batch in loader:
+            x_batch = x_batch.to(device, non_blocking=True)
+            y_batch = y_batch.to(device, non_blocking=True)
+
+            lut, losses = _lut_losses(model, x_batch, y_batch)
+            loss = torch.stack(losses).mean()
+
+            # Smoothness regularization on LUT
+            lut_mean = lut.mean(dim=0)  # D×D×D×3
+            smooth_loss = (
+                (lut_mean[1:, :, :, :] - lut_mean[:-1, :, :, :]).pow(2).mean() +
+                (lut_mean[:, 1:, :, :] - lut_mean[:, :-1, :, :]).pow(2).mean() +
+                (lut_mean[:, :, 1:, :] - lut_mean[:, :, :-1, :]).pow(2).mean()
+            )
+            total = loss + 0.001 * smooth_loss
+
+            optimizer.zero_grad()
+            total.backward()
+            optimizer.step()
+            total_loss += loss.item()
+            n_batches += 1
+
+        avg_loss = total_loss / max(1, n_batches)
+        train_curve.append(round(avg_loss, 6))
+        monitored = avg_loss
+        if val_loader is not None:
+            monitored = _validation_loss(model, val_loader, device)
+            val_curve.append(round(monitored, 6))
+        if log_every and (epoch + 1) % log_every == 0:
+            print(f"  Epoch {epoch+1}/{epochs}, loss={avg_loss:.6f}"
+                  + (f", val={monitored:.6f}" if val_loader is not None else ""))
+
+        if monitored < best_loss - min_delta:
+            best_loss = monitored
+            best_epoch = epoch + 1
+            best_state = {k: v.detach().clone() for k, v in model.state_dict().items()}
+        elif epoch + 1 - best_epoch >= patience:
+            stopped = "converged"
+            break
+        if time.time() - t0 > time_budget_s:
+            stopped = "time_budget"
+            break
+
+    # Keep the weights from the best epoch
+    if best_state is not None:
+        model.load_state_dict(best_state)
+    model.eval()
+    return model, {
+        "final_loss": round(best_loss, 6),
+        "epochs_run": len(train_curve),
+        "epochs_max": epochs,
+        "best_epoch": best_epoch,
+        "stopped": stopped,
+        "loss_curve": {"train": train_curve, "val": val_curve},
+    }
+
+
+def _training_tensor(arr):
+    """TRAIN_SIZE² RGB uint8 array → 3×H×W float tensor in 0..1 (= ToTensor)."""
+    import torch
+    return torch.from_numpy(arr.copy()).permute(2, 0, 1).float().div(255.0)
+
+
+# ---------------------------------------------------------------------------
+# STYLE INFERENCE HELPERS
+# ---------------------------------------------------------------------------
+STYLE_BATCH_IO_WORKERS = 8   # concurrent downloads + decodes
+STYLE_UPLOAD_WORKERS = 4     # concurrent encodes + uploads (own pool, so they never queue behind downloads)
+STYLE_FORWARD_BATCH = 16     # proxies per model forward pass
+
+
+def _render_lut(img, lut, device):
+    """Apply a predicted LUT to a full-resolution PIL image → (H, W, 3) uint8 RGB."""
+    import torch
+    import numpy as np
+
+    img_tensor = torch.from_numpy(np.array(img, dtype=np.uint8)).to(device)
+    return _apply_lut_u8(img_tensor, lut).cpu().numpy()
+
+
+def _encode_jpeg(rgb, quality: int) -> bytes:
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.fromarray(rgb).save(buf, format="JPEG", quality=quality, subsampling=0)
+    return buf.getvalue()
+
+
+def _style_batch_sequential(items: list[dict], model, device, fetch, store, quality: int) -> list[dict]:
+    """The original per-image loop: download, single forward, apply, encode, upload."""
+    import torch
+    from torchvision import transforms
+
+    transform = transforms.Compose([transforms.Resize((256, 256)), transforms.ToTensor()])
+    results = []
+    for item in items:
+        try:
+            img = open_image_bytes(fetch(item["image_key"]))
+            img_small = transform(img).unsqueeze(0).to(device)
+            with torch.no_grad():
+                lut = model(img_small)[0]
+            store(item["output_key"], _encode_jpeg(_render_lut(img, lut, device), quality))
+            results.append({"image_key": item["image_key"], "status": "success"})
+        except Exception as e:
+            results.append({"image_key": item["image_key"], "status": "error", "error": str(e)})
+    return results
+
+
+def _style_batch_pipelined(items: list[dict], model, device, fetch, store, quality: int,
+                           io_workers: int = STYLE_BATCH_IO_WORKERS,
+                           upload_workers: int = STYLE_UPLOAD_WORKERS,
+                           forward_batch: int = STYLE_FORWARD_BATCH,
+                           prefetch: int = 0) -> list[dict]:
+    """
+    Batched style pipeline, same output as _style_batch_sequential:
+      1. downloads + decodes run on a thread pool, at most `prefetch`
+         images (default 2 × forward_batch) ahead of the model
+      2. proxies go through the model forward_batch at a time
+      3. LUTs are applied on the device while a separate pool encodes and
+         uploads the previous results; at most `prefetch` rendered images
+         wait for it
+
+    Host memory is bounded by the window, not the batch size. fetch(key) →
+    bytes and store(key, bytes) do the I/O, so this also runs on CPU
+    against in-memory storage (see tests/test_style_model.py).
+    """
+    import torch
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+    from torchvision import transforms
+
+    transform = transforms.Compose([transforms.Resize((256, 256)), transforms.ToTensor()])
+    results: list = [None] * len(items)
+    window = max(forward_batch, prefetch or 2 * forward_batch)
+
+    def error(i: int, e: Exception) -> dict:
+        return {"image_key": items[i]["image_key"], "status": "error", "error": str(e)}
+
+    def load(i: int):
+        return open_image_bytes(fetch(items[i]["image_key"]))
+
+    def encode_and_store(i: int, rgb):
+        store(items[i]["output_key"], _encode_jpeg(rgb, quality))
+
+    def finish_upload(i: int, fut):
+        try:
+            fut.result()
+            results[i] = {"image_key": items[i]["image_key"], "status": "success"}
+        except Exception as e:
+            results[i] = error(i, e)
+
+    with ThreadPoolExecutor(max_workers=io_workers) as load_pool, \
+            ThreadPoolExecutor(max_workers=upload_workers) as upload_pool:
+        loads = {}
+        next_load = 0
+        uploads = deque()
+
+        for start in range(0, len(items), forward_batch):
+            # Keep the download window full, but never more than `window` ahead
+            while next_load < min(len(items), start + window):
+                loads[next_load] = load_pool.submit(load, next_load)
+                next_load += 1
+
+            images = {}
+            for i in range(start, min(start + forward_batch, len(items))):
+                try:
+                    images[i] = loads.pop(i).result()
+                except Exception as e:
+                    results[i] = error(i, e)
+            if not images:
+                continue
+
+            idx = list(images)
+            try:
+                batch = torch.stack([transform(images[i]) for i in idx]).to(device)
+                with torch.no_grad():
+                    luts = model(batch)
+            except Exception as e:
+                for i in idx:
+                    results[i] = error(i, e)
+                continue
+
+            for k, i in enumerate(idx):
+                try:
+                    rgb = _render_lut(images.pop(i), luts[k], device)
+                except Exception as e:
+                    results[i] = error(i, e)
+                    continue
+                # Back-pressure: rendered images waiting for upload are host memory too
+                while len(uploads) >= window:
+                    finish_upload(*uploads.popleft())
+                uploads.append((i, upload_pool.submit(encode_and_store, i, rgb)))
+
+        while uploads:
+            finish_upload(*uploads.popleft())
+
+    return results
@@ -0,0 +1,181 @@
+"""
+.cube 3D LUTs — export style profiles, import photographers' own LUTs.
+
+Format (Adobe / Resolve): optional TITLE, LUT_3D_SIZE N, optional
+DOMAIN_MIN / DOMAIN_MAX, then N³ lines of "R G B" in 0..1 with red varying
+fastest. Lattice points sit at k * 255 / (N - 1) in 8-bit terms.
+
+Internally a LUT is a (N, N, N, 3) float32 array indexed [b, g, r] holding
+BGR values in 0..255 — the same layout as preset_compiler, so
+apply_lut3d() applies either kind.
+
+Exported LUTs sample the same transform the restyle endpoint renders:
+reference-style transfer (REFERENCE_INTENSITY) followed by the preset's
+colour ops (PRESET_OVER_REFERENCE_INTENSITY), or the preset alone
+(PRESET_INTENSITY). Reference transfer adapts to each photo's own
+histogram; for export it is fitted once on an anchor photo (or on the
+lattice itself when none is given). Spatial ops (clarity, sharpening,
+vignette, grain, skin-mask feathering) can't be expressed in a LUT and are
+left out.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from app.pipeline.phase1_style import (
+    PRESET_INTENSITY, PRESET_OVER_REFERENCE_INTENSITY, REFERENCE_INTENSITY, _reference_pass,
+)
+from app.pipeline.preset_compiler import COLOUR_STEPS, apply_lut3d, run_colour_steps
+from app.pipeline.tiling import run_in_strips
+
+log = logging.getLogger(__name__)
+
+CUBE_SIZE = 33
+MAX_CUBE_SIZE = 129
+LUT_CACHE_SIZE = 8
+
+
+def cube_step(size: int) -> float:
+    """Spacing between .cube lattice points, in 8-bit levels."""
+    return 255.0 / (size - 1)
+
+
+# ── Parse / format ───────────────────────────────────────────
+
+def parse_cube(text: str) -> dict:
+    """
+    Parse .cube text → {"lut": (N, N, N, 3) float32 BGR 0..255, "size": N, "title": str}.
+    Raises ValueError for malformed files, 1D LUTs and non-unit domains.
+    """
+    title = ""
+    size = None
+    rows = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        head = line.split(None, 1)[0].upper()
+        if head == "TITLE":
+            title = line[5:].strip().strip('"')
+        elif head == "LUT_3D_SIZE":
+            size = int(line.split()[1])
+        elif head == "LUT_1D_SIZE":
+            raise ValueError("1D LUTs are not supported")
+        elif head in ("DOMAIN_MIN", "DOMAIN_MAX"):
+            vals = [float(v) for v in line.split()[1:4]]
+            if vals != ([0.0] * 3 if head == "DOMAIN_MIN" else [1.0] * 3):
+                raise ValueError(f"Unsupported {head} {vals}")
+        elif head[0].isdigit() or head[0] in "-.":
+            rows.append(line.split()[:3])
+        # Other keywords (LUT_3D_INPUT_RANGE, vendor extensions) are ignored
+
+    if not size or not 2 <= size <= MAX_CUBE_SIZE:
+        raise ValueError(f"Missing or invalid LUT_3D_SIZE ({size})")
+    if len(rows) != size ** 3:
+        raise ValueError(f"Expected {size ** 3} entries for size {size}, got {len(rows)}")
+
+    rgb = np.array(rows, dtype=np.float32).reshape(size, size, size, 3)  # [b][g][r] = R, G, B
+    lut = np.ascontiguousarray(np.clip(rgb[..., ::-1], 0.0, 1.0) * 255.0, dtype=np.float32)
+    return {"lut": lut, "size": size, "title": title}
+
+
+def format_cube(lut: np.ndarray, title: str = "") -> str:
+    """(N, N, N, 3) BGR 0..255 LUT → .cube text."""
+    size = lut.shape[0]
+    rgb = np.clip(lut.reshape(-1, 3)[:, ::-1] / 255.0, 0.0, 1.0)
+    lines = []
+    if title:
+        lines.append(f'TITLE "{title}"')
+    lines += [
+        f"LUT_3D_SIZE {size}",
+        "DOMAIN_MIN 0.0 0.0 0.0",
+        "DOMAIN_MAX 1.0 1.0 1.0",
+    ]
+    lines += [f"{r:.6f} {g:.6f} {b:.6f}" for r, g, b in rgb]
+    return "\n".join(lines) + "\n"
+
+
+# ── Export ───────────────────────────────────────────────────
+
+def cube_lattice(size: int) -> np.ndarray:
+    """The .cube sample points as a (size², size, 3) uint8 BGR image, [b, g, r] order."""
+    levels = np.round(np.arange(size) * cube_step(size)).astype(np.uint8)
+    b, g, r = np.meshgrid(levels, levels, levels, indexing="ij")
+    return np.stack([b, g, r], axis=-1).reshape(size * size, size, 3)
+
+
+def sample_style_lut(settings: dict, size: int = CUBE_SIZE,
+                     anchor: Optional[np.ndarray] = None) -> np.ndarray:
+    """Sample a style profile's colour transform at the .cube lattice → (N, N, N, 3) float32."""
+    grid = cube_lattice(size)
+    result = grid
+
+    if settings.get("lut"):
+        lut = load_cube_lut(settings["lut"]["key"])
+        if lut is None:
+            raise ValueError(f"Could not load LUT {settings['lut'].get('key')}")
+        result = apply_cube_lut(grid, lut)
+
+    ref = settings.get("reference")
+    if ref:
+        _, plan = _reference_pass(anchor if anchor is not None else grid, ref, REFERENCE_INTENSITY)
+        result, _ = _reference_pass(result, ref, REFERENCE_INTENSITY, plan=plan, skin_blur=False)
+
+    preset = settings.get("preset")
+    if preset:
+        intensity = PRESET_OVER_REFERENCE_INTENSITY if ref else PRESET_INTENSITY
+        result = run_colour_steps(result.astype(np.float32), COLOUR_STEPS, preset, intensity)
+
+    return np.clip(result, 0, 255).astype(np.float32).reshape(size, size, size, 3)
+
+
+def export_style_cube(settings: dict, title: str = "", size: int = CUBE_SIZE,
+                      anchor: Optional[np.ndarray] = None) -> str:
+    return format_cube(sample_style_lut(settings, size, anchor), title)
+
+
+# ── Import / apply ───────────────────────────────────────────
+
+_lut_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_lut_lock = threading.Lock()
+
+
+def load_cube_lut(storage_key: str) -> Optional[np.ndarray]:
+    """Download and parse a stored .cube file (per-worker LRU)."""
+    from app.storage.supabase_storage import download_photo
+
+    with _lut_lock:
+        lut = _lut_cache.get(storage_key)
+        if lut is not None:
+            _lut_cache.move_to_end(storage_key)
+            return lut
+
+    data = download_photo(storage_key)
+    if not data:
+        return None
+    try:
+        lut = parse_cube(data.decode("utf-8", errors="replace"))["lut"]
+    except ValueError as e:
+        log.error(f"Invalid .cube file {storage_key}: {e}")
+        return None
+    lut.setflags(write=False)
+
+    with _lut_lock:
+        _lut_cache[storage_key] = lut
+        while len(_lut_cache) > LUT_CACHE_SIZE:
+            _lut_cache.popitem(last=False)
+    return lut
+
+
+def apply_cube_lut(img: np.ndarray, lut: np.ndarray) -> np.ndarray:
+    """Apply a .cube-lattice LUT to a BGR uint8 image in one interpolation pass."""
+    step = cube_step(lut.shape[0])
+
+    def run(strip: np.ndarray, y0: int) -> np.ndarray:
+        # Round rather than truncate: .cube values are exact colours, not engine intermediates
+        return np.clip(apply_lut3d(strip, lut, step=step) + 0.5, 0, 255).astype(np.uint8)
+
+    return run_in_strips(img, run, halo=0)
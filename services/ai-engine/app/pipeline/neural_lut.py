@@ -0,0 +1,87 @@
+"""
+Neural 3D LUT application on CPU.
+
+The Modal style model (style_model._build_lut_model) predicts a LUT from a
+256×256 thumbnail; applying it to the full-resolution frame is plain
+trilinear interpolation and doesn't need the GPU. This module applies a
+predicted LUT here so styling keeps working when Modal is cold or down, and
+so the GPU only has to run inference on small proxies.
+
+Model LUTs are (D, D, D, 3) float arrays indexed [r, g, b] holding RGB in
+0..1, sampled at k / (D - 1). That is the .cube lattice, so we convert to the
+engine's [b, g, r] / BGR 0..255 layout and reuse apply_lut3d (cv2.remap over
+slice atlases, row bands, strip-parallel via run_in_strips).
+
+LUTs come from modal_app.predict_luts, which runs the model on the 256×256
+proxies Phase 0 already builds and returns only the D³×3 tables, so the
+full-resolution frame never leaves the CPU worker.
+
+Matches style_model._apply_lut to within remap's 1/32 sub-pixel rounding of
+the lattice coordinate — at most one 8-bit level, with the same clamp to
+[0, 1] and truncation to uint8.
+"""
+import base64
+import logging
+
+import cv2
+import numpy as np
+
+from app.pipeline.preset_compiler import apply_lut3d
+from app.pipeline.tiling import run_in_strips
+
+log = logging.getLogger(__name__)
+
+LUT_DIM = 33  # style_model.LUT_DIM
+
+
+def neural_lut_to_bgr(lut: np.ndarray) -> np.ndarray:
+    """(D, D, D, 3) [r, g, b] RGB 0..1 model LUT → [b, g, r] BGR 0..255 float32, read-only."""
+    lut = np.asarray(lut, dtype=np.float32)
+    if lut.ndim != 4 or lut.shape[3] != 3 or not lut.shape[0] == lut.shape[1] == lut.shape[2]:
+        raise ValueError(f"Expected a (D, D, D, 3) LUT, got {lut.shape}")
+    bgr = np.ascontiguousarray(lut.transpose(2, 1, 0, 3)[..., ::-1] * np.float32(255.0))
+    bgr.setflags(write=False)
+    return bgr
+
+
+def apply_neural_lut(img: np.ndarray, lut: np.ndarray, converted: bool = False) -> np.ndarray:
+    """
+    Apply a model-predicted LUT to a BGR uint8 image → BGR uint8.
+
+    `lut` is the model's (D, D, D, 3) output, or the result of
+    neural_lut_to_bgr() with converted=True when one LUT is reused.
+    """
+    bgr_lut = lut if converted else neural_lut_to_bgr(lut)
+    step = 255.0 / (bgr_lut.shape[0] - 1)
+
+    def run(strip: np.ndarray, y0: int) -> np.ndarray:
+        # Clamp then truncate, as the GPU path does
+        return np.clip(apply_lut3d(strip, bgr_lut, step=step), 0, 255).astype(np.uint8)
+
+    return run_in_strips(img, run, halo=0)
+
+
+# ── Proxy / LUT transport (modal_app.predict_luts) ───────────
+
+PROXY_SIZE = 256  # model input, = phase0_analysis.BATCH_PROXY_SIZE
+
+
+def make_style_proxy(img: np.ndarray) -> np.ndarray:
+    """BGR image → PROXY_SIZE² BGR proxy, as Phase 0 builds them."""
+    if img.shape[:2] == (PROXY_SIZE, PROXY_SIZE):
+        return img
+    return cv2.resize(img, (PROXY_SIZE, PROXY_SIZE), interpolation=cv2.INTER_AREA)
+
+
+def encode_proxy(proxy: np.ndarray) -> str:
+    """BGR proxy → base64 PNG (lossless, so the model sees exactly what we computed)."""
+    ok, buf = cv2.imencode(".png", proxy)
+    if not ok:
+        raise ValueError("Failed to encode style proxy")
+    return base64.b64encode(buf.tobytes()).decode("ascii")
+
+
+def decode_lut(payload: str, lut_dim: int = LUT_DIM, dtype: str = "float16") -> np.ndarray:
+    """base64 (D, D, D, 3) LUT from predict_luts → float32 model-layout LUT."""
+    raw = np.frombuffer(base64.b64decode(payload), dtype=np.dtype(dtype))
+    return raw.astype(np.float32).reshape(lut_dim, lut_dim, lut_dim, 3)
@@ -3,7 +3,7 @@ Apelier AI Processing Pipeline — Orchestrator (GPU-enabled)
 
 Runs all 6 phases for a gallery:
   Phase 0: Analysis        (CPU — Railway)
-  Phase 1: Style           (GPU — Modal)  <- falls back gracefully
+  Phase 1: Style           (GPU LUT prediction — Modal, applied on CPU)  <- falls back gracefully
   Phase 2: Face Retouch    (GPU — Modal)  <- skips if unavailable
   Phase 3: Scene Cleanup   (GPU — Modal)  <- skips if unavailable
   Phase 4: Composition     (CPU — Railway)
@@ -16,21 +16,29 @@ import asyncio
 import time
 import logging
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import cv2
 from typing import Optional
 
-from app.config import settings, supabase
-from app.pipeline.phase0_analysis import analyse_image, decode_raw, is_raw_file
+from app.config import PIPELINE_VERSION, settings, supabase
+from app.pipeline.phase0_analysis import (
+    analyse_images, analysis_row, decode_raw, detect_bursts, is_raw_file, parse_capture_time,
+    probe_metadata,
+)
+from app.pipeline.neural_lut import PROXY_SIZE, apply_neural_lut, decode_lut, encode_proxy, make_style_proxy
+from app.pipeline.phase1_style import load_image_proxy
 from app.pipeline.phase4_composition import fix_composition
 from app.pipeline.phase5_output import generate_outputs, get_output_keys
 from app.modal.client import ModalClient
+from app.storage.feature_store import FeatureStore
+from app.storage.style_cache import StyleProfileEntry, get_style_profile_cached
 
 logger = logging.getLogger("apelier.orchestrator")
 
 PHASES = ["analysis", "style", "retouch", "cleanup", "composition", "output"]
 
-PIPELINE_VERSION = "2.0"
+HEADER_PROBE_WORKERS = 8  # concurrent ranged header reads before Phase 0
 
 
 def _decode_image_bytes(img_bytes: bytes, filename: str = "") -> Optional[np.ndarray]:
@@ -52,6 +60,98 @@ def _decode_image_bytes(img_bytes: bytes, filename: str = "") -> Optional[np.nda
     return None
 
 
+def _probe_capture_times(photos: list[dict]) -> int:
+    """
+    Set each photo's `_capture_time` from a header-only ranged read of its
+    original, before any full download. Returns how many were found.
+    """
+    def probe(photo: dict) -> Optional[float]:
+        # A header that can't be read or parsed only costs this photo its
+        # early timestamp; Phase 0 still reads it from the full EXIF
+        try:
+            meta = probe_metadata(photo["original_key"]) if photo.get("original_key") else None
+        except Exception as e:
+            logger.warning(f"Header probe failed for photo {photo.get('id')}: {e}")
+            return None
+        return meta.get("capture_time") if meta else None
+
+    with ThreadPoolExecutor(max_workers=HEADER_PROBE_WORKERS) as pool:
+        times = list(pool.map(probe, photos))
+    for photo, t in zip(photos, times):
+        photo["_capture_time"] = t
+    return sum(t is not None for t in times)
+
+
+def _probe_etags(photos: list[dict], bucket: str):
+    """Set each photo's `_etag` from a HEAD request, so unchanged originals hit the feature store."""
+    def probe(photo: dict) -> Optional[str]:
+        # No ETag just means this photo is downloaded and hashed as before
+        try:
+            return supabase.storage_etag(bucket, photo["original_key"]) if photo.get("original_key") else None
+        except Exception as e:
+            logger.warning(f"ETag probe failed for photo {photo.get('id')}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=HEADER_PROBE_WORKERS) as pool:
+        etags = list(pool.map(probe, photos))
+    for photo, etag in zip(photos, etags):
+        photo["_etag"] = etag
+
+
+def _assign_burst_groups(photo_state: dict, burst_groups: dict[str, list[str]]):
+    """
+    Record this run's bursts in ai_edits. burst_group is cleared first, so a
+    photo that was in a burst on an earlier run but no longer is loses it.
+    """
+    for ps in photo_state.values():
+        ps["ai_edits"].pop("burst_group", None)
+    for group_id, member_ids in burst_groups.items():
+        if len(member_ids) < 2:
+            continue
+        for member_id in member_ids:
+            photo_state[member_id]["ai_edits"]["burst_group"] = group_id
+
+
+def _style_proxy_from_bytes(photo: dict, bucket: str) -> Optional[np.ndarray]:
+    """256×256 style proxy for a photo whose Phase 0 analysis came from the feature cache."""
+    img_bytes = photo.get("_img_bytes") or supabase.storage_download(bucket, photo["original_key"])
+    if not img_bytes:
+        return None
+    img = load_image_proxy(img_bytes, 2 * PROXY_SIZE, photo.get("filename", ""))
+    return make_style_proxy(img) if img is not None else None
+
+
+def _full_res_image(photo: dict, bucket: str) -> Optional[np.ndarray]:
+    """Full-resolution BGR frame for a photo: Phase 0's RAW decode, cached bytes, or a fresh download."""
+    img = photo.get("_processed_img")
+    if img is None:
+        img_bytes = photo.get("_img_bytes") or supabase.storage_download(bucket, photo["original_key"])
+        if not img_bytes:
+            return None
+        img = _decode_image_bytes(img_bytes, photo.get("filename", ""))
+    return img
+
+
+def _apply_neural_lut_cpu(photo: dict, lut: np.ndarray, bucket: str) -> Optional[bytes]:
+    """Decode a photo at full resolution, apply its predicted LUT, encode to JPEG."""
+    img = _full_res_image(photo, bucket)
+    if img is None:
+        return None
+    styled = apply_neural_lut(img, lut)
+    ok, buf = cv2.imencode(".jpg", styled, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    return buf.tobytes() if ok else None
+
+
+def _apply_style_profile_cpu(photo: dict, entry: StyleProfileEntry, bucket: str) -> Optional[bytes]:
+    """Decode a photo at full resolution, render the cached style profile on it, encode to JPEG."""
+    img = _full_res_image(photo, bucket)
+    if img is None:
+        return None
+    styled = entry.render(img)
+    ok, buf = cv2.imencode(".jpg", styled, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    return buf.tobytes() if ok else None
+
+
 async def run_pipeline(
     gallery_id: str,
     processing_job_id: str,
@@ -95,15 +195,20 @@ async def run_pipeline(
     # Get style profile info if set
     model_filename = None
     has_style = False
+    style_entry: Optional[StyleProfileEntry] = None
     if style_profile_id:
         try:
-            profile = supabase.select_single("style_profiles", filters={"id": style_profile_id})
+            style_entry = get_style_profile_cached(style_profile_id)
+            profile = style_entry.row if style_entry else None
             if profile:
                 mk = profile.get("model_key") or profile.get("model_weights_key")
                 if mk:
                     model_filename = mk.split("/")[-1]
                     has_style = True
                     logger.info(f"Using neural style model: {model_filename}")
+                elif style_entry.has_cpu_style:
+                    has_style = True
+                    logger.info("Style profile has no trained model — applying its LUT / preset on CPU")
                 else:
                     logger.info("Style profile has no trained model — style phase will be skipped")
         except Exception as e:
@@ -134,6 +239,7 @@ async def run_pipeline(
         }
 
     bucket = settings.storage_bucket
+    use_neural_style = use_gpu and bool(model_filename)
 
     try:
         # ═══════════════════════════════════════════════════════
@@ -141,165 +247,322 @@ async def run_pipeline(
         # ═══════════════════════════════════════════════════════
         await _update_phase(processing_job_id, "analysis", 0)
 
-        for i, photo in enumerate(photos):
-            try:
-                ps = photo_state[photo["id"]]
-                img_bytes = supabase.storage_download(bucket, photo["original_key"])
-                if not img_bytes:
-                    logger.warning(f"Could not download {photo['original_key']}, skipping")
+        # Capture times from ranged header reads (tens of KB per photo), so
+        # Phase 0 walks the gallery in shooting order: burst frames share an
+        # analysis chunk and burst grouping has its timestamps up front
+        timed = _probe_capture_times(photos)
+        photos.sort(key=lambda p: (p["_capture_time"] is None, p["_capture_time"] or 0.0))
+        logger.info(f"Phase 0: capture time from headers for {timed}/{total_photos} photos")
+
+        # Features from earlier runs of this gallery, keyed by content hash and
+        # reachable by (original_key, ETag), so unchanged originals aren't downloaded
+        feature_store = FeatureStore(f"{photographer_id}/{gallery_id}", PIPELINE_VERSION).load()
+        _probe_etags(photos, bucket)
+        reused = 0
+
+        # Analyse in chunks: one analyse_images() call decodes and scores a
+        # chunk in parallel, bounded by max_concurrent_images for memory
+        chunk_size = max(1, settings.max_concurrent_images)
+        for chunk_start in range(0, total_photos, chunk_size):
+            chunk = photos[chunk_start:chunk_start + chunk_size]
+            chunk_hashes = [feature_store.hash_for(p["original_key"], p["_etag"]) for p in chunk]
+            chunk_analysis = {}
+            for j, content_hash in enumerate(chunk_hashes):
+                cached = feature_store.get(content_hash) if content_hash else None
+                # RAW hits still need their bytes for the JPEG conversion below
+                if cached and cached.get("analysis") and not cached["analysis"].get("is_raw"):
+                    chunk_analysis[j] = {**cached["analysis"], "web_preview_bytes": None}
+                    reused += 1
+
+            chunk_bytes = []
+            for j, photo in enumerate(chunk):
+                if j in chunk_analysis:
+                    # Later phases download the original on demand
+                    chunk_bytes.append(None)
                     continue
-
-                filename = photo.get("filename", "")
-                analysis = analyse_image(img_bytes, filename=filename)
-
-                if analysis.get("error"):
-                    logger.warning(f"Phase 0 analysis error for {photo['id']}: {analysis['error']}")
-                    await _update_phase(processing_job_id, "analysis", i + 1)
+                try:
+                    chunk_bytes.append(supabase.storage_download(bucket, photo["original_key"]))
+                except Exception as e:
+                    logger.error(f"Phase 0 download failed for photo {photo['id']}: {e}")
+                    chunk_bytes.append(None)
+
+            for j, b in enumerate(chunk_bytes):
+                if not b:
                     continue
-
-                # Cast quality_score to int (DB column is INTEGER CHECK 0-100)
-                raw_quality = analysis.get("quality_score", 50)
-                quality_int = max(0, min(100, int(round(raw_quality))))
-
-                # Sanitise face_data
-                face_data = []
-                for face in (analysis.get("face_data") or []):
-                    face_data.append({
-                        "bbox": [int(v) for v in face.get("bbox", [0, 0, 0, 0])],
-                        "eyes_open": bool(face.get("eyes_open", True)),
-                    })
-
-                # Sanitise exif_data
-                import json as _json
-                exif_raw = analysis.get("exif_data") or {}
-                exif_clean = {}
-                for k, v in exif_raw.items():
-                    if isinstance(v, (str, int, float, bool, type(None))):
-                        exif_clean[k] = v
-                    else:
-                        try:
-                            _json.dumps(v)
+                chunk_hashes[j] = FeatureStore.content_hash(b)
+                feature_store.link(chunk[j]["original_key"], chunk[j]["_etag"], chunk_hashes[j])
+                cached = feature_store.get(chunk_hashes[j])
+                if cached and cached.get("analysis"):
+                    chunk_analysis[j] = {**cached["analysis"], "web_preview_bytes": None}
+                    reused += 1
+
+            to_analyse = [j for j, b in enumerate(chunk_bytes) if b and j not in chunk_analysis]
+            if to_analyse:
+                batch = analyse_images(
+                    [chunk_bytes[j] for j in to_analyse],
+                    filenames=[chunk[j].get("filename", "") for j in to_analyse],
+                    max_workers=chunk_size,
+                    return_proxies=use_neural_style,
+                )
+                for k, j in enumerate(to_analyse):
+                    chunk_analysis[j] = analysis_row(batch, k)
+                    if use_neural_style and not batch["error"][k]:
+                        # 256×256 model input for Phase 1's LUT prediction
+                        chunk[j]["_style_proxy"] = batch["proxies"][k]
+                    if not batch["error"][k]:
+                        feature_store.put(chunk_hashes[j], {
+                            "analysis": {key: v for key, v in chunk_analysis[j].items() if key != "web_preview_bytes"},
+                        })
+
+            for offset, photo in enumerate(chunk):
+                i = chunk_start + offset
+                try:
+                    ps = photo_state[photo["id"]]
+                    img_bytes = chunk_bytes[offset]
+                    if not img_bytes and offset not in chunk_analysis:
+                        logger.warning(f"Could not download {photo['original_key']}, skipping")
+                        continue
+
+                    filename = photo.get("filename", "")
+                    analysis = chunk_analysis[offset]
+
+                    if analysis.get("error"):
+                        logger.warning(f"Phase 0 analysis error for {photo['id']}: {analysis['error']}")
+                        await _update_phase(processing_job_id, "analysis", i + 1)
+                        continue
+
+                    # Cast quality_score to int (DB column is INTEGER CHECK 0-100)
+                    raw_quality = analysis.get("quality_score", 50)
+                    quality_int = max(0, min(100, int(round(raw_quality))))
+
+                    # Sanitise face_data
+                    face_data = []
+                    for face in (analysis.get("face_data") or []):
+                        face_data.append({
+                            "bbox": [int(v) for v in face.get("bbox", [0, 0, 0, 0])],
+                            "eyes_open": bool(face.get("eyes_open", True)),
+                        })
+
+                    # Sanitise exif_data
+                    import json as _json
+                    exif_raw = analysis.get("exif_data") or {}
+                    exif_clean = {}
+                    for k, v in exif_raw.items():
+                        if isinstance(v, (str, int, float, bool, type(None))):
                             exif_clean[k] = v
-                        except (TypeError, ValueError):
-                            exif_clean[k] = str(v)
-
-                photo_update = {
-                    "scene_type": analysis.get("scene_type"),
-                    "quality_score": quality_int,
-                    "face_data": face_data,
-                    "exif_data": exif_clean,
-                    "width": int(analysis.get("width", 0)) or None,
-                    "height": int(analysis.get("height", 0)) or None,
-                }
-
-                # ── RAW file handling: convert to JPEG once, use everywhere ──
-                if analysis.get("is_raw"):
-                    logger.info(f"RAW file detected: {filename} — converting to JPEG")
-                    # Decode full resolution (this is already done inside analyse_image
-                    # but we need the full BGR array for JPEG conversion)
-                    full_bgr = _decode_image_bytes(img_bytes, filename)
-                    if full_bgr is not None:
-                        keys = get_output_keys(photographer_id, gallery_id, filename)
-
-                        # Full-res JPEG (working copy for all subsequent phases)
-                        _, full_buf = cv2.imencode(".jpg", full_bgr, [cv2.IMWRITE_JPEG_QUALITY, 95])
-                        full_jpeg = full_buf.tobytes()
-                        supabase.storage_upload(bucket, keys["edited_key"], full_jpeg)
-                        photo_update["edited_key"] = keys["edited_key"]
-                        ps["edited_key"] = keys["edited_key"]
-                        logger.info(f"RAW→JPEG full-res: {keys['edited_key']} ({len(full_jpeg)/1024/1024:.1f}MB)")
-
-                        # Web preview (2048px max)
-                        h, w = full_bgr.shape[:2]
-                        if max(h, w) > 2048:
-                            scale = 2048 / max(h, w)
-                            web_img = cv2.resize(full_bgr, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
                         else:
-                            web_img = full_bgr
-                        _, web_buf = cv2.imencode(".jpg", web_img, [cv2.IMWRITE_JPEG_QUALITY, 92])
-                        web_jpeg = web_buf.tobytes()
-                        supabase.storage_upload(bucket, keys["web_key"], web_jpeg)
-                        photo_update["web_key"] = keys["web_key"]
-
-                        # Thumbnail (400px max)
-                        if max(h, w) > 400:
-                            scale_t = 400 / max(h, w)
-                            thumb_img = cv2.resize(full_bgr, (int(w * scale_t), int(h * scale_t)), interpolation=cv2.INTER_AREA)
+                            try:
+                                _json.dumps(v)
+                                exif_clean[k] = v
+                            except (TypeError, ValueError):
+                                exif_clean[k] = str(v)
+
+                    photo_update = {
+                        "scene_type": analysis.get("scene_type"),
+                        "quality_score": quality_int,
+                        "face_data": face_data,
+                        "exif_data": exif_clean,
+                        "width": int(analysis.get("width", 0)) or None,
+                        "height": int(analysis.get("height", 0)) or None,
+                    }
+
+                    # ── RAW file handling: convert to JPEG once, use everywhere ──
+                    if analysis.get("is_raw"):
+                        logger.info(f"RAW file detected: {filename} — converting to JPEG")
+                        # Decode full resolution (this is already done inside analyse_image
+                        # but we need the full BGR array for JPEG conversion)
+                        full_bgr = _decode_image_bytes(img_bytes, filename)
+                        if full_bgr is not None:
+                            keys = get_output_keys(photographer_id, gallery_id, filename)
+
+                            # Full-res JPEG (working copy for all subsequent phases)
+                            _, full_buf = cv2.imencode(".jpg", full_bgr, [cv2.IMWRITE_JPEG_QUALITY, 95])
+                            full_jpeg = full_buf.tobytes()
+                            supabase.storage_upload(bucket, keys["edited_key"], full_jpeg)
+                            photo_update["edited_key"] = keys["edited_key"]
+                            ps["edited_key"] = keys["edited_key"]
+                            logger.info(f"RAW→JPEG full-res: {keys['edited_key']} ({len(full_jpeg)/1024/1024:.1f}MB)")
+
+                            # Web preview (2048px max)
+                            h, w = full_bgr.shape[:2]
+                            if max(h, w) > 2048:
+                                scale = 2048 / max(h, w)
+                                web_img = cv2.resize(full_bgr, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+                            else:
+                                web_img = full_bgr
+                            _, web_buf = cv2.imencode(".jpg", web_img, [cv2.IMWRITE_JPEG_QUALITY, 92])
+                            web_jpeg = web_buf.tobytes()
+                            supabase.storage_upload(bucket, keys["web_key"], web_jpeg)
+                            photo_update["web_key"] = keys["web_key"]
+
+                            # Thumbnail (400px max)
+                            if max(h, w) > 400:
+                                scale_t = 400 / max(h, w)
+                                thumb_img = cv2.resize(full_bgr, (int(w * scale_t), int(h * scale_t)), interpolation=cv2.INTER_AREA)
+                            else:
+                                thumb_img = full_bgr
+                            _, thumb_buf = cv2.imencode(".jpg", thumb_img, [cv2.IMWRITE_JPEG_QUALITY, 80])
+                            supabase.storage_upload(bucket, keys["thumb_key"], thumb_buf.tobytes())
+                            photo_update["thumb_key"] = keys["thumb_key"]
+
+                            logger.info(f"RAW previews uploaded: web={keys['web_key']}, thumb={keys['thumb_key']}")
+
+                            # Cache the full BGR for later phases (avoid re-download + re-decode)
+                            photo["_processed_img"] = full_bgr
                         else:
-                            thumb_img = full_bgr
-                        _, thumb_buf = cv2.imencode(".jpg", thumb_img, [cv2.IMWRITE_JPEG_QUALITY, 80])
-                        supabase.storage_upload(bucket, keys["thumb_key"], thumb_buf.tobytes())
-                        photo_update["thumb_key"] = keys["thumb_key"]
+                            logger.error(f"Failed to decode RAW for JPEG conversion: {filename}")
 
-                        logger.info(f"RAW previews uploaded: web={keys['web_key']}, thumb={keys['thumb_key']}")
+                    # Update DB
+                    # Update DB
+                    supabase.update("photos", photo["id"], photo_update)
 
-                        # Cache the full BGR for later phases (avoid re-download + re-decode)
-                        photo["_processed_img"] = full_bgr
-                    else:
-                        logger.error(f"Failed to decode RAW for JPEG conversion: {filename}")
+                    # Update local state
+                    ps["quality_score"] = quality_int
+                    ps["face_data"] = face_data
+                    ps["scene_type"] = analysis.get("scene_type")
+                    if photo_update.get("edited_key"):
+                        ps["edited_key"] = photo_update["edited_key"]
 
-                # Update DB
-                # Update DB
-                supabase.update("photos", photo["id"], photo_update)
+                    # Cache image bytes for later phases (avoids re-downloading)
+                    photo["_img_bytes"] = img_bytes
 
-                # Update local state
-                ps["quality_score"] = quality_int
-                ps["face_data"] = face_data
-                ps["scene_type"] = analysis.get("scene_type")
-                if photo_update.get("edited_key"):
-                    ps["edited_key"] = photo_update["edited_key"]
+                    # Inputs for burst grouping once every photo is analysed
+                    photo["_phash"] = analysis.get("phash")
+                    if photo["_capture_time"] is None:
+                        photo["_capture_time"] = parse_capture_time(exif_raw)
 
-                # Cache image bytes for later phases (avoids re-downloading)
-                photo["_img_bytes"] = img_bytes
+                except Exception as e:
+                    logger.error(f"Phase 0 failed for photo {photo['id']}: {e}")
+                await _update_phase(processing_job_id, "analysis", i + 1)
 
-            except Exception as e:
-                logger.error(f"Phase 0 failed for photo {photo['id']}: {e}")
-            await _update_phase(processing_job_id, "analysis", i + 1)
+        feature_store.save()
+        logger.info(f"Phase 0: reused cached features for {reused}/{total_photos} photos")
+
+        # Burst grouping — timestamp sweep, pHash compared only within each window
+        burst_groups = detect_bursts(photos)
+        _assign_burst_groups(photo_state, burst_groups)
+        logger.info(f"Phase 0: {sum(1 for m in burst_groups.values() if len(m) > 1)} burst groups")
 
         # ═══════════════════════════════════════════════════════
         # PHASE 1 — STYLE APPLICATION (GPU — skip if unavailable)
         # ═══════════════════════════════════════════════════════
         await _update_phase(processing_job_id, "style", 0)
 
-        if use_gpu and model_filename:
-            logger.info(f"Phase 1 (GPU): Applying neural style to {total_photos} images")
-            batch_items = []
-            for photo in photos:
-                if photo.get("original_key"):
+        if use_neural_style:
+            logger.info(f"Phase 1 (GPU LUTs, CPU apply): Applying neural style to {total_photos} images")
+            style_photos = [p for p in photos if p.get("original_key")]
+
+            BATCH_SIZE = 32
+            processed = 0
+            for batch_start in range(0, len(style_photos), BATCH_SIZE):
+                batch = style_photos[batch_start:batch_start + BATCH_SIZE]
+                edited_keys = {}
+                for photo in batch:
                     edited_key = photo["original_key"].replace("/originals/", "/edited/")
                     if not edited_key.lower().endswith((".jpg", ".jpeg")):
                         edited_key = edited_key.rsplit(".", 1)[0] + ".jpg"
-                    batch_items.append({
-                        "image_key": photo["original_key"],
-                        "output_key": edited_key,
-                    })
-
-            BATCH_SIZE = 20
-            processed = 0
-            for batch_start in range(0, len(batch_items), BATCH_SIZE):
-                batch = batch_items[batch_start:batch_start + BATCH_SIZE]
-                result = await modal_client.apply_style_batch(
-                    images=batch,
-                    model_filename=model_filename,
-                    jpeg_quality=95,
-                )
-                if result.get("status") == "error":
-                    logger.error(f"GPU style batch failed: {result.get('message')}")
-                    break
+                    edited_keys[photo["id"]] = edited_key
+
+                # The GPU only predicts LUTs from 256×256 proxies
+                proxies = []
+                for photo in batch:
+                    proxy = photo.pop("_style_proxy", None)
+                    if proxy is None:
+                        proxy = _style_proxy_from_bytes(photo, bucket)
+                    if proxy is not None:
+                        proxies.append({"id": photo["id"], "image": encode_proxy(proxy)})
+
+                luts = {}
+                if proxies:
+                    result = await modal_client.predict_luts(proxies, model_filename)
+                    if result.get("status") == "success":
+                        for entry in result.get("luts", []):
+                            if entry and entry.get("status") == "success":
+                                luts[entry["id"]] = decode_lut(entry["lut"], result["lut_dim"], result["lut_dtype"])
+                    else:
+                        logger.warning(f"LUT prediction failed ({result.get('message')}) — "
+                                       f"falling back to GPU apply for this batch")
+
+                # Anything without a LUT goes through the full-resolution GPU endpoint
+                fallback = [p for p in batch if p["id"] not in luts]
+                if fallback:
+                    result = await modal_client.apply_style_batch(
+                        images=[{"image_key": p["original_key"], "output_key": edited_keys[p["id"]]} for p in fallback],
+                        model_filename=model_filename,
+                        jpeg_quality=95,
+                    )
+                    if result.get("status") == "error":
+                        logger.error(f"GPU style batch failed: {result.get('message')}")
+                        fallback = []
+                    else:
+                        ok_keys = {r["image_key"] for r in result.get("results", []) if r.get("status") == "success"}
+                        fallback = [p for p in fallback if p["original_key"] in ok_keys]
+
+                styled_ids = {p["id"] for p in fallback}
+                for photo in fallback:
+                    # The GPU wrote the styled frame to edited_key; drop the
+                    # unstyled copies so Phase 5 downloads that instead
+                    photo.pop("_img_bytes", None)
+                    photo.pop("_processed_img", None)
+                for photo in batch:
+                    lut = luts.get(photo["id"])
+                    if lut is None:
+                        continue
+                    try:
+                        jpeg = await asyncio.to_thread(_apply_neural_lut_cpu, photo, lut, bucket)
+                        if jpeg is None:
+                            continue
+                        supabase.storage_upload(bucket, edited_keys[photo["id"]], jpeg)
+                        # Phase 5 builds web / thumb from the styled frame
+                        photo["_img_bytes"] = jpeg
+                        photo.pop("_processed_img", None)
+                        styled_ids.add(photo["id"])
+                    except Exception as e:
+                        logger.error(f"CPU LUT apply failed for {photo['id']}: {e}")
 
                 processed += len(batch)
                 await _update_phase(processing_job_id, "style", processed)
 
-                for item, photo in zip(batch, photos[batch_start:batch_start + BATCH_SIZE]):
+                for photo in batch:
                     ps = photo_state[photo["id"]]
-                    ps["edited_key"] = item["output_key"]
+                    if photo["id"] not in styled_ids:
+                        ps["ai_edits"]["style_applied"] = False
+                        continue
+                    ps["edited_key"] = edited_keys[photo["id"]]
                     ps["ai_edits"]["style_applied"] = "neural_lut"
                     ps["ai_edits"]["has_preset"] = True
 
                     supabase.update("photos", photo["id"], {
-                        "edited_key": item["output_key"],
+                        "edited_key": edited_keys[photo["id"]],
                         "ai_edits": ps["ai_edits"],
                     })
+        elif style_entry is not None and style_entry.has_cpu_style:
+            # No neural model (or no GPU): render the cached profile — its
+            # .cube LUT, reference stats and preset — on the CPU
+            logger.info(f"Phase 1 (CPU): Applying style profile {style_entry.id} to {total_photos} images")
+            for i, photo in enumerate(photos):
+                ps = photo_state[photo["id"]]
+                ps["ai_edits"]["style_applied"] = False
+                ps["ai_edits"]["has_preset"] = has_style
+                if photo.get("original_key"):
+                    try:
+                        jpeg = await asyncio.to_thread(_apply_style_profile_cpu, photo, style_entry, bucket)
+                        if jpeg is not None:
+                            edited_key = get_output_keys(photographer_id, gallery_id, photo.get("filename", ""))["edited_key"]
+                            if supabase.storage_upload(bucket, edited_key, jpeg):
+                                # Phase 5 builds web / thumb from the styled frame
+                                photo["_img_bytes"] = jpeg
+                                photo.pop("_processed_img", None)
+                                ps["edited_key"] = edited_key
+                                ps["ai_edits"]["style_applied"] = "profile"
+                                ps["ai_edits"]["style_profile_id"] = style_entry.id
+                                supabase.update("photos", photo["id"], {
+                                    "edited_key": edited_key,
+                                    "ai_edits": ps["ai_edits"],
+                                })
+                    except Exception as e:
+                        logger.error(f"CPU style apply failed for {photo['id']}: {e}")
+                await _update_phase(processing_job_id, "style", i + 1)
         else:
             reason = "no GPU" if not use_gpu else "no trained model"
             logger.info(f"Phase 1: Skipped ({reason})")
@@ -460,6 +723,8 @@ async def run_pipeline(
         for photo in photos:
             photo.pop("_img_bytes", None)
             photo.pop("_processed_img", None)
+            photo.pop("_phash", None)
+            photo.pop("_capture_time", None)
 
 
 # ─── Helper functions ─────────────────────────────────────────────────
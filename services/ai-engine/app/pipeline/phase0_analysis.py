@@ -10,6 +10,7 @@ Extracts metadata and scores each image:
 """
 import io
 import logging
+import threading
 import numpy as np
 import cv2
 from PIL import Image
@@ -34,12 +35,24 @@ def is_raw_file(filename: str) -> bool:
     return ext in RAW_EXTENSIONS
 
 
+# Full-res RAW demosaics held in memory at once (each needs several hundred
+# MB for a 24-45 MP sensor), whatever the number of analysis threads
+MAX_PARALLEL_RAW_DECODES = 2
+_raw_decode_slots = threading.BoundedSemaphore(MAX_PARALLEL_RAW_DECODES)
+
+
 def decode_raw(image_bytes: bytes) -> Optional[np.ndarray]:
     """
     Decode a RAW image file to full-resolution BGR numpy array using rawpy.
+    At most MAX_PARALLEL_RAW_DECODES run at once; callers beyond that wait.
 
     Returns None if decoding fails.
     """
+    with _raw_decode_slots:
+        return _decode_raw_full(image_bytes)
+
+
+def _decode_raw_full(image_bytes: bytes) -> Optional[np.ndarray]:
     try:
         import rawpy
         import tempfile
@@ -76,6 +89,50 @@ def decode_raw(image_bytes: bytes) -> Optional[np.ndarray]:
         return None
 
 
+def decode_raw_preview(image_bytes: bytes, min_dimension: int) -> Optional[np.ndarray]:
+    """
+    Decode a RAW file's embedded preview (camera-rendered JPEG or bitmap)
+    as BGR without demosaicing. When the preview's long side is below
+    min_dimension, fall back to a half-size postprocess, which skips
+    demosaic interpolation.
+
+    Returns None if rawpy is missing or the file can't be read.
+    """
+    try:
+        import rawpy
+        import tempfile
+        import os
+
+        with tempfile.NamedTemporaryFile(suffix='.dng', delete=False) as tmp:
+            tmp.write(image_bytes)
+            tmp_path = tmp.name
+
+        try:
+            with rawpy.imread(tmp_path) as raw:
+                try:
+                    thumb = raw.extract_thumb()
+                except (rawpy.LibRawNoThumbnailError, rawpy.LibRawUnsupportedThumbnailError):
+                    thumb = None
+                if thumb is not None:
+                    if thumb.format == rawpy.ThumbFormat.JPEG:
+                        bgr = cv2.imdecode(np.frombuffer(thumb.data, np.uint8), cv2.IMREAD_COLOR)
+                    else:
+                        bgr = cv2.cvtColor(thumb.data, cv2.COLOR_RGB2BGR)
+                    if bgr is not None and max(bgr.shape[:2]) >= min_dimension:
+                        return bgr
+                rgb = raw.postprocess(use_camera_wb=True, half_size=True, no_auto_bright=False, output_bps=8)
+                return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+        finally:
+            os.unlink(tmp_path)
+
+    except ImportError:
+        log.error("rawpy not installed — cannot decode RAW files")
+        return None
+    except Exception as e:
+        log.error(f"RAW preview decode failed: {e}")
+        return None
+
+
 def generate_web_preview(img_array: np.ndarray, max_dimension: int = 2048, quality: int = 92) -> bytes:
     """
     Generate a JPEG preview from a BGR numpy array.
@@ -94,37 +151,166 @@ def generate_web_preview(img_array: np.ndarray, max_dimension: int = 2048, quali
 
 # ── EXIF Extraction ──────────────────────────────────────────
 
+EXIF_IFD_POINTER = 0x8769
+
+# Only keep useful, serialisable fields
+EXIF_KEEP_TAGS = {
+    "Make", "Model", "LensModel", "LensMake",
+    "ISOSpeedRatings", "ExposureTime", "FNumber", "FocalLength",
+    "DateTimeOriginal", "DateTimeDigitized", "DateTime",
+    "SubsecTimeOriginal", "SubsecTimeDigitized", "SubsecTime",
+    "ImageWidth", "ImageLength", "ExifImageWidth", "ExifImageHeight", "Orientation",
+    "Flash", "WhiteBalance", "ExposureProgram", "MeteringMode",
+    "ExposureBiasValue", "BrightnessValue",
+}
+
+
+def _exif_to_dict(raw_exif: Image.Exif) -> dict:
+    """Flatten IFD0 + Exif sub-IFD into a dict of the tags we keep."""
+    if not raw_exif:
+        return {}
+
+    # Capture time, sub-second fields and exposure settings live in the
+    # Exif sub-IFD, not the top-level IFD0 that getexif() iterates
+    tags = dict(raw_exif.items())
+    try:
+        tags.update(raw_exif.get_ifd(EXIF_IFD_POINTER))
+    except Exception:
+        pass
+
+    exif = {}
+    for tag_id, value in tags.items():
+        tag = TAGS.get(tag_id, str(tag_id))
+        if tag in EXIF_KEEP_TAGS:
+            # Convert rationals to float
+            if hasattr(value, "numerator"):
+                value = float(value)
+            exif[tag] = value
+    return exif
+
+
 def extract_exif(image_bytes: bytes) -> dict:
     """Extract useful EXIF data from image bytes."""
     try:
         img = Image.open(io.BytesIO(image_bytes))
-        raw_exif = img.getexif()
-        if not raw_exif:
-            return {}
-
-        exif = {}
-        for tag_id, value in raw_exif.items():
-            tag = TAGS.get(tag_id, str(tag_id))
-            # Only keep useful, serialisable fields
-            if tag in (
-                "Make", "Model", "LensModel", "LensMake",
-                "ISOSpeedRatings", "ExposureTime", "FNumber", "FocalLength",
-                "DateTimeOriginal", "DateTimeDigitized", "DateTime",
-                "ImageWidth", "ImageLength", "Orientation",
-                "Flash", "WhiteBalance", "ExposureProgram", "MeteringMode",
-                "ExposureBiasValue", "BrightnessValue",
-            ):
-                # Convert rationals to float
-                if hasattr(value, "numerator"):
-                    value = float(value)
-                exif[tag] = value
-
-        return exif
+        return _exif_to_dict(img.getexif())
     except Exception as e:
         log.warning(f"EXIF extraction failed: {e}")
         return {}
 
 
+# ── Header-only Metadata Probe ───────────────────────────────
+
+HEADER_PROBE_BYTES = 64 * 1024          # first ranged read
+HEADER_PROBE_MAX_BYTES = 1024 * 1024    # give up widening past this
+HEADER_PROBE_SLACK = 8 * 1024           # covers the DQT/DHT/SOF/SOS tables after a big APPn
+
+
+def _jpeg_header_size(header: bytes) -> int:
+    """
+    Bytes needed to cover every JPEG segment up to and including the
+    start-of-scan header — everything PIL reads before pixel data.
+
+    If the header is truncated, returns the smallest size that lets the
+    marker walk continue (may be larger than len(header)).
+    """
+    pos = 2  # skip SOI
+    while pos + 4 <= len(header):
+        if header[pos] != 0xFF:
+            return pos  # not a marker — corrupt, let PIL decide
+        marker = header[pos + 1]
+        if marker == 0xFF:
+            pos += 1  # fill byte
+            continue
+        seg_end = pos + 2 + int.from_bytes(header[pos + 2:pos + 4], "big")
+        if marker == 0xDA:
+            return seg_end
+        pos = seg_end
+    return pos + 4
+
+
+def parse_image_header(header: bytes) -> Optional[dict]:
+    """
+    Parse EXIF, dimensions and orientation from the leading bytes of an
+    image file without decoding pixels. Returns None if the header is
+    incomplete or unreadable.
+    """
+    try:
+        img = Image.open(io.BytesIO(header))
+        width, height = img.size
+    except Exception:
+        return None
+    try:
+        exif = _exif_to_dict(img.getexif())
+    except Exception:
+        # Some formats (PNG) keep EXIF after the pixel data and try a full load
+        exif = {}
+
+    # Stored (unrotated) dimensions. TIFF-based RAW files often describe the
+    # embedded thumbnail in IFD0 — the Exif sub-IFD carries the sensor size
+    for w_tag, h_tag in (("ExifImageWidth", "ExifImageHeight"), ("ImageWidth", "ImageLength")):
+        if exif.get(w_tag) and exif.get(h_tag):
+            try:
+                width, height = int(exif[w_tag]), int(exif[h_tag])
+            except (TypeError, ValueError):
+                continue
+            break
+
+    return {
+        "exif_data": exif,
+        "width": width,
+        "height": height,
+        "orientation": int(exif.get("Orientation", 1) or 1),
+        "capture_time": parse_capture_time(exif),
+    }
+
+
+def probe_metadata(
+    storage_key: str,
+    initial_bytes: int = HEADER_PROBE_BYTES,
+    max_bytes: int = HEADER_PROBE_MAX_BYTES,
+) -> Optional[dict]:
+    """
+    Read metadata for a stored image from its header only.
+
+    Fetches the first `initial_bytes` with a ranged request and parses
+    EXIF / dimensions / orientation. The range is only widened when the
+    header is larger: JPEGs are extended to the end of their marker
+    segments (plus a little slack), other formats double until `max_bytes`.
+
+    Returns parse_image_header()'s dict plus "header_bytes", or None.
+    """
+    from app.storage.supabase_storage import download_photo_range
+
+    header = b""
+    want = initial_bytes
+    while True:
+        chunk = download_photo_range(storage_key, len(header), want - 1)
+        if chunk is None:
+            return None
+        requested = want - len(header)
+        if len(chunk) > requested:
+            # Server ignored Range and sent the whole object
+            header, eof = chunk, True
+        else:
+            header, eof = header + chunk, len(chunk) < requested
+
+        if header[:2] == b"\xff\xd8" and not eof:
+            needed = _jpeg_header_size(header)
+            if len(header) < needed <= max_bytes:
+                want = min(needed + HEADER_PROBE_SLACK, max_bytes)
+                continue
+
+        meta = parse_image_header(header)
+        if meta is not None:
+            meta["header_bytes"] = len(header)
+            return meta
+        if eof or want >= max_bytes:
+            log.warning(f"Header probe failed for {storage_key} after {len(header)} bytes")
+            return None
+        want = min(want * 2, max_bytes)
+
+
 # ── Scene Type Detection ─────────────────────────────────────
 
 def detect_scene_type(img_array: np.ndarray, face_count: int) -> str:
@@ -185,12 +371,54 @@ def detect_scene_type(img_array: np.ndarray, face_count: int) -> str:
     return "candid"
 
 
+# ── Noise Estimation ─────────────────────────────────────────
+
+NOISE_TILE_GRID = 8  # fixed 8x8 grid of tiles
+
+# Converts a MAD to the mean absolute deviation of a Gaussian:
+# sigma = 1.4826 * MAD, E|x| = sigma * sqrt(2/pi)
+_MAD_TO_MEAN_ABS = 1.4826 * np.sqrt(2.0 / np.pi)
+
+
+def estimate_noise(gray: np.ndarray, grid: int = NOISE_TILE_GRID) -> float:
+    """
+    Deterministic noise estimate for a greyscale image.
+
+    One high-pass residual pass (image minus 5x5 Gaussian blur) over the
+    whole frame, split into a fixed grid of tiles. Each tile gets a robust
+    MAD estimate; the median across tiles ignores edge/texture-heavy tiles.
+
+    Returned in mean-absolute-residual units (the scale the quality score
+    and `noise_sigma` thresholds were tuned on).
+    """
+    if gray.ndim == 3:
+        gray = cv2.cvtColor(gray, cv2.COLOR_BGR2GRAY)
+    gray = gray.astype(np.float32)
+    residual = gray - cv2.GaussianBlur(gray, (5, 5), 0)
+
+    h, w = residual.shape
+    grid = max(1, min(grid, h // 8, w // 8))
+    th, tw = h // grid, w // grid
+    tiles = (
+        residual[:th * grid, :tw * grid]
+        .reshape(grid, th, grid, tw)
+        .swapaxes(1, 2)
+        .reshape(grid * grid, th * tw)
+    )
+
+    med = np.median(tiles, axis=1, keepdims=True)
+    mad = np.median(np.abs(tiles - med), axis=1)
+    return float(np.median(mad) * _MAD_TO_MEAN_ABS)
+
+
 # ── Quality Scoring ──────────────────────────────────────────
 
-def score_quality(img_array: np.ndarray) -> dict:
+def score_quality(img_array: np.ndarray, noise: Optional[float] = None) -> dict:
     """
     Score image quality on multiple dimensions (0-100 each).
 
+    `noise` is an estimate_noise() result to reuse; computed if omitted.
+
     Returns:
         {
             "overall": float,
@@ -228,21 +456,8 @@ def score_quality(img_array: np.ndarray) -> dict:
     # Normalise: <50 is very soft, >500 is razor sharp
     sharpness_score = min(100, max(0, (sharpness_raw - 10) / 5))
 
-    # ── Noise estimation (using small patch variance)
-    # Sample 10 random 32x32 patches and measure micro-variance
-    patch_size = 32
-    noise_estimates = []
-    rng = np.random.RandomState(42)
-    for _ in range(10):
-        y = rng.randint(0, max(1, h - patch_size))
-        x = rng.randint(0, max(1, w - patch_size))
-        patch = gray[y:y+patch_size, x:x+patch_size].astype(float)
-        # High-pass filter to isolate noise
-        blurred = cv2.GaussianBlur(patch, (5, 5), 0)
-        diff = np.abs(patch - blurred)
-        noise_estimates.append(np.mean(diff))
-
-    avg_noise = np.mean(noise_estimates)
+    # ── Noise estimation (robust residual statistics, shared with characteristics)
+    avg_noise = estimate_noise(gray) if noise is None else noise
     # Lower noise = better: <3 is clean, >15 is very noisy
     noise_score = max(0, min(100, 100 - (avg_noise - 2) * 7))
 
@@ -284,15 +499,16 @@ def score_quality(img_array: np.ndarray) -> dict:
 
 # ── Face Detection ───────────────────────────────────────────
 
-# Load face cascade once
-_face_cascade = None
+# Load face cascade once per thread — CascadeClassifier isn't safe to share
+# across the analyse_images() worker threads
+_face_cascade = threading.local()
 
 def _get_face_cascade():
-    global _face_cascade
-    if _face_cascade is None:
+    cascade = getattr(_face_cascade, "cascade", None)
+    if cascade is None:
         cascade_path = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
-        _face_cascade = cv2.CascadeClassifier(cascade_path)
-    return _face_cascade
+        cascade = _face_cascade.cascade = cv2.CascadeClassifier(cascade_path)
+    return cascade
 
 
 def detect_faces(img_array: np.ndarray) -> list[dict]:
@@ -337,85 +553,166 @@ def detect_faces(img_array: np.ndarray) -> list[dict]:
 
 # ── Duplicate/Burst Grouping ─────────────────────────────────
 
-def compute_image_hash(img_array: np.ndarray) -> str:
-    """Compute a perceptual hash (pHash) for duplicate detection."""
+def compute_image_hash(img_array: np.ndarray) -> int:
+    """Compute a perceptual hash (pHash) for duplicate detection, packed into a 64-bit int."""
     # Resize to 32x32, greyscale
     resized = cv2.resize(img_array, (32, 32))
     if len(resized.shape) == 3:
         resized = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
 
-    # DCT-based hash
+    # DCT-based hash — bit 63 is the top-left DCT coefficient, same order as
+    # the old '0'/'1' string so hashes stay comparable across versions
     dct = cv2.dct(np.float32(resized))
     dct_low = dct[:8, :8]
     median = np.median(dct_low)
     bits = (dct_low > median).flatten()
-    return "".join(str(int(b)) for b in bits)
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hash_to_int(p_hash) -> Optional[int]:
+    """Normalise a pHash to a 64-bit int. Accepts ints and legacy 64-char bit strings."""
+    if p_hash is None or p_hash == "":
+        return None
+    if isinstance(p_hash, str):
+        try:
+            return int(p_hash, 2)
+        except ValueError:
+            return None
+    return int(p_hash)
+
+
+def hamming_distance(hash1, hash2) -> int:
+    """Count differing bits between two hashes (popcount of XOR)."""
+    return (hash_to_int(hash1) ^ hash_to_int(hash2)).bit_count()
 
 
-def hamming_distance(hash1: str, hash2: str) -> int:
-    """Count differing bits between two hashes."""
-    return sum(c1 != c2 for c1, c2 in zip(hash1, hash2))
+def hamming_distances(p_hash: int, hashes: np.ndarray) -> np.ndarray:
+    """Vectorised Hamming distance from one hash to a uint64 array of hashes."""
+    return np.bitwise_count(hashes ^ np.uint64(p_hash))
 
 
 def group_duplicates(photos: list[dict], threshold: int = 10) -> dict[str, list[str]]:
     """
     Group photos by visual similarity using perceptual hashing.
 
+    Each photo joins the first (oldest) group leader within `threshold` bits,
+    otherwise it starts a new group. Leaders are kept in a packed uint64
+    array so each photo is one vectorised popcount instead of a Python loop.
+
     Returns: {group_id: [photo_id, ...]}
     """
     if not photos:
         return {}
 
     groups: dict[str, list[str]] = {}
-    group_leaders: list[tuple[str, str]] = []  # (group_id, hash)
+    leader_hashes = np.empty(len(photos), dtype=np.uint64)
+    leader_ids: list[str] = []
 
     for photo in photos:
-        p_hash = photo.get("_phash", "")
+        p_hash = hash_to_int(photo.get("_phash"))
         p_id = photo["id"]
 
-        if not p_hash:
+        if p_hash is None:
             # Each unhashed photo is its own group
             groups[p_id] = [p_id]
             continue
 
-        matched = False
-        for leader_id, leader_hash in group_leaders:
-            if hamming_distance(p_hash, leader_hash) < threshold:
-                groups[leader_id].append(p_id)
-                matched = True
-                break
+        n_leaders = len(leader_ids)
+        if n_leaders:
+            hits = np.flatnonzero(hamming_distances(p_hash, leader_hashes[:n_leaders]) < threshold)
+            if hits.size:
+                groups[leader_ids[hits[0]]].append(p_id)
+                continue
 
-        if not matched:
-            groups[p_id] = [p_id]
-            group_leaders.append((p_id, p_hash))
+        groups[p_id] = [p_id]
+        leader_hashes[n_leaders] = p_hash
+        leader_ids.append(p_id)
 
     return groups
 
 
-# ── Main Phase 0 Entry Point ─────────────────────────────────
+def parse_capture_time(exif: dict) -> Optional[float]:
+    """
+    Capture time in seconds (naive local camera clock) from extracted EXIF.
 
-def analyse_image(image_bytes: bytes, filename: str = "") -> dict:
+    Uses DateTimeOriginal + SubsecTimeOriginal, falling back to the
+    digitized / modified timestamps. Returns None if no usable timestamp.
     """
-    Run full Phase 0 analysis on a single image.
+    for dt_tag, subsec_tag in (
+        ("DateTimeOriginal", "SubsecTimeOriginal"),
+        ("DateTimeDigitized", "SubsecTimeDigitized"),
+        ("DateTime", "SubsecTime"),
+    ):
+        value = exif.get(dt_tag)
+        if not value or not isinstance(value, str):
+            continue
+        try:
+            ts = datetime.strptime(value.strip().rstrip("\x00"), "%Y:%m:%d %H:%M:%S").timestamp()
+        except ValueError:
+            continue
+        subsec = str(exif.get(subsec_tag) or "").strip().rstrip("\x00")
+        if subsec.isdigit():
+            ts += int(subsec) / (10 ** len(subsec))
+        return ts
+    return None
+
+
+def detect_bursts(
+    photos: list[dict],
+    window_s: float = 2.0,
+    threshold: int = 10,
+    max_span_s: float = 10.0,
+) -> dict[str, list[str]]:
+    """
+    Group photos into bursts by capture time + visual similarity.
 
-    Args:
-        image_bytes: Raw file bytes
-        filename: Original filename (used to detect RAW format)
+    Photos are sorted by `_capture_time` and swept in one pass: a candidate
+    window stays open while consecutive shots are at most `window_s` apart
+    and it started at most `max_span_s` ago, so continuous shooting (1 fps
+    through a whole match) is cut into short windows instead of chaining
+    into one. Perceptual hashes are only compared inside each window, so
+    two similar frames shot minutes apart never merge. Photos without a
+    capture time fall back to hash-only grouping among themselves.
 
-    Returns:
-        {
-            "exif_data": {...},
-            "scene_type": str,
-            "quality_score": float,
-            "quality_details": {...},
-            "face_data": [...],
-            "face_count": int,
-            "phash": str,
-            "width": int,
-            "height": int,
-            "is_raw": bool,
-            "web_preview_bytes": bytes | None,  # JPEG preview for RAW files
-        }
+    Returns: {group_id: [photo_id, ...]} — same shape as group_duplicates()
+    """
+    if not photos:
+        return {}
+
+    timed = [p for p in photos if p.get("_capture_time") is not None]
+    untimed = [p for p in photos if p.get("_capture_time") is None]
+    timed.sort(key=lambda p: p["_capture_time"])
+
+    groups: dict[str, list[str]] = {}
+    window: list[dict] = []
+    window_start = last_t = None
+    for photo in timed:
+        t = photo["_capture_time"]
+        if window and (t - last_t > window_s or t - window_start > max_span_s):
+            groups.update(group_duplicates(window, threshold=threshold))
+            window = []
+        if not window:
+            window_start = t
+        window.append(photo)
+        last_t = t
+    if window:
+        groups.update(group_duplicates(window, threshold=threshold))
+
+    groups.update(group_duplicates(untimed, threshold=threshold))
+    return groups
+
+
+# ── Main Phase 0 Entry Point ─────────────────────────────────
+
+MAX_ANALYSIS_DIM = 1600
+
+
+def _decode_for_analysis(image_bytes: bytes, filename: str = "") -> Optional[dict]:
+    """
+    Decode image bytes and shrink to the analysis size.
+
+    Returns {"img", "width", "height", "is_raw", "web_preview_bytes"} with
+    original dimensions, or None if nothing could decode the file.
     """
     is_raw = is_raw_file(filename) if filename else False
     web_preview_bytes = None
@@ -442,7 +739,7 @@ def analyse_image(image_bytes: bytes, filename: str = "") -> dict:
                 log.warning(f"Fell back to PIL for {filename} — image may be low resolution ({img.shape[1]}x{img.shape[0]})")
             except Exception:
                 log.error(f"Failed to decode image: {filename}")
-                return {"error": "Failed to decode image"}
+                return None
 
     h, w = img.shape[:2]
 
@@ -456,7 +753,6 @@ def analyse_image(image_bytes: bytes, filename: str = "") -> dict:
 
     # Resize for analysis to prevent OOM on memory-constrained containers
     # Analysis (face detection, scene, quality) doesn't need full resolution
-    MAX_ANALYSIS_DIM = 1600
     if max(h, w) > MAX_ANALYSIS_DIM:
         scale = MAX_ANALYSIS_DIM / max(h, w)
         analysis_img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
@@ -465,16 +761,30 @@ def analyse_image(image_bytes: bytes, filename: str = "") -> dict:
     # Free full-res immediately
     del img
 
+    return {
+        "img": analysis_img,
+        "width": w,
+        "height": h,
+        "is_raw": is_raw,
+        "web_preview_bytes": web_preview_bytes,
+    }
+
+
+def _analyse_decoded(decoded: dict, image_bytes: bytes) -> dict:
+    """Run every Phase 0 analysis on an already-decoded analysis image."""
+    analysis_img = decoded["img"]
+
     # Run all analyses on the resized image
     exif = extract_exif(image_bytes)
     faces = detect_faces(analysis_img)
     face_count = len(faces)
     scene = detect_scene_type(analysis_img, face_count)
-    quality = score_quality(analysis_img)
+    noise = estimate_noise(analysis_img)
+    quality = score_quality(analysis_img, noise=noise)
     phash = compute_image_hash(analysis_img)
 
     # Image characteristics for adaptive editing
-    characteristics = _compute_image_characteristics(analysis_img)
+    characteristics = _compute_image_characteristics(analysis_img, noise=noise)
 
     return {
         "exif_data": exif,
@@ -484,19 +794,136 @@ def analyse_image(image_bytes: bytes, filename: str = "") -> dict:
         "face_data": faces,
         "face_count": face_count,
         "phash": phash,
-        "width": w,   # Original dimensions
-        "height": h,
+        "width": decoded["width"],   # Original dimensions
+        "height": decoded["height"],
         "characteristics": characteristics,
-        "is_raw": is_raw,
-        "web_preview_bytes": web_preview_bytes,
+        "is_raw": decoded["is_raw"],
+        "web_preview_bytes": decoded["web_preview_bytes"],
     }
 
 
-def _compute_image_characteristics(img: np.ndarray) -> dict:
+def analyse_image(image_bytes: bytes, filename: str = "") -> dict:
+    """
+    Run full Phase 0 analysis on a single image.
+
+    Args:
+        image_bytes: Raw file bytes
+        filename: Original filename (used to detect RAW format)
+
+    Returns:
+        {
+            "exif_data": {...},
+            "scene_type": str,
+            "quality_score": float,
+            "quality_details": {...},
+            "face_data": [...],
+            "face_count": int,
+            "phash": int,
+            "width": int,
+            "height": int,
+            "is_raw": bool,
+            "web_preview_bytes": bytes | None,  # JPEG preview for RAW files
+        }
+    """
+    decoded = _decode_for_analysis(image_bytes, filename)
+    if decoded is None:
+        return {"error": "Failed to decode image"}
+    return _analyse_decoded(decoded, image_bytes)
+
+
+# ── Batch Analysis ───────────────────────────────────────────
+
+BATCH_PROXY_SIZE = 256  # side of the stacked proxies returned with return_proxies=True
+
+# Per-image keys of analyse_image(), stored column-wise by analyse_images()
+_ANALYSIS_COLUMNS = (
+    "exif_data", "scene_type", "quality_score", "quality_details", "face_data",
+    "face_count", "phash", "width", "height", "characteristics", "is_raw",
+    "web_preview_bytes",
+)
+
+
+def analyse_images(
+    images: list,
+    filenames: Optional[list[str]] = None,
+    max_workers: Optional[int] = None,
+    return_proxies: bool = False,
+) -> dict:
+    """
+    Run Phase 0 analysis on many images in one call.
+
+    Args:
+        images: Raw file bytes or filesystem paths
+        filenames: Original filenames (RAW detection); defaults to the path or ""
+        max_workers: Decode/analysis threads (OpenCV releases the GIL)
+        return_proxies: Also shrink each image to a BATCH_PROXY_SIZE square
+            and return them stacked as "proxies" (N×S×S×3 BGR, zero where
+            the image failed) — the neural style model's input
+
+    Returns a columnar dict: one list per analyse_image() key (None where
+    the image failed) and an "error" list. Use analysis_row() to get a
+    single image back in analyse_image() form.
+
+    RAW files decode at full resolution; however many workers run, at most
+    MAX_PARALLEL_RAW_DECODES of those decodes are in flight (decode_raw).
+    """
+    import os
+    from concurrent.futures import ThreadPoolExecutor
+
+    n = len(images)
+    if filenames is None:
+        filenames = [img if isinstance(img, (str, os.PathLike)) else "" for img in images]
+    filenames = [os.path.basename(str(f)) for f in filenames]
+
+    def work(idx: int):
+        src = images[idx]
+        try:
+            if isinstance(src, (str, os.PathLike)):
+                with open(src, "rb") as f:
+                    src = f.read()
+            decoded = _decode_for_analysis(src, filenames[idx])
+            if decoded is None:
+                return {"error": "Failed to decode image"}, None
+            proxy = None
+            if return_proxies:
+                proxy = cv2.resize(decoded["img"], (BATCH_PROXY_SIZE, BATCH_PROXY_SIZE), interpolation=cv2.INTER_AREA)
+            return _analyse_decoded(decoded, src), proxy
+        except Exception as e:
+            log.error(f"Batch analysis failed for {filenames[idx] or idx}: {e}")
+            return {"error": str(e)}, None
+
+    workers = max_workers or min(8, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        outputs = list(pool.map(work, range(n)))
+
+    result: dict = {"count": n, "filename": filenames, "error": []}
+    for key in _ANALYSIS_COLUMNS:
+        result[key] = []
+    for analysis, _ in outputs:
+        result["error"].append(analysis.get("error"))
+        for key in _ANALYSIS_COLUMNS:
+            result[key].append(analysis.get(key))
+
+    if return_proxies:
+        proxies = np.zeros((n, BATCH_PROXY_SIZE, BATCH_PROXY_SIZE, 3), dtype=np.uint8)
+        for idx, (_, proxy) in enumerate(outputs):
+            if proxy is not None:
+                proxies[idx] = proxy
+        result["proxies"] = proxies
+    return result
+
+
+def analysis_row(batch: dict, idx: int) -> dict:
+    """Pull one image out of an analyse_images() result in analyse_image() form."""
+    if batch["error"][idx]:
+        return {"error": batch["error"][idx]}
+    return {key: batch[key][idx] for key in _ANALYSIS_COLUMNS}
+
+
+def _compute_image_characteristics(img: np.ndarray, noise: Optional[float] = None) -> dict:
     """Compute image characteristics used by adaptive preset system."""
     lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB).astype(np.float32)
     hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV).astype(np.float32)
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
 
     L = lab[:, :, 0]
     h_img, w_img = img.shape[:2]
@@ -537,10 +964,8 @@ def _compute_image_characteristics(img: np.ndarray) -> dict:
     is_desaturated = mean_saturation < 40
     is_oversaturated = mean_saturation > 180
 
-    # Noise estimate (quick)
-    noise_sigma = float(np.mean(np.abs(
-        gray.astype(float) - cv2.GaussianBlur(gray, (5, 5), 0).astype(float)
-    )))
+    # Noise estimate (shared robust estimator)
+    noise_sigma = estimate_noise(img) if noise is None else noise
     is_noisy = noise_sigma > 8
 
     # Dynamic range
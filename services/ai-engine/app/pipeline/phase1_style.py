@@ -7,59 +7,90 @@ Two-tier style application:
 
 Runs on CPU. No GPU required.
 """
+import copy
+import hashlib
 import io
+import json
 import logging
-from typing import Optional
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
 
 import cv2
 import numpy as np
 from PIL import Image
 
+from app.config import get_settings
 from app.pipeline.preset_parser import parse_preset_file
+from app.pipeline.tiling import gaussian_radius, run_in_strips
 
 log = logging.getLogger(__name__)
 
+CLARITY_SIGMA = 20
+HSL_MASK_RADIUS = 2  # 5x5 feather on the HSL band masks
+
 
 # ═══════════════════════════════════════════════════════════════
 # PRESET APPLICATION ENGINE
 # ═══════════════════════════════════════════════════════════════
 
-def apply_preset_params(img: np.ndarray, preset: dict, intensity: float = 1.0) -> np.ndarray:
-    """Apply parsed Lightroom preset parameters to an image."""
-    if not preset:
-        return img
-    result = img.copy().astype(np.float32)
+def _to_u8(result: np.ndarray) -> np.ndarray:
+    return np.clip(result, 0, 255).astype(np.uint8)
+
 
-    # --- Exposure (stops) ---
+# Colour steps are per-pixel functions of 8-bit channel values. Each is
+# split into a table builder, run once per (preset, intensity), and a cheap
+# apply that only indexes the tables; builders return None when the step is
+# inactive. PresetPlan keeps the built tables for every photo that shares a
+# preset; the _step_* functions build and apply in one go.
+
+_LEVELS_F32 = np.arange(256, dtype=np.float32)
+
+
+def _exposure_table(preset: dict, intensity: float) -> Optional[float]:
     exp = preset.get('exposure', 0.0)
     if abs(exp) > 0.01:
-        result *= 2.0 ** (exp * intensity)
+        return 2.0 ** (exp * intensity)
+    return None
 
-    # --- Temperature / Tint ---
+
+def _apply_exposure(result: np.ndarray, factor: float) -> np.ndarray:
+    result *= factor
+    return result
+
+
+def _temperature_table(preset: dict, intensity: float) -> Optional[tuple[np.ndarray, np.ndarray]]:
     temp, tint = preset.get('temperature', 0.0), preset.get('tint', 0.0)
     if abs(temp) > 0.5 or abs(tint) > 0.5:
-        lab = cv2.cvtColor(np.clip(result, 0, 255).astype(np.uint8), cv2.COLOR_BGR2LAB).astype(np.float32)
-        lab[:, :, 2] += (temp / 100.0) * 10.0 * intensity
-        lab[:, :, 1] += (tint / 100.0) * 8.0 * intensity
-        result = cv2.cvtColor(np.clip(lab, 0, 255).astype(np.uint8), cv2.COLOR_LAB2BGR).astype(np.float32)
+        a_map = _to_u8(_LEVELS_F32 + (tint / 100.0) * 8.0 * intensity)
+        b_map = _to_u8(_LEVELS_F32 + (temp / 100.0) * 10.0 * intensity)
+        return a_map, b_map
+    return None
+
+
+def _apply_temperature(result: np.ndarray, maps: tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+    a_map, b_map = maps
+    lab = cv2.cvtColor(_to_u8(result), cv2.COLOR_BGR2LAB)
+    lab[:, :, 1] = a_map[lab[:, :, 1]]
+    lab[:, :, 2] = b_map[lab[:, :, 2]]
+    return cv2.cvtColor(lab, cv2.COLOR_LAB2BGR).astype(np.float32)
 
-    # --- Contrast (S-curve on luminance) ---
+
+def _contrast_table(preset: dict, intensity: float) -> Optional[np.ndarray]:
     con = preset.get('contrast', 0.0)
     if abs(con) > 0.5:
-        lab = cv2.cvtColor(np.clip(result, 0, 255).astype(np.uint8), cv2.COLOR_BGR2LAB).astype(np.float32)
-        L = lab[:, :, 0]
         amt = (con / 100.0) * intensity
-        lab[:, :, 0] = np.clip((L - 128.0) * (1.0 + amt * 0.5) + 128.0, 0, 255)
-        result = cv2.cvtColor(lab.astype(np.uint8), cv2.COLOR_LAB2BGR).astype(np.float32)
+        return np.clip((_LEVELS_F32 - 128.0) * (1.0 + amt * 0.5) + 128.0, 0, 255).astype(np.uint8)
+    return None
 
-    # --- Highlights / Shadows / Whites / Blacks ---
+
+def _tones_table(preset: dict, intensity: float) -> Optional[np.ndarray]:
     hi = preset.get('highlights', 0.0)
     sh = preset.get('shadows', 0.0)
     wh = preset.get('whites', 0.0)
     bl = preset.get('blacks', 0.0)
     if any(abs(v) > 0.5 for v in [hi, sh, wh, bl]):
-        lab = cv2.cvtColor(np.clip(result, 0, 255).astype(np.uint8), cv2.COLOR_BGR2LAB).astype(np.float32)
-        L = lab[:, :, 0]
+        L = _LEVELS_F32.copy()
         if abs(hi) > 0.5:
             L += np.clip((L - 192.0) / 63.0, 0, 1) * (hi / 100.0) * 40.0 * intensity
         if abs(sh) > 0.5:
@@ -68,100 +99,223 @@ def apply_preset_params(img: np.ndarray, preset: dict, intensity: float = 1.0) -
             L += np.clip((L - 230.0) / 25.0, 0, 1) * (wh / 100.0) * 30.0 * intensity
         if abs(bl) > 0.5:
             L += np.clip((25.0 - L) / 25.0, 0, 1) * (bl / 100.0) * 30.0 * intensity
-        lab[:, :, 0] = np.clip(L, 0, 255)
-        result = cv2.cvtColor(lab.astype(np.uint8), cv2.COLOR_LAB2BGR).astype(np.float32)
+        return np.clip(L, 0, 255).astype(np.uint8)
+    return None
 
-    # --- HSL adjustments ---
-    hsl_keys = [k for k in preset if k.startswith('hsl_')]
-    if hsl_keys:
-        hsv = cv2.cvtColor(np.clip(result, 0, 255).astype(np.uint8), cv2.COLOR_BGR2HSV).astype(np.float32)
-        H, S, V = hsv[:, :, 0], hsv[:, :, 1], hsv[:, :, 2]
-        ranges = {
-            'red': (0, 15, 165, 180), 'orange': (15, 30), 'yellow': (30, 45),
-            'green': (45, 90), 'aqua': (90, 105), 'blue': (105, 135),
-            'purple': (135, 150), 'magenta': (150, 165),
-        }
-        for color, hr in ranges.items():
-            dh = preset.get(f'hsl_hue_{color}', 0.0)
-            ds = preset.get(f'hsl_sat_{color}', 0.0)
-            dl = preset.get(f'hsl_lum_{color}', 0.0)
-            if all(abs(v) < 0.5 for v in [dh, ds, dl]):
-                continue
-            if len(hr) == 4:
-                mask = ((H >= hr[0]) & (H < hr[1])) | ((H >= hr[2]) & (H <= hr[3]))
-            else:
-                mask = (H >= hr[0]) & (H < hr[1])
-            mf = cv2.GaussianBlur(mask.astype(np.float32), (5, 5), 0)
-            if abs(dh) > 0.5:
-                H += mf * (dh / 100.0) * 15.0 * intensity
-            if abs(ds) > 0.5:
-                S += mf * (ds / 100.0) * 50.0 * intensity
-            if abs(dl) > 0.5:
-                V += mf * (dl / 100.0) * 40.0 * intensity
-        hsv[:, :, 0] = H % 180
-        hsv[:, :, 1] = np.clip(S, 0, 255)
-        hsv[:, :, 2] = np.clip(V, 0, 255)
-        result = cv2.cvtColor(hsv.astype(np.uint8), cv2.COLOR_HSV2BGR).astype(np.float32)
-
-    # --- Split toning ---
+
+def _tone_curve_table(preset: dict, intensity: float) -> Optional[np.ndarray]:
+    tc = preset.get('tone_curve')
+    if tc and len(tc) >= 2:
+        pts = np.array(tc, dtype=np.float64)
+        lut = np.interp(np.arange(256), pts[:, 0], pts[:, 1]).astype(np.float32)
+        ident = np.arange(256, dtype=np.float32)
+        return np.clip(ident * (1 - intensity) + lut * intensity, 0, 255).astype(np.uint8)
+    return None
+
+
+def _apply_l_map(result: np.ndarray, l_map: np.ndarray) -> np.ndarray:
+    """Remap LAB lightness through a 256-entry table (contrast, tones, tone curve)."""
+    lab = cv2.cvtColor(_to_u8(result), cv2.COLOR_BGR2LAB)
+    lab[:, :, 0] = l_map[lab[:, :, 0]]
+    return cv2.cvtColor(lab, cv2.COLOR_LAB2BGR).astype(np.float32)
+
+
+HSL_RANGES = {
+    'red': (0, 15, 165, 180), 'orange': (15, 30), 'yellow': (30, 45),
+    'green': (45, 90), 'aqua': (90, 105), 'blue': (105, 135),
+    'purple': (135, 150), 'magenta': (150, 165),
+}
+
+
+def _hsl_table(preset: dict, intensity: float) -> Optional[tuple[list, float]]:
+    """Active bands as (hue range, hue / sat / lum amounts). Masks stay per pixel:
+    each band sees the hues already shifted by the bands before it."""
+    if not any(k.startswith('hsl_') for k in preset):
+        return None
+    bands = []
+    for color, hr in HSL_RANGES.items():
+        dh = preset.get(f'hsl_hue_{color}', 0.0)
+        ds = preset.get(f'hsl_sat_{color}', 0.0)
+        dl = preset.get(f'hsl_lum_{color}', 0.0)
+        if all(abs(v) < 0.5 for v in [dh, ds, dl]):
+            continue
+        bands.append((hr, dh, ds, dl))
+    return bands, intensity
+
+
+def _apply_hsl(result: np.ndarray, table: tuple[list, float], blur_mask: bool = True) -> np.ndarray:
+    bands, intensity = table
+    hsv = cv2.cvtColor(_to_u8(result), cv2.COLOR_BGR2HSV).astype(np.float32)
+    H, S, V = hsv[:, :, 0], hsv[:, :, 1], hsv[:, :, 2]
+    for hr, dh, ds, dl in bands:
+        if len(hr) == 4:
+            mask = ((H >= hr[0]) & (H < hr[1])) | ((H >= hr[2]) & (H <= hr[3]))
+        else:
+            mask = (H >= hr[0]) & (H < hr[1])
+        mf = mask.astype(np.float32)
+        if blur_mask:
+            mf = cv2.GaussianBlur(mf, (5, 5), 0)
+        if abs(dh) > 0.5:
+            H += mf * (dh / 100.0) * 15.0 * intensity
+        if abs(ds) > 0.5:
+            S += mf * (ds / 100.0) * 50.0 * intensity
+        if abs(dl) > 0.5:
+            V += mf * (dl / 100.0) * 40.0 * intensity
+    hsv[:, :, 0] = H % 180
+    hsv[:, :, 1] = np.clip(S, 0, 255)
+    hsv[:, :, 2] = np.clip(V, 0, 255)
+    return cv2.cvtColor(hsv.astype(np.uint8), cv2.COLOR_HSV2BGR).astype(np.float32)
+
+
+def _split_toning_table(preset: dict, intensity: float) -> Optional[list]:
+    """(a shift, b shift) per toned zone, each indexed by LAB lightness."""
     hh_sat = preset.get('split_highlight_sat', 0.0)
     sh_sat = preset.get('split_shadow_sat', 0.0)
     if hh_sat > 0.5 or sh_sat > 0.5:
-        lab = cv2.cvtColor(np.clip(result, 0, 255).astype(np.uint8), cv2.COLOR_BGR2LAB).astype(np.float32)
-        L = lab[:, :, 0]
+        L = _LEVELS_F32
         bal = preset.get('split_balance', 0.0)
         mid = 128.0 + bal * 0.5
+        shifts = []
         if hh_sat > 0.5:
             m = np.clip((L - mid) / (255.0 - mid + 1e-6), 0, 1)
             rad = preset.get('split_highlight_hue', 0.0) / 360.0 * 2 * np.pi
-            lab[:, :, 1] += m * np.cos(rad) * hh_sat / 100.0 * 20.0 * intensity
-            lab[:, :, 2] += m * np.sin(rad) * hh_sat / 100.0 * 20.0 * intensity
+            shifts.append((m * np.cos(rad) * hh_sat / 100.0 * 20.0 * intensity,
+                           m * np.sin(rad) * hh_sat / 100.0 * 20.0 * intensity))
         if sh_sat > 0.5:
             m = np.clip((mid - L) / (mid + 1e-6), 0, 1)
             rad = preset.get('split_shadow_hue', 0.0) / 360.0 * 2 * np.pi
-            lab[:, :, 1] += m * np.cos(rad) * sh_sat / 100.0 * 20.0 * intensity
-            lab[:, :, 2] += m * np.sin(rad) * sh_sat / 100.0 * 20.0 * intensity
-        result = cv2.cvtColor(np.clip(lab, 0, 255).astype(np.uint8), cv2.COLOR_LAB2BGR).astype(np.float32)
+            shifts.append((m * np.cos(rad) * sh_sat / 100.0 * 20.0 * intensity,
+                           m * np.sin(rad) * sh_sat / 100.0 * 20.0 * intensity))
+        return shifts
+    return None
 
-    # --- Clarity (local contrast on L channel) ---
-    clar = preset.get('clarity', 0.0)
-    if abs(clar) > 0.5:
-        lab = cv2.cvtColor(np.clip(result, 0, 255).astype(np.uint8), cv2.COLOR_BGR2LAB).astype(np.float32)
-        L = lab[:, :, 0]
-        blurred = cv2.GaussianBlur(L, (0, 0), sigmaX=20)
-        lab[:, :, 0] = np.clip(L + (L - blurred) * (clar / 100.0) * 0.6 * intensity, 0, 255)
-        result = cv2.cvtColor(lab.astype(np.uint8), cv2.COLOR_LAB2BGR).astype(np.float32)
 
-    # --- Vibrance & Saturation ---
+def _apply_split_toning(result: np.ndarray, shifts: list) -> np.ndarray:
+    lab_u8 = cv2.cvtColor(_to_u8(result), cv2.COLOR_BGR2LAB)
+    L = lab_u8[:, :, 0]
+    lab = lab_u8.astype(np.float32)
+    for da, db in shifts:
+        lab[:, :, 1] += da[L]
+        lab[:, :, 2] += db[L]
+    return cv2.cvtColor(_to_u8(lab), cv2.COLOR_LAB2BGR).astype(np.float32)
+
+
+def _vibrance_table(preset: dict, intensity: float) -> Optional[np.ndarray]:
+    """New HSV saturation indexed by [hue, saturation] (vibrance protects skin hues)."""
     vib = preset.get('vibrance', 0.0)
     sat = preset.get('saturation', 0.0)
     if abs(vib) > 0.5 or abs(sat) > 0.5:
-        hsv = cv2.cvtColor(np.clip(result, 0, 255).astype(np.uint8), cv2.COLOR_BGR2HSV).astype(np.float32)
-        Sc = hsv[:, :, 1]
+        H, Sc = np.meshgrid(_LEVELS_F32, _LEVELS_F32, indexing="ij")
         if abs(sat) > 0.5:
             Sc *= 1.0 + (sat / 100.0) * intensity
         if abs(vib) > 0.5:
             wt = 1.0 - Sc / 255.0
-            skin = ((hsv[:, :, 0] >= 5) & (hsv[:, :, 0] <= 25) & (Sc > 30)).astype(np.float32)
+            skin = ((H >= 5) & (H <= 25) & (Sc > 30)).astype(np.float32)
             Sc += wt * (1.0 - skin * 0.7) * (vib / 100.0) * intensity * 80.0
-        hsv[:, :, 1] = np.clip(Sc, 0, 255)
-        result = cv2.cvtColor(hsv.astype(np.uint8), cv2.COLOR_HSV2BGR).astype(np.float32)
+        return np.clip(Sc, 0, 255).astype(np.uint8)
+    return None
+
+
+def _apply_vibrance(result: np.ndarray, s_map: np.ndarray) -> np.ndarray:
+    hsv = cv2.cvtColor(_to_u8(result), cv2.COLOR_BGR2HSV)
+    hsv[:, :, 1] = s_map[hsv[:, :, 0], hsv[:, :, 1]]
+    return cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR).astype(np.float32)
+
+
+# name → (table builder, apply) for every colour step
+COLOUR_TABLES = {
+    "exposure": (_exposure_table, _apply_exposure),
+    "temperature": (_temperature_table, _apply_temperature),
+    "contrast": (_contrast_table, _apply_l_map),
+    "tones": (_tones_table, _apply_l_map),
+    "hsl": (_hsl_table, _apply_hsl),
+    "split_toning": (_split_toning_table, _apply_split_toning),
+    "vibrance": (_vibrance_table, _apply_vibrance),
+    "tone_curve": (_tone_curve_table, _apply_l_map),
+}
+
+
+def _run_colour_step(name: str, result: np.ndarray, preset: dict, intensity: float) -> np.ndarray:
+    build, apply = COLOUR_TABLES[name]
+    table = build(preset, intensity)
+    return result if table is None else apply(result, table)
+
+
+def _step_exposure(result: np.ndarray, preset: dict, intensity: float) -> np.ndarray:
+    """Exposure (stops)."""
+    return _run_colour_step("exposure", result, preset, intensity)
+
+
+def _step_temperature(result: np.ndarray, preset: dict, intensity: float) -> np.ndarray:
+    """Temperature / Tint."""
+    return _run_colour_step("temperature", result, preset, intensity)
+
+
+def _step_contrast(result: np.ndarray, preset: dict, intensity: float) -> np.ndarray:
+    """Contrast (S-curve on luminance)."""
+    return _run_colour_step("contrast", result, preset, intensity)
+
+
+def _step_tones(result: np.ndarray, preset: dict, intensity: float) -> np.ndarray:
+    """Highlights / Shadows / Whites / Blacks."""
+    return _run_colour_step("tones", result, preset, intensity)
+
+
+def _step_hsl(result: np.ndarray, preset: dict, intensity: float, blur_mask: bool = True) -> np.ndarray:
+    """HSL adjustments. `blur_mask=False` drops the 5x5 mask feathering (used when sampling a LUT)."""
+    table = _hsl_table(preset, intensity)
+    return result if table is None else _apply_hsl(result, table, blur_mask)
+
+
+def _step_split_toning(result: np.ndarray, preset: dict, intensity: float) -> np.ndarray:
+    """Split toning."""
+    return _run_colour_step("split_toning", result, preset, intensity)
+
+
+# Spatial steps take an optional `region` when run on a strip of a larger
+# frame: {"y0": first row in the frame, "height": frame height,
+# "grain": frame-wide grain field from _grain_field()}. None = whole frame.
+
+def _step_clarity(result: np.ndarray, preset: dict, intensity: float,
+                  region: dict | None = None) -> np.ndarray:
+    """Clarity (local contrast on L channel)."""
+    clar = preset.get('clarity', 0.0)
+    if abs(clar) > 0.5:
+        lab = cv2.cvtColor(_to_u8(result), cv2.COLOR_BGR2LAB).astype(np.float32)
+        L = lab[:, :, 0]
+        blurred = cv2.GaussianBlur(L, (0, 0), sigmaX=CLARITY_SIGMA)
+        lab[:, :, 0] = np.clip(L + (L - blurred) * (clar / 100.0) * 0.6 * intensity, 0, 255)
+        result = cv2.cvtColor(lab.astype(np.uint8), cv2.COLOR_LAB2BGR).astype(np.float32)
+    return result
 
-    # --- Sharpening (luminance only) ---
+
+def _step_vibrance(result: np.ndarray, preset: dict, intensity: float) -> np.ndarray:
+    """Vibrance & Saturation."""
+    return _run_colour_step("vibrance", result, preset, intensity)
+
+
+def _step_sharpen(result: np.ndarray, preset: dict, intensity: float,
+                  region: dict | None = None) -> np.ndarray:
+    """Sharpening (luminance only)."""
     sharp = preset.get('sharpness', 0.0)
     if sharp > 1.0:
-        lab = cv2.cvtColor(np.clip(result, 0, 255).astype(np.uint8), cv2.COLOR_BGR2LAB).astype(np.float32)
+        lab = cv2.cvtColor(_to_u8(result), cv2.COLOR_BGR2LAB).astype(np.float32)
         L = lab[:, :, 0]
         sig = max(0.5, preset.get('sharpen_radius', 1.0))
         blurred = cv2.GaussianBlur(L, (0, 0), sig)
         lab[:, :, 0] = np.clip(L + (L - blurred) * (sharp / 100.0) * intensity * 1.5, 0, 255)
         result = cv2.cvtColor(lab.astype(np.uint8), cv2.COLOR_LAB2BGR).astype(np.float32)
+    return result
 
-    # --- Vignette ---
+
+def _step_vignette(result: np.ndarray, preset: dict, intensity: float,
+                   region: dict | None = None) -> np.ndarray:
+    """Vignette."""
     vig = preset.get('vignette_amount', 0.0)
     if abs(vig) > 0.5:
-        ht, wd = result.shape[:2]
-        Y, X = np.ogrid[:ht, :wd]
+        rows, wd = result.shape[:2]
+        y0, ht = (region["y0"], region["height"]) if region else (0, rows)
+        Y, X = np.ogrid[y0:y0 + rows, :wd]
         cx, cy = wd / 2.0, ht / 2.0
         md = np.sqrt(cx ** 2 + cy ** 2)
         d = np.sqrt((X - cx) ** 2 + (Y - cy) ** 2) / md
@@ -171,125 +325,299 @@ def apply_preset_params(img: np.ndarray, preset: dict, intensity: float = 1.0) -
         amt = vig / 100.0 * intensity
         factor = 1.0 + amt * vm if amt > 0 else 1.0 + amt * vm
         result *= factor[:, :, np.newaxis]
+    return result
+
 
-    # --- Grain ---
+def _grain_field(preset: dict, intensity: float, ht: int, wd: int) -> np.ndarray:
+    """Low-res grain noise for a ht x wd frame; upsampled per row band by _upsample_rows."""
+    gr = preset.get('grain_amount', 0.0)
+    sz = max(1, int(preset.get('grain_size', 25.0) / 25.0 * 4))
+    smh, smw = max(1, ht // sz), max(1, wd // sz)
+    return np.random.normal(0, (gr / 100.0) * 25.0 * intensity, (smh, smw)).astype(np.float32)
+
+
+def _upsample_rows(noise: np.ndarray, y0: int, y1: int, ht: int, wd: int) -> np.ndarray:
+    """
+    Rows [y0, y1) of `noise` bilinearly upsampled to ht x wd (pixel-centre
+    aligned, like cv2.INTER_LINEAR). Each output row depends only on its own
+    index, so any row band matches the same rows of the full-size field.
+    """
+    smh = noise.shape[0]
+    fy = (np.arange(y0, y1, dtype=np.float64) + 0.5) * (smh / ht) - 0.5
+    sy = np.floor(fy)
+    wy = (fy - sy).astype(np.float32)[:, np.newaxis]
+    lo = np.clip(sy.astype(np.int64), 0, smh - 1)
+    hi = np.clip(sy.astype(np.int64) + 1, 0, smh - 1)
+    r0, r1 = int(lo.min()), int(hi.max()) + 1
+    # Horizontal pass only (source height kept), then lerp between source rows
+    band = cv2.resize(noise[r0:r1], (wd, r1 - r0), interpolation=cv2.INTER_LINEAR)
+    top, bottom = band[lo - r0], band[hi - r0]
+    return top + (bottom - top) * wy
+
+
+def _step_grain(result: np.ndarray, preset: dict, intensity: float,
+                region: dict | None = None) -> np.ndarray:
+    """Grain."""
     gr = preset.get('grain_amount', 0.0)
     if gr > 0.5:
-        ht, wd = result.shape[:2]
-        sz = max(1, int(preset.get('grain_size', 25.0) / 25.0 * 4))
-        smh, smw = max(1, ht // sz), max(1, wd // sz)
-        noise = np.random.normal(0, (gr / 100.0) * 25.0 * intensity, (smh, smw)).astype(np.float32)
-        noise = cv2.resize(noise, (wd, ht), interpolation=cv2.INTER_LINEAR)
-        result += noise[:, :, np.newaxis]
-
-    # --- Tone curve (custom points) ---
-    tc = preset.get('tone_curve')
-    if tc and len(tc) >= 2:
-        pts = np.array(tc, dtype=np.float64)
-        lut = np.interp(np.arange(256), pts[:, 0], pts[:, 1]).astype(np.float32)
-        ident = np.arange(256, dtype=np.float32)
-        blut = np.clip(ident * (1 - intensity) + lut * intensity, 0, 255).astype(np.uint8)
-        lab = cv2.cvtColor(np.clip(result, 0, 255).astype(np.uint8), cv2.COLOR_BGR2LAB)
-        lab[:, :, 0] = blut[lab[:, :, 0]]
-        result = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR).astype(np.float32)
+        rows, wd = result.shape[:2]
+        if region:
+            y0, ht, noise = region["y0"], region["height"], region["grain"]
+        else:
+            y0, ht, noise = 0, rows, _grain_field(preset, intensity, rows, wd)
+        result += _upsample_rows(noise, y0, y0 + rows, ht, wd)[:, :, np.newaxis]
+    return result
 
-    return np.clip(result, 0, 255).astype(np.uint8)
+
+def _step_tone_curve(result: np.ndarray, preset: dict, intensity: float) -> np.ndarray:
+    """Tone curve (custom points)."""
+    return _run_colour_step("tone_curve", result, preset, intensity)
+
+
+# Engine order. Spatial steps depend on neighbouring pixels or position and
+# can't be folded into a colour LUT (see preset_compiler).
+PRESET_STEPS = (
+    ("exposure", _step_exposure, False),
+    ("temperature", _step_temperature, False),
+    ("contrast", _step_contrast, False),
+    ("tones", _step_tones, False),
+    ("hsl", _step_hsl, False),
+    ("split_toning", _step_split_toning, False),
+    ("clarity", _step_clarity, True),
+    ("vibrance", _step_vibrance, False),
+    ("sharpen", _step_sharpen, True),
+    ("vignette", _step_vignette, True),
+    ("grain", _step_grain, True),
+    ("tone_curve", _step_tone_curve, False),
+)
+
+
+def preset_halo(preset: dict, hsl_blur: bool = True) -> int:
+    """Rows of context a strip needs on each side for its core to match the full frame."""
+    halo = 0
+    if hsl_blur and any(k.startswith('hsl_') for k in preset):
+        halo += HSL_MASK_RADIUS
+    if abs(preset.get('clarity', 0.0)) > 0.5:
+        halo += gaussian_radius(CLARITY_SIGMA)
+    if preset.get('sharpness', 0.0) > 1.0:
+        halo += gaussian_radius(max(0.5, preset.get('sharpen_radius', 1.0)))
+    return halo
+
+
+def frame_grain(preset: dict, intensity: float, ht: int, wd: int) -> np.ndarray | None:
+    """Draw the frame's grain field up front so every strip shares it."""
+    if preset.get('grain_amount', 0.0) > 0.5:
+        return _grain_field(preset, intensity, ht, wd)
+    return None
+
+
+def preset_hash(preset: dict) -> str:
+    """Stable content hash of a parsed preset dict."""
+    blob = json.dumps(preset, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class PresetPlan:
+    """
+    A preset at one intensity, ready for the per-step engine: colour steps
+    carry their pre-built tables (COLOUR_TABLES), spatial steps run as-is.
+    Output is identical to running PRESET_STEPS. Immutable once built, so
+    one plan is shared by every photo and thread (see preset_plan()).
+    """
+
+    __slots__ = ("preset", "intensity", "stages", "halo")
+
+    def __init__(self, preset: dict, intensity: float = 1.0):
+        self.preset = copy.deepcopy(preset)
+        self.intensity = intensity
+        stages = []
+        for name, step, spatial in PRESET_STEPS:
+            if spatial:
+                stages.append((step, None))
+                continue
+            build, apply = COLOUR_TABLES[name]
+            table = build(self.preset, intensity)
+            if table is not None:
+                stages.append((apply, table))
+        self.stages = tuple(stages)
+        self.halo = preset_halo(self.preset)
+
+    def apply(self, img: np.ndarray, tile_rows: Optional[int] = None) -> np.ndarray:
+        if not self.preset:
+            return img
+        ht, wd = img.shape[:2]
+        grain = frame_grain(self.preset, self.intensity, ht, wd)
+
+        def run(strip: np.ndarray, y0: int) -> np.ndarray:
+            region = {"y0": y0, "height": ht, "grain": grain}
+            result = strip.astype(np.float32)
+            for fn, table in self.stages:
+                if table is None:
+                    result = fn(result, self.preset, self.intensity, region=region)
+                else:
+                    result = fn(result, table)
+            return np.clip(result, 0, 255).astype(np.uint8)
+
+        return run_in_strips(img, run, self.halo, tile_rows)
+
+
+_plan_cache: "OrderedDict[tuple, PresetPlan]" = OrderedDict()
+_plan_cache_lock = threading.Lock()
+_plan_cache_stats = {"hits": 0, "misses": 0}
+
+
+def preset_plan(preset: dict, intensity: float = 1.0) -> PresetPlan:
+    """PresetPlan for (preset content, intensity), from the worker LRU when possible."""
+    key = (preset_hash(preset), round(float(intensity), 4))
+    with _plan_cache_lock:
+        plan = _plan_cache.get(key)
+        if plan is not None:
+            _plan_cache.move_to_end(key)
+            _plan_cache_stats["hits"] += 1
+            return plan
+        _plan_cache_stats["misses"] += 1
+
+    plan = PresetPlan(preset, intensity)
+    with _plan_cache_lock:
+        _plan_cache[key] = plan
+        _plan_cache.move_to_end(key)
+        while len(_plan_cache) > max(1, get_settings().compiled_preset_cache_size):
+            _plan_cache.popitem(last=False)
+    return plan
+
+
+def preset_plan_cache_info() -> dict:
+    with _plan_cache_lock:
+        return {**_plan_cache_stats, "size": len(_plan_cache)}
+
+
+def apply_preset_params(img: np.ndarray, preset: dict, intensity: float = 1.0,
+                        tile_rows: Optional[int] = None) -> np.ndarray:
+    """
+    Apply parsed Lightroom preset parameters to an image.
+    The preset's tables come from the cached PresetPlan, so a gallery
+    sharing a preset builds them once. Large frames are processed in
+    halo-padded strips (see app.pipeline.tiling); the result is identical
+    to a single full-frame pass.
+    """
+    if not preset:
+        return img
+    return preset_plan(preset, intensity).apply(img, tile_rows)
 
 
 # ═══════════════════════════════════════════════════════════════
 # REFERENCE IMAGE LEARNING (TIER B)
 # ═══════════════════════════════════════════════════════════════
 
+_LEVELS = np.arange(256, dtype=np.float64)
+# L < 85 → 0 (shadows), 85..170 → 1 (midtones), > 170 → 2 (highlights)
+_TONE_ZONE = np.digitize(np.arange(256), [85, 171]).astype(np.uint8)
+
+
+def _hist_mean_std(hist: np.ndarray) -> tuple[float, float]:
+    """Mean / std of 8-bit data from its 256-bin count histogram."""
+    n = hist.sum()
+    mean = float(np.dot(_LEVELS, hist) / n)
+    var = float(np.dot((_LEVELS - mean) ** 2, hist) / n)
+    return mean, float(np.sqrt(var))
+
+
+def _hist_percentiles(hist: np.ndarray, pcts: list) -> list[float]:
+    """np.percentile (linear) of 8-bit data from its count histogram, without sorting."""
+    cum = np.cumsum(hist)
+    n = int(cum[-1])
+    k = np.asarray(pcts, dtype=np.float64) / 100.0 * (n - 1)
+    lo = np.floor(k).astype(np.int64)
+    hi = np.minimum(lo + 1, n - 1)
+    # value of the i-th smallest sample = first level whose cumulative count exceeds i
+    v_lo = np.searchsorted(cum, lo, side="right").astype(np.float64)
+    v_hi = np.searchsorted(cum, hi, side="right").astype(np.float64)
+    return (v_lo + (k - lo) * (v_hi - v_lo)).tolist()
+
+
 def compute_channel_stats(img_array: np.ndarray) -> dict:
-    """Compute per-channel statistics for a single image."""
+    """
+    Compute per-channel statistics for a single image.
+
+    Everything is derived from one 256-bin histogram per channel (plus
+    zone-weighted sums of a/b for the shadow/highlight casts), so each
+    channel is read once instead of once per statistic.
+    """
     if len(img_array.shape) == 2:
         img_array = cv2.cvtColor(img_array, cv2.COLOR_GRAY2BGR)
 
-    lab = cv2.cvtColor(img_array, cv2.COLOR_BGR2LAB).astype(float)
-    bgr = img_array.astype(float)
-    hsv = cv2.cvtColor(img_array, cv2.COLOR_BGR2HSV).astype(float)
+    lab = cv2.cvtColor(img_array, cv2.COLOR_BGR2LAB)
+    hsv = cv2.cvtColor(img_array, cv2.COLOR_BGR2HSV)
     stats = {}
 
-    for i, name in enumerate(["b", "g", "r"]):
-        ch = bgr[:, :, i]
-        hist, _ = np.histogram(ch, bins=256, range=(0, 256))
-        hist = hist.astype(float) / hist.sum()
-        stats[f"hist_{name}"] = hist.tolist()
-        stats[f"mean_{name}"] = float(np.mean(ch))
-        stats[f"std_{name}"] = float(np.std(ch))
-
-    for i, name in enumerate(["l", "a", "b_lab"]):
-        ch = lab[:, :, i]
-        hist, _ = np.histogram(ch, bins=256, range=(0, 256))
-        hist = hist.astype(float) / hist.sum()
-        stats[f"hist_{name}"] = hist.tolist()
-        stats[f"mean_{name}"] = float(np.mean(ch))
-        stats[f"std_{name}"] = float(np.std(ch))
-
-    stats["mean_saturation"] = float(np.mean(hsv[:, :, 1]))
-    stats["mean_value"] = float(np.mean(hsv[:, :, 2]))
-    stats["std_saturation"] = float(np.std(hsv[:, :, 1]))
-
-    L = lab[:, :, 0]
-    stats["shadow_mean"] = float(np.mean(L[L < 85])) if np.any(L < 85) else 40.0
-    stats["midtone_mean"] = float(np.mean(L[(L >= 85) & (L <= 170)])) if np.any((L >= 85) & (L <= 170)) else 128.0
-    stats["highlight_mean"] = float(np.mean(L[L > 170])) if np.any(L > 170) else 200.0
-    stats["wb_a"] = float(np.mean(lab[:, :, 1]))
-    stats["wb_b"] = float(np.mean(lab[:, :, 2]))
+    def channel_hist(ch: np.ndarray) -> np.ndarray:
+        return np.bincount(ch.ravel(), minlength=256).astype(np.float64)
+
+    hists = {}
+    for src, names in ((img_array, ["b", "g", "r"]), (lab, ["l", "a", "b_lab"])):
+        for i, name in enumerate(names):
+            hist = channel_hist(src[:, :, i])
+            hists[name] = hist
+            stats[f"hist_{name}"] = (hist / hist.sum()).tolist()
+            stats[f"mean_{name}"], stats[f"std_{name}"] = _hist_mean_std(hist)
+
+    stats["mean_saturation"], stats["std_saturation"] = _hist_mean_std(channel_hist(hsv[:, :, 1]))
+    stats["mean_value"], _ = _hist_mean_std(channel_hist(hsv[:, :, 2]))
+
+    l_hist = hists["l"]
+    zone_count = np.bincount(_TONE_ZONE, weights=l_hist, minlength=3)
+    zone_sum = np.bincount(_TONE_ZONE, weights=l_hist * _LEVELS, minlength=3)
+    defaults = (40.0, 128.0, 200.0)
+    for z, name in enumerate(["shadow_mean", "midtone_mean", "highlight_mean"]):
+        stats[name] = float(zone_sum[z] / zone_count[z]) if zone_count[z] else defaults[z]
+    stats["wb_a"] = stats["mean_a"]
+    stats["wb_b"] = stats["mean_b_lab"]
 
     # Tone curve learning — capture the actual luminance distribution
-    # Black point: what's the minimum L value that has significant data?
-    l_hist, _ = np.histogram(L.flatten(), bins=256, range=(0, 256))
-    l_hist_norm = l_hist.astype(float) / l_hist.sum()
-    cum = 0.0
-    black_point = 0
-    for v in range(256):
-        cum += l_hist_norm[v]
-        if cum > 0.005:  # 0.5% threshold
-            black_point = v
-            break
-    stats["black_point"] = black_point
-
-    # White point
-    cum = 0.0
-    white_point = 255
-    for v in range(255, -1, -1):
-        cum += l_hist_norm[v]
-        if cum > 0.005:
-            white_point = v
-            break
-    stats["white_point"] = white_point
+    # Black / white point: first level from either end past 0.5% of pixels
+    l_hist_norm = l_hist / l_hist.sum()
+    above = np.cumsum(l_hist_norm) > 0.005
+    stats["black_point"] = int(np.argmax(above)) if above.any() else 0
+    above = np.cumsum(l_hist_norm[::-1]) > 0.005
+    stats["white_point"] = 255 - int(np.argmax(above)) if above.any() else 255
 
     # Percentile luminance values (for tone curve shape)
-    flat_L = L.flatten()
-    for pct in [5, 10, 25, 50, 75, 90, 95]:
-        stats[f"l_p{pct}"] = float(np.percentile(flat_L, pct))
-
-    # Shadow colour cast (average a/b in shadows)
-    shadow_mask = L < 85
-    if np.any(shadow_mask):
-        stats["shadow_a"] = float(np.mean(lab[:, :, 1][shadow_mask]))
-        stats["shadow_b"] = float(np.mean(lab[:, :, 2][shadow_mask]))
-
-    # Highlight colour cast
-    highlight_mask = L > 170
-    if np.any(highlight_mask):
-        stats["highlight_a"] = float(np.mean(lab[:, :, 1][highlight_mask]))
-        stats["highlight_b"] = float(np.mean(lab[:, :, 2][highlight_mask]))
+    pcts = [5, 10, 25, 50, 75, 90, 95]
+    for pct, val in zip(pcts, _hist_percentiles(l_hist, pcts)):
+        stats[f"l_p{pct}"] = val
+
+    # Shadow / highlight colour cast (average a/b per tone zone)
+    zone = cv2.LUT(lab[:, :, 0], _TONE_ZONE).ravel()
+    a_sum = np.bincount(zone, weights=lab[:, :, 1].ravel(), minlength=3)
+    b_sum = np.bincount(zone, weights=lab[:, :, 2].ravel(), minlength=3)
+    for z, name in ((0, "shadow"), (2, "highlight")):
+        if zone_count[z]:
+            stats[f"{name}_a"] = float(a_sum[z] / zone_count[z])
+            stats[f"{name}_b"] = float(b_sum[z] / zone_count[z])
 
     return stats
 
 
-def train_style_profile(reference_images: list[np.ndarray], preset_params: dict | None = None) -> dict:
+def train_style_profile(reference_images: Iterable[np.ndarray], preset_params: dict | None = None) -> dict:
     """
     Build a style profile. Two tiers:
     - Tier A (preset_params): Exact LR parameters stored directly
     - Tier B (reference_images): Statistical learning aggregated
+
+    reference_images may be any iterable (e.g. a generator decoding one
+    image at a time); each is reduced to its stats and dropped.
     """
-    if not reference_images and not preset_params:
+    from app.pipeline.style_stats import StyleStatsAccumulator
+
+    acc = StyleStatsAccumulator()
+    for img in reference_images or ():
+        acc.add(compute_channel_stats(img))
+    num_images = max(acc.count.values(), default=0)
+
+    if not num_images and not preset_params:
         return {"error": "No reference images or preset provided"}
 
-    log.info(f"Training style from {len(reference_images)} reference images"
+    log.info(f"Training style from {num_images} reference images"
              f"{' + preset baseline' if preset_params else ''}")
 
     profile = {"version": "2.0", "has_preset": preset_params is not None}
@@ -297,17 +625,9 @@ def train_style_profile(reference_images: list[np.ndarray], preset_params: dict
     if preset_params:
         profile["preset"] = preset_params
 
-    if reference_images:
-        all_stats = [compute_channel_stats(img) for img in reference_images]
-        ref = {}
-        for key in all_stats[0].keys():
-            vals = [s[key] for s in all_stats if key in s]
-            if isinstance(vals[0], list):
-                ref[key] = np.mean(np.array(vals), axis=0).tolist()
-            else:
-                ref[key] = float(np.mean(vals))
-        profile["reference"] = ref
-        profile["num_reference_images"] = len(reference_images)
+    if num_images:
+        profile["reference"] = acc.reference()
+        profile["num_reference_images"] = num_images
 
     return profile
 
@@ -316,17 +636,25 @@ def train_style_profile(reference_images: list[np.ndarray], preset_params: dict
 # STYLE APPLICATION (COMBINED)
 # ═══════════════════════════════════════════════════════════════
 
-def histogram_match_channel(source: np.ndarray, target_hist: np.ndarray) -> np.ndarray:
-    """Match source channel histogram to target distribution."""
-    src_hist, _ = np.histogram(source.flatten(), bins=256, range=(0, 256))
+# Strengths used when a profile is applied to a single photo (restyle) and
+# when it is sampled into a LUT for export
+REFERENCE_INTENSITY = 0.75
+PRESET_INTENSITY = 0.85
+PRESET_OVER_REFERENCE_INTENSITY = 0.5
+
+
+def histogram_match_mapping(source: np.ndarray, target_hist: np.ndarray) -> np.ndarray:
+    """256-entry uint8 mapping that matches source's histogram to target distribution."""
+    src_hist = np.bincount(source.ravel(), minlength=256)[:256]
     src_cdf = np.cumsum(src_hist).astype(float)
     src_cdf /= src_cdf[-1]
     tgt_cdf = np.cumsum(target_hist).astype(float)
     tgt_cdf /= tgt_cdf[-1]
-    mapping = np.zeros(256, dtype=np.uint8)
-    for v in range(256):
-        mapping[v] = np.argmin(np.abs(src_cdf[v] - tgt_cdf))
-    return mapping[source]
+    # Nearest target CDF value per source level, ties → lowest level
+    # (same choice as argmin over |src_cdf[v] - tgt_cdf|)
+    hi = np.minimum(np.searchsorted(tgt_cdf, src_cdf, side="left"), 255)
+    lo = np.searchsorted(tgt_cdf, tgt_cdf[np.maximum(hi - 1, 0)], side="left")
+    return np.where(np.abs(src_cdf - tgt_cdf[lo]) <= np.abs(src_cdf - tgt_cdf[hi]), lo, hi).astype(np.uint8)
 
 
 def compute_adaptive_adjustments(image_context: dict) -> dict:
@@ -437,6 +765,7 @@ def apply_style(img_array: np.ndarray, style_profile: dict, intensity: float = 0
                 image_context: dict | None = None) -> np.ndarray:
     """
     Apply style to an image.
+    - With a .cube LUT: apply the LUT in a single pass
     - With preset: apply preset params with per-image adaptive adjustments
     - Without preset: apply basic adaptive adjustments only (exposure, contrast, etc.)
     - Reference histogram matching is DISABLED — produces poor results on CPU.
@@ -445,6 +774,14 @@ def apply_style(img_array: np.ndarray, style_profile: dict, intensity: float = 0
     if len(img_array.shape) == 2:
         img_array = cv2.cvtColor(img_array, cv2.COLOR_GRAY2BGR)
 
+    # LUT profile (imported .cube): one interpolation pass, nothing adaptive
+    if style_profile.get("lut"):
+        from app.pipeline.cube_lut import apply_cube_lut, load_cube_lut
+        lut = load_cube_lut(style_profile["lut"]["key"])
+        if lut is not None:
+            return apply_cube_lut(img_array, lut)
+        log.warning(f"Could not load LUT {style_profile['lut'].get('key')} — falling back")
+
     image_context = image_context or {}
     adjustments = compute_adaptive_adjustments(image_context)
 
@@ -550,6 +887,9 @@ def apply_preset_adaptive(img_array: np.ndarray, preset: dict, adj: dict,
     base_vig = adapted.get("vignette_amount", 0.0)
     adapted["vignette_amount"] = base_vig * adj["vignette_mod"]
 
+    from app.pipeline.preset_compiler import apply_preset_compiled, preset_engine_compiled
+    if preset_engine_compiled():
+        return apply_preset_compiled(img_array, adapted, intensity=intensity)
     return apply_preset_params(img_array, adapted, intensity=intensity)
 
 
@@ -558,7 +898,25 @@ def _apply_reference_style(img_array: np.ndarray, ref: dict, intensity: float,
     """
     Apply reference-learned style using multi-method approach with adaptive adjustments.
     """
+    result, _ = _reference_pass(img_array, ref, intensity, adj)
+    return result
+
+
+def _reference_pass(img_array: np.ndarray, ref: dict, intensity: float, adj: dict | None = None,
+                    plan: dict | None = None, skin_blur: bool = True) -> tuple[np.ndarray, dict]:
+    """
+    Body of _apply_reference_style, split into fit and apply.
+
+    The image-dependent terms (histogram-match mappings, percentile tone
+    curve, current shadow/highlight casts, saturation ratio) are measured on
+    img_array when `plan` is None and returned in the plan. Passing a plan
+    back in reuses those terms, which turns the style into a fixed per-pixel
+    colour transform (used to sample it into a LUT). `skin_blur=False` drops
+    the spatial feather on the skin mask for the same reason.
+    """
     adj = adj or {}
+    fit = plan is None
+    plan = {} if fit else plan
     result = img_array.copy()
 
     # Skin protection — strength adapted per scene
@@ -566,7 +924,8 @@ def _apply_reference_style(img_array: np.ndarray, ref: dict, intensity: float,
     ycrcb = cv2.cvtColor(img_array, cv2.COLOR_BGR2YCrCb)
     skin = ((ycrcb[:, :, 1] >= 133) & (ycrcb[:, :, 1] <= 173) &
             (ycrcb[:, :, 2] >= 77) & (ycrcb[:, :, 2] <= 127)).astype(np.float32)
-    skin = cv2.GaussianBlur(skin, (21, 21), 0)
+    if skin_blur:
+        skin = cv2.GaussianBlur(skin, (21, 21), 0)
     skin_prot = 1.0 - (skin * skin_strength)
 
     # ── 1. PRIMARY: LAB histogram matching ──
@@ -574,10 +933,12 @@ def _apply_reference_style(img_array: np.ndarray, ref: dict, intensity: float,
     has_lab_hist = all(f"hist_{c}" in ref for c in ["l", "a", "b_lab"])
     if has_lab_hist:
         lab = cv2.cvtColor(img_array, cv2.COLOR_BGR2LAB)
+        if fit:
+            plan["lab_maps"] = [histogram_match_mapping(lab[:, :, i], np.array(ref[f"hist_{ch}"]))
+                                for i, ch in enumerate(["l", "a", "b_lab"])]
         lab_matched = lab.copy()
-        for i, ch in enumerate(["l", "a", "b_lab"]):
-            target_hist = np.array(ref[f"hist_{ch}"])
-            lab_matched[:, :, i] = histogram_match_channel(lab[:, :, i], target_hist)
+        for i in range(3):
+            lab_matched[:, :, i] = cv2.LUT(np.ascontiguousarray(lab[:, :, i]), plan["lab_maps"][i])
 
         # Blend: strong on colour channels, moderate on luminance
         lab_float = lab.astype(np.float32)
@@ -598,10 +959,12 @@ def _apply_reference_style(img_array: np.ndarray, ref: dict, intensity: float,
     # Adds per-channel colour grading that LAB might miss
     has_bgr_hist = all(f"hist_{c}" in ref for c in ["b", "g", "r"])
     if has_bgr_hist:
+        if fit:
+            plan["bgr_maps"] = [histogram_match_mapping(result[:, :, i], np.array(ref[f"hist_{ch}"]))
+                                for i, ch in enumerate(["b", "g", "r"])]
         bgr_matched = result.copy()
-        for i, ch in enumerate(["b", "g", "r"]):
-            target_hist = np.array(ref[f"hist_{ch}"])
-            bgr_matched[:, :, i] = histogram_match_channel(result[:, :, i], target_hist)
+        for i in range(3):
+            bgr_matched[:, :, i] = cv2.LUT(np.ascontiguousarray(result[:, :, i]), plan["bgr_maps"][i])
 
         # Lighter blend since LAB already did the heavy lifting
         bgr_blend = intensity * 0.35 * skin_prot
@@ -615,19 +978,20 @@ def _apply_reference_style(img_array: np.ndarray, ref: dict, intensity: float,
     if "l_p5" in ref and "l_p95" in ref:
         lab = cv2.cvtColor(result, cv2.COLOR_BGR2LAB)
         L = lab[:, :, 0]
-        flat_L = L.flatten().astype(np.float64)
-        src_pts = [0.0]
-        tgt_pts = [max(ref.get("black_point", 0), 0)]
-        for pct in [5, 10, 25, 50, 75, 90, 95]:
-            src_pts.append(float(np.percentile(flat_L, pct)))
-            tgt_pts.append(ref.get(f"l_p{pct}", src_pts[-1]))
-        src_pts.append(255.0)
-        tgt_pts.append(min(ref.get("white_point", 255), 255))
-        lut = np.interp(np.arange(256), src_pts, tgt_pts).astype(np.float32)
-        ident = np.arange(256, dtype=np.float32)
-        tc_blend = intensity * 0.6
-        blended = np.clip(ident * (1 - tc_blend) + lut * tc_blend, 0, 255).astype(np.uint8)
-        lab[:, :, 0] = blended[L]
+        if fit:
+            flat_L = L.flatten().astype(np.float64)
+            src_pts = [0.0]
+            tgt_pts = [max(ref.get("black_point", 0), 0)]
+            for pct in [5, 10, 25, 50, 75, 90, 95]:
+                src_pts.append(float(np.percentile(flat_L, pct)))
+                tgt_pts.append(ref.get(f"l_p{pct}", src_pts[-1]))
+            src_pts.append(255.0)
+            tgt_pts.append(min(ref.get("white_point", 255), 255))
+            lut = np.interp(np.arange(256), src_pts, tgt_pts).astype(np.float32)
+            ident = np.arange(256, dtype=np.float32)
+            tc_blend = intensity * 0.6
+            plan["tone_lut"] = np.clip(ident * (1 - tc_blend) + lut * tc_blend, 0, 255).astype(np.uint8)
+        lab[:, :, 0] = plan["tone_lut"][L]
         result = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
 
     # ── 4. Lifted blacks ──
@@ -646,28 +1010,32 @@ def _apply_reference_style(img_array: np.ndarray, ref: dict, intensity: float,
         lab = cv2.cvtColor(result, cv2.COLOR_BGR2LAB).astype(np.float32)
         L = lab[:, :, 0]
         shadow_mask = np.clip((85.0 - L) / 85.0, 0, 1)
-        cur_sa = np.mean(lab[:, :, 1][L < 85]) if np.any(L < 85) else 128.0
-        cur_sb = np.mean(lab[:, :, 2][L < 85]) if np.any(L < 85) else 128.0
-        lab[:, :, 1] += shadow_mask * (ref["shadow_a"] - cur_sa) * intensity * 0.7
-        lab[:, :, 2] += shadow_mask * (ref["shadow_b"] - cur_sb) * intensity * 0.7
+        if fit:
+            plan["cur_sa"] = np.mean(lab[:, :, 1][L < 85]) if np.any(L < 85) else 128.0
+            plan["cur_sb"] = np.mean(lab[:, :, 2][L < 85]) if np.any(L < 85) else 128.0
+        lab[:, :, 1] += shadow_mask * (ref["shadow_a"] - plan["cur_sa"]) * intensity * 0.7
+        lab[:, :, 2] += shadow_mask * (ref["shadow_b"] - plan["cur_sb"]) * intensity * 0.7
         if "highlight_a" in ref and "highlight_b" in ref:
             hi_mask = np.clip((L - 170.0) / 85.0, 0, 1)
-            cur_ha = np.mean(lab[:, :, 1][L > 170]) if np.any(L > 170) else 128.0
-            cur_hb = np.mean(lab[:, :, 2][L > 170]) if np.any(L > 170) else 128.0
-            lab[:, :, 1] += hi_mask * (ref["highlight_a"] - cur_ha) * intensity * 0.5
-            lab[:, :, 2] += hi_mask * (ref["highlight_b"] - cur_hb) * intensity * 0.5
+            if fit:
+                plan["cur_ha"] = np.mean(lab[:, :, 1][L > 170]) if np.any(L > 170) else 128.0
+                plan["cur_hb"] = np.mean(lab[:, :, 2][L > 170]) if np.any(L > 170) else 128.0
+            lab[:, :, 1] += hi_mask * (ref["highlight_a"] - plan["cur_ha"]) * intensity * 0.5
+            lab[:, :, 2] += hi_mask * (ref["highlight_b"] - plan["cur_hb"]) * intensity * 0.5
         result = cv2.cvtColor(np.clip(lab, 0, 255).astype(np.uint8), cv2.COLOR_LAB2BGR)
 
     # ── 6. Saturation ──
     if "mean_saturation" in ref:
         hsv = cv2.cvtColor(result, cv2.COLOR_BGR2HSV).astype(np.float32)
-        cur_sat = max(np.mean(hsv[:, :, 1]), 1e-6)
-        tgt_sat = ref["mean_saturation"]
-        ratio = max(0.4, min(2.5, tgt_sat / cur_sat))
+        if fit:
+            cur_sat = max(np.mean(hsv[:, :, 1]), 1e-6)
+            tgt_sat = ref["mean_saturation"]
+            plan["sat_ratio"] = max(0.4, min(2.5, tgt_sat / cur_sat))
+        ratio = plan["sat_ratio"]
         hsv[:, :, 1] = hsv[:, :, 1] * (1.0 + (ratio - 1.0) * intensity * 0.8)
         result = cv2.cvtColor(np.clip(hsv, 0, 255).astype(np.uint8), cv2.COLOR_HSV2BGR)
 
-    return result
+    return result, plan
 
 
 # ═══════════════════════════════════════════════════════════════
@@ -705,6 +1073,52 @@ def load_image_from_bytes(image_bytes: bytes) -> Optional[np.ndarray]:
         return None
 
 
+
+# libjpeg DCT scaling: decode at 1/8, 1/4 or 1/2 size without a full-size pass
+_JPEG_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def load_image_proxy(image_bytes: bytes, max_dim: int, filename: str = "") -> Optional[np.ndarray]:
+    """
+    Decode image bytes straight to a BGR proxy whose long side is at most max_dim.
+
+    JPEGs are decoded at the smallest DCT scale that is still at least
+    max_dim, RAW files (by extension) from their embedded preview; both are
+    then area-resized. Anything else goes through load_image_from_bytes.
+    Meant for statistics, where a full-resolution decode is wasted work.
+    """
+    from app.pipeline.phase0_analysis import decode_raw_preview, is_raw_file
+
+    img = None
+    if image_bytes[:3] == b"\xff\xd8\xff":
+        flag = cv2.IMREAD_COLOR
+        try:
+            w, h = Image.open(io.BytesIO(image_bytes)).size  # header only
+            for factor, reduced in _JPEG_REDUCED_FLAGS:
+                if max(w, h) / factor >= max_dim:
+                    flag = reduced
+                    break
+        except Exception:
+            pass
+        img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), flag)
+    elif filename and is_raw_file(filename):
+        img = decode_raw_preview(image_bytes, max_dim)
+
+    if img is None:
+        img = load_image_from_bytes(image_bytes)
+        if img is None:
+            return None
+
+    h, w = img.shape[:2]
+    if max(h, w) > max_dim:
+        scale = max_dim / max(h, w)
+        img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+    return img
+
 # ── Orchestrator wrapper (CPU fallback) ────────────────────────
 async def run_phase1(photo: dict, supabase_client) -> dict:
     """CPU-based style application fallback when GPU unavailable."""
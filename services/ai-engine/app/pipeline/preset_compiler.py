@@ -0,0 +1,296 @@
+"""
+Preset compiler — bake a Lightroom preset's global colour ops into a 3D LUT.
+
+apply_preset_params() runs every adjustment as a full-frame pass, each one a
+uint8 ↔ float32 and BGR ↔ LAB/HSV round trip. All of the per-pixel colour ops
+(exposure, temperature/tint, contrast, tones, HSL, split toning, vibrance,
+saturation, tone curve) are a pure function of the input BGR value, so we run
+them once over a lattice of colours and apply the result with trilinear
+interpolation. Only the truly spatial ops (clarity, sharpening, vignette,
+grain) stay as separate passes, in their original position in the chain.
+
+Stages are fused greedily: consecutive colour ops become one LUT, and a
+spatial op that is inactive for this preset doesn't split them.
+
+Compiled presets are immutable and cached per worker in an LRU keyed by
+(preset content hash, intensity), so every photo in a gallery that shares a
+preset (or lands on the same adaptive adjustments) skips the bake and pays
+only for the pixel work. The tone curve and HSL tables are folded into the
+baked LUT, so nothing per-preset is rebuilt per image.
+
+The lattice is the .cube one (k * 255 / (N - 1)), so 0 and 255 are lattice
+points and apply_lut3d's default spacing matches the bake. The engine only
+sees whole 8-bit levels, so each point holds the trilinear blend of the
+engine at the 8 integer colours around it.
+
+Known differences from apply_preset_params (tests/test_preset_compiler.py):
+- Interpolation error between lattice points. The engine truncates to uint8
+  after every step and its HSL / vibrance masks are hard hue thresholds, so
+  it isn't smooth: on 33³ expect about 1 level mean, 5-8 at p99, and up
+  to ~45 on isolated saturated colours near gamut and band edges
+- The HSL band masks are not feathered by the 5x5 blur; the LUT's
+  interpolation softens band edges in colour space instead
+
+Because of these, the per-step engine stays the default; set
+PRESET_ENGINE=compiled to opt in (see preset_engine_compiled).
+"""
+import copy
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from app.config import get_settings
+from app.pipeline.phase1_style import (
+    PRESET_STEPS, _step_hsl, _to_u8, frame_grain, preset_halo, preset_hash,
+)
+from app.pipeline.tiling import run_in_strips
+
+log = logging.getLogger(__name__)
+
+LUT_SIZE = 33
+ROWS_PER_CHUNK = 256
+
+# Spatial steps are skipped (and don't break LUT fusion) when these are False.
+# Thresholds match the guards in the step functions.
+_SPATIAL_ACTIVE = {
+    "clarity": lambda p: abs(p.get('clarity', 0.0)) > 0.5,
+    "sharpen": lambda p: p.get('sharpness', 0.0) > 1.0,
+    "vignette": lambda p: abs(p.get('vignette_amount', 0.0)) > 0.5,
+    "grain": lambda p: p.get('grain_amount', 0.0) > 0.5,
+}
+
+
+def preset_engine_compiled() -> bool:
+    """Whether presets render through compiled LUTs (PRESET_ENGINE=compiled) rather than per step."""
+    return get_settings().preset_engine == "compiled"
+
+
+def lattice_step(size: int) -> float:
+    """Spacing between lattice points, in 8-bit levels (the .cube spacing)."""
+    if size < 2:
+        raise ValueError(f"LUT size must be at least 2, got {size}")
+    return 255.0 / (size - 1)
+
+
+def _lattice_levels(size: int) -> np.ndarray:
+    """Lattice levels 0 .. 255 with exact endpoints."""
+    levels = np.arange(size, dtype=np.float64) * lattice_step(size)
+    levels[-1] = 255.0
+    return levels
+
+
+def identity_lattice(size: int) -> np.ndarray:
+    """(size, size, size, 3) BGR lattice, indexed [b, g, r]; float32 levels 0 .. 255."""
+    levels = _lattice_levels(size).astype(np.float32)
+    b, g, r = np.meshgrid(levels, levels, levels, indexing="ij")
+    return np.stack([b, g, r], axis=-1)
+
+
+COLOUR_STEPS = [step for _, step, spatial in PRESET_STEPS if not spatial]
+
+
+def run_colour_steps(result: np.ndarray, steps: list, preset: dict, intensity: float) -> np.ndarray:
+    """Run colour-only preset steps on an array of colours (no spatial feathering)."""
+    for step in steps:
+        if step is _step_hsl:
+            result = step(result, preset, intensity, blur_mask=False)
+        else:
+            result = step(result, preset, intensity)
+    return result
+
+
+def bake_lut(steps: list, preset: dict, intensity: float, size: int = LUT_SIZE) -> np.ndarray:
+    """
+    Run colour-only steps over the lattice → (size, size, size, 3) float32 LUT.
+
+    Lattice points fall between 8-bit levels, where the engine (which sees
+    uint8 images) isn't defined, so each point is the trilinear blend of the
+    engine at its 8 bracketing integer colours. Points on whole levels,
+    including 0 and 255, get the engine's value exactly.
+    """
+    levels = _lattice_levels(size)
+    lo = np.floor(levels)
+    hi = np.minimum(lo + 1.0, 255.0)
+    frac = levels - lo
+
+    lut = np.zeros((size, size, size, 3), dtype=np.float64)
+    for db in (0, 1):
+        for dg in (0, 1):
+            for dr in (0, 1):
+                vb, vg, vr = (hi if d else lo for d in (db, dg, dr))
+                wb, wg, wr = (frac if d else 1.0 - frac for d in (db, dg, dr))
+                weight = wb[:, None, None] * wg[None, :, None] * wr[None, None, :]
+                if not weight.any():
+                    continue
+                b, g, r = np.meshgrid(vb, vg, vr, indexing="ij")
+                grid = np.stack([b, g, r], axis=-1).astype(np.float32)
+                result = run_colour_steps(grid.reshape(size * size, size, 3), steps, preset, intensity)
+                lut += result.reshape(size, size, size, 3) * weight[..., None]
+    # Output is left unclipped: exposure alone can push past 255 before a
+    # vignette pulls it back, exactly as in the per-step engine.
+    return np.ascontiguousarray(lut, dtype=np.float32)
+
+
+def _lut_atlas(lut: np.ndarray) -> np.ndarray:
+    """(b, g, r) LUT → 2D atlas of g rows × (b-slice, r) columns for cv2.remap."""
+    size = lut.shape[0]
+    return np.ascontiguousarray(lut.transpose(1, 0, 2, 3).reshape(size, size * size, 3))
+
+
+def apply_lut3d(img: np.ndarray, lut: np.ndarray, rows: int = ROWS_PER_CHUNK,
+                step: Optional[float] = None) -> np.ndarray:
+    """
+    Apply a baked LUT to a uint8 BGR image with trilinear interpolation.
+
+    Trilinear = bilinear in (g, r) on the two bracketing b-slices, then a lerp
+    along b. The bilinear part is cv2.remap over a 2D atlas of the slices;
+    remap's 1/32 sub-pixel rounding shifts g and r by at most 1/64 of a cell
+    (~0.12 level on 33³; the lerp along b is exact). Works in row bands so temporaries stay small.
+    Returns float32.
+
+    `step` is the lattice spacing in 8-bit levels; it defaults to
+    lattice_step, the 255 / (size - 1) spacing of bake_lut and .cube files.
+    """
+    size = lut.shape[0]
+    step = step or lattice_step(size)
+    atlas = _lut_atlas(lut)
+
+    levels = np.arange(256, dtype=np.float32) / np.float32(step)
+    cell = np.minimum(np.floor(levels), size - 2)
+    pos_t = levels.reshape(256, 1)                               # g, r → lattice coordinate
+    slice_t = (cell * size).reshape(256, 1)                      # b → atlas column of its lower slice
+    frac_t = (levels - cell).reshape(256, 1)                     # b → weight of the upper slice
+
+    h, w = img.shape[:2]
+    out = np.empty((h, w, 3), dtype=np.float32)
+    for y0 in range(0, h, rows):
+        b, g, r = cv2.split(np.ascontiguousarray(img[y0:y0 + rows]))
+        map_x = cv2.LUT(b, slice_t) + cv2.LUT(r, pos_t)
+        map_y = cv2.LUT(g, pos_t)
+        wb = cv2.LUT(b, frac_t)[:, :, np.newaxis]
+        lo = cv2.remap(atlas, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        hi = cv2.remap(atlas, map_x + size, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        out[y0:y0 + rows] = lo + (hi - lo) * wb
+    return out
+
+
+class CompiledPreset:
+    """
+    A preset reduced to an ordered, immutable tuple of stages:
+      ("lut", ndarray)  — baked colour ops (read-only), applied with apply_lut3d
+      ("step", fn)      — a spatial step from phase1_style, applied as-is
+
+    Safe to share between threads and photos.
+    """
+
+    __slots__ = ("preset", "intensity", "lut_size", "stages", "halo")
+
+    def __init__(self, preset: dict, intensity: float, lut_size: int = LUT_SIZE):
+        preset = copy.deepcopy(preset)
+        stages = []
+
+        def flush(steps: list):
+            if not steps:
+                return
+            lut = bake_lut(steps, preset, intensity, lut_size)
+            if np.allclose(lut, identity_lattice(lut_size), atol=1e-3):
+                return  # every colour op in this run was inactive
+            lut.setflags(write=False)
+            stages.append(("lut", lut))
+
+        pending = []
+        for name, step, spatial in PRESET_STEPS:
+            if not spatial:
+                pending.append(step)
+                continue
+            if not _SPATIAL_ACTIVE[name](preset):
+                continue
+            flush(pending)
+            pending = []
+            stages.append(("step", step))
+        flush(pending)
+
+        object.__setattr__(self, "preset", preset)
+        object.__setattr__(self, "intensity", float(intensity))
+        object.__setattr__(self, "lut_size", lut_size)
+        object.__setattr__(self, "stages", tuple(stages))
+        object.__setattr__(self, "halo", preset_halo(preset, hsl_blur=False))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CompiledPreset is immutable")
+
+    def apply(self, img: np.ndarray, tile_rows: Optional[int] = None) -> np.ndarray:
+        """
+        Apply to a BGR uint8 image → BGR uint8. Large frames run in
+        halo-padded strips with output identical to a single pass.
+        """
+        if not self.stages:
+            return img
+        ht, wd = img.shape[:2]
+        grain = frame_grain(self.preset, self.intensity, ht, wd)
+
+        def run(strip: np.ndarray, y0: int) -> np.ndarray:
+            region = {"y0": y0, "height": ht, "grain": grain}
+            result = strip
+            for kind, obj in self.stages:
+                if kind == "lut":
+                    src = result if result.dtype == np.uint8 else _to_u8(result)
+                    result = apply_lut3d(src, obj)
+                else:
+                    if result.dtype != np.float32:
+                        result = result.astype(np.float32)
+                    result = obj(result, self.preset, self.intensity, region=region)
+            return np.clip(result, 0, 255).astype(np.uint8)
+
+        return run_in_strips(img, run, self.halo, tile_rows)
+
+
+# ── Compiled preset cache ─────────────────────────────────────
+
+_cache: "OrderedDict[tuple, CompiledPreset]" = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0}
+
+
+def compile_preset(preset: dict, intensity: float = 1.0, lut_size: int = LUT_SIZE) -> CompiledPreset:
+    """Compiled preset for (preset content, intensity), from the worker LRU when possible."""
+    key = (preset_hash(preset), round(float(intensity), 4), lut_size)
+    with _cache_lock:
+        compiled = _cache.get(key)
+        if compiled is not None:
+            _cache.move_to_end(key)
+            _cache_stats["hits"] += 1
+            return compiled
+        _cache_stats["misses"] += 1
+
+    # Bake outside the lock; a concurrent miss on the same key just bakes twice
+    compiled = CompiledPreset(preset, intensity, lut_size)
+    with _cache_lock:
+        _cache[key] = compiled
+        _cache.move_to_end(key)
+        while len(_cache) > max(1, get_settings().compiled_preset_cache_size):
+            _cache.popitem(last=False)
+    return compiled
+
+
+def compiled_cache_info() -> dict:
+    with _cache_lock:
+        return {**_cache_stats, "size": len(_cache)}
+
+
+def clear_compiled_cache():
+    with _cache_lock:
+        _cache.clear()
+        _cache_stats["hits"] = _cache_stats["misses"] = 0
+
+
+def apply_preset_compiled(img: np.ndarray, preset: dict, intensity: float = 1.0,
+                          lut_size: int = LUT_SIZE) -> np.ndarray:
+    """Drop-in for apply_preset_params() using the compiled LUT path."""
+    if not preset:
+        return img
+    return compile_preset(preset, intensity, lut_size).apply(img)
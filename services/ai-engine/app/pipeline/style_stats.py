@@ -0,0 +1,182 @@
+"""
+Mergeable style statistics — stream reference images into a profile.
+
+A reference-learned profile is the per-key mean of compute_channel_stats()
+over the reference set (each image weighted equally). Instead of holding a
+list of per-image stat dicts and averaging at the end, we keep one running
+accumulator per key:
+
+- count / mean / M2 (Welford), elementwise for the 256-bin histograms, so
+  the mean histogram is the normalised histogram sum over the set and the
+  spread of every statistic across references comes for free
+- the storage keys of the images folded in, with their content hashes and
+  the storage ETags they had when read, so a reference replaced under the
+  same key is noticed and re-read
+
+Accumulators support add(), remove() (Welford in reverse) and merge()
+(Chan et al.'s parallel update), so a retrain after a few references were
+added or removed only touches those images. They are persisted per profile
+under "{photographer_id}/styles/{profile_id}/stats/".
+
+Keys that are missing from some images (shadow_a when an image has no
+shadows) are averaged over the images that have them, as before.
+"""
+import io
+import json
+import logging
+from typing import Optional
+
+import numpy as np
+
+from app.storage.supabase_storage import download_photo, upload_photo
+
+log = logging.getLogger(__name__)
+
+
+class StyleStatsAccumulator:
+    """Running per-key count / mean / M2 over per-image channel stats."""
+
+    def __init__(self):
+        self.count: dict[str, int] = {}
+        self.mean: dict[str, np.ndarray] = {}
+        self.m2: dict[str, np.ndarray] = {}
+        self.is_list: dict[str, bool] = {}
+        self.members: dict[str, str] = {}  # storage key → content hash
+        self.etags: dict[str, str] = {}  # storage key → ETag when it was read
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.members
+
+    def add(self, stats: dict, key: Optional[str] = None, content_hash: str = "",
+            etag: Optional[str] = None):
+        """Fold one image's stats in."""
+        if key is not None:
+            if key in self.members:
+                return
+            self.members[key] = content_hash
+            if etag:
+                self.etags[key] = etag
+        for name, val in stats.items():
+            x = np.asarray(val, dtype=np.float64)
+            n = self.count.get(name, 0) + 1
+            if n == 1:
+                self.mean[name] = x.copy()
+                self.m2[name] = np.zeros_like(x)
+                self.is_list[name] = isinstance(val, list)
+            else:
+                delta = x - self.mean[name]
+                self.mean[name] += delta / n
+                self.m2[name] += delta * (x - self.mean[name])
+            self.count[name] = n
+
+    def remove(self, stats: dict, key: Optional[str] = None):
+        """Take one previously added image's stats back out."""
+        if key is not None:
+            if key not in self.members:
+                return
+            del self.members[key]
+            self.etags.pop(key, None)
+        for name, val in stats.items():
+            n = self.count.get(name, 0)
+            if n == 0:
+                continue
+            if n == 1:
+                for d in (self.count, self.mean, self.m2, self.is_list):
+                    d.pop(name, None)
+                continue
+            x = np.asarray(val, dtype=np.float64)
+            mean_prev = (n * self.mean[name] - x) / (n - 1)
+            self.m2[name] = np.maximum(self.m2[name] - (x - mean_prev) * (x - self.mean[name]), 0.0)
+            self.mean[name] = mean_prev
+            self.count[name] = n - 1
+
+    def merge(self, other: "StyleStatsAccumulator") -> "StyleStatsAccumulator":
+        """Combine another accumulator over a disjoint image set into this one."""
+        for name, nb in other.count.items():
+            na = self.count.get(name, 0)
+            if na == 0:
+                self.count[name] = nb
+                self.mean[name] = other.mean[name].copy()
+                self.m2[name] = other.m2[name].copy()
+                self.is_list[name] = other.is_list[name]
+                continue
+            n = na + nb
+            delta = other.mean[name] - self.mean[name]
+            self.mean[name] = self.mean[name] + delta * (nb / n)
+            self.m2[name] = self.m2[name] + other.m2[name] + delta ** 2 * (na * nb / n)
+            self.count[name] = n
+        self.members.update(other.members)
+        self.etags.update(other.etags)
+        return self
+
+    def std(self, name: str) -> np.ndarray:
+        """Population std of a statistic across the images folded in."""
+        return np.sqrt(self.m2[name] / self.count[name])
+
+    def reference(self) -> dict:
+        """Mean stats in the profile's "reference" JSON layout (lists / floats)."""
+        return {
+            name: mean.tolist() if self.is_list[name] else float(mean)
+            for name, mean in self.mean.items()
+        }
+
+    # ── Serialisation ────────────────────────────────────────
+
+    def to_bytes(self) -> bytes:
+        names = sorted(self.count)
+        meta = {
+            "names": names,
+            "count": [self.count[n] for n in names],
+            "is_list": [self.is_list[n] for n in names],
+            "members": self.members,
+            "etags": self.etags,
+        }
+        arrays = {}
+        for i, name in enumerate(names):
+            arrays[f"mean_{i}"] = self.mean[name]
+            arrays[f"m2_{i}"] = self.m2[name]
+        buf = io.BytesIO()
+        np.savez_compressed(buf, meta=np.array(json.dumps(meta)), **arrays)
+        return buf.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "StyleStatsAccumulator":
+        acc = cls()
+        with np.load(io.BytesIO(data), allow_pickle=False) as npz:
+            meta = json.loads(str(npz["meta"]))
+            for i, name in enumerate(meta["names"]):
+                acc.count[name] = int(meta["count"][i])
+                acc.is_list[name] = bool(meta["is_list"][i])
+                acc.mean[name] = npz[f"mean_{i}"].astype(np.float64)
+                acc.m2[name] = npz[f"m2_{i}"].astype(np.float64)
+        acc.members = dict(meta["members"])
+        acc.etags = dict(meta.get("etags") or {})
+        return acc
+
+
+def style_stats_key(photographer_id: str, profile_id: str, version: str) -> str:
+    return f"{photographer_id}/styles/{profile_id}/stats/style-stats-v{version}.npz"
+
+
+def load_style_stats(storage_key: str) -> StyleStatsAccumulator:
+    """Persisted accumulator for a profile (empty when there is none yet)."""
+    try:
+        data = download_photo(storage_key)
+        if data:
+            acc = StyleStatsAccumulator.from_bytes(data)
+            log.info(f"Style stats {storage_key}: {len(acc)} references")
+            return acc
+    except Exception as e:
+        log.warning(f"Could not load style stats {storage_key}: {e}")
+    return StyleStatsAccumulator()
+
+
+def save_style_stats(storage_key: str, acc: StyleStatsAccumulator) -> bool:
+    try:
+        return upload_photo(storage_key, acc.to_bytes(), "application/octet-stream") is not None
+    except Exception as e:
+        log.warning(f"Could not save style stats {storage_key}: {e}")
+        return False
@@ -0,0 +1,116 @@
+"""
+Strip tiling — run full-frame style ops in bounded memory.
+
+The style engines make several full-size float32 / LAB / HSV copies of the
+frame; on a 61 MP original that is well over 2 GB. Instead we process
+full-width horizontal strips, each padded with a halo of extra rows above
+and below that is at least as tall as the combined reach of every blur in
+the chain. The halo rows are computed and thrown away, so each strip's core
+sees exactly the neighbourhood it would see in the full frame and the
+output is pixel-identical to untiled processing.
+
+Strips are full width so horizontal filtering and the image's left/right
+borders behave exactly as untiled; only rows are split.
+
+Strips are independent, so they also run in parallel on a thread pool
+(settings.style_workers); OpenCV and numpy release the GIL for the heavy
+work. The memory budget is shared across the in-flight strips.
+"""
+import logging
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import numpy as np
+
+from app.config import get_settings
+
+log = logging.getLogger(__name__)
+
+# Rough peak working set of the style engines per pixel of strip
+# (float32 BGR result + float32 LAB/HSV copy + uint8 copies + blur plane)
+STRIP_BYTES_PER_PX = 48
+MIN_STRIP_ROWS = 64
+MAX_STYLE_WORKERS = 8  # default cap; strips are memory-bound past this
+
+
+def gaussian_radius(sigma: float) -> int:
+    """Reach of cv2.GaussianBlur(ksize=(0, 0), sigma) on a float32 image."""
+    ksize = int(round(sigma * 4 * 2 + 1)) | 1
+    return ksize // 2
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on (respects affinity / cpusets, unlike os.cpu_count())."""
+    try:
+        return len(os.sched_getaffinity(0)) or 1
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+
+def style_workers() -> int:
+    """
+    Threads for strip-parallel styling. settings.style_workers when set;
+    0 = this process's CPUs shared between the max_concurrent_images
+    images styled at once, capped at MAX_STYLE_WORKERS.
+    """
+    s = get_settings()
+    if s.style_workers > 0:
+        return s.style_workers
+    per_image = available_cpus() // max(1, s.max_concurrent_images)
+    return max(1, min(MAX_STYLE_WORKERS, per_image))
+
+
+def strip_rows(width: int, halo: int, budget_mb: Optional[int] = None, workers: int = 1) -> int:
+    """Core rows per strip so that `workers` strips of (core + 2 * halo) rows fit in the tile budget."""
+    budget_mb = budget_mb or get_settings().style_tile_budget_mb
+    total = (budget_mb * 1024 * 1024) // max(1, width * STRIP_BYTES_PER_PX * workers)
+    return max(MIN_STRIP_ROWS, int(total) - 2 * halo)
+
+
+def iter_strips(height: int, rows: int, halo: int) -> list[tuple[int, int, int, int]]:
+    """(y0, y1, c0, c1) per strip: rows [y0, y1) are processed, [c0, c1) are kept."""
+    strips = []
+    for c0 in range(0, height, rows):
+        c1 = min(height, c0 + rows)
+        strips.append((max(0, c0 - halo), min(height, c1 + halo), c0, c1))
+    return strips
+
+
+def run_in_strips(img: np.ndarray, fn: Callable[[np.ndarray, int], np.ndarray], halo: int,
+                  rows: Optional[int] = None, workers: Optional[int] = None) -> np.ndarray:
+    """
+    Apply fn(strip, y0) → uint8 strip over img in halo-padded strips.
+
+    With more than one worker the frame is split into at least one strip per
+    worker (but never below MIN_STRIP_ROWS, where the halo would dominate).
+    Runs in one call when a single strip covers the frame.
+    """
+    h, w = img.shape[:2]
+    workers = max(1, workers or style_workers())
+    if rows is None:
+        rows = strip_rows(w, halo, workers=workers)
+        if workers > 1:
+            rows = min(rows, max(MIN_STRIP_ROWS, math.ceil(h / workers)))
+    if rows >= h:
+        return fn(img, 0)
+
+    out = np.empty(img.shape, dtype=np.uint8)
+    strips = iter_strips(h, rows, halo)
+    workers = min(workers, len(strips))
+    log.debug(f"Tiled style: {len(strips)} strips of {rows} rows (+{halo} halo) "
+              f"for {w}x{h} on {workers} thread(s)")
+
+    def run(strip: tuple[int, int, int, int]):
+        y0, y1, c0, c1 = strip
+        res = fn(img[y0:y1], y0)
+        out[c0:c1] = res[c0 - y0:c1 - y0]
+
+    if workers == 1:
+        for strip in strips:
+            run(strip)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(run, strips))
+    return out
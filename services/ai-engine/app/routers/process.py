@@ -3,7 +3,9 @@ Processing API routes — trigger and monitor gallery processing.
 """
 import asyncio
 import logging
-from threading import Thread
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock, Thread
 from fastapi import APIRouter, BackgroundTasks
 from pydantic import BaseModel
 from typing import Optional
@@ -11,6 +13,7 @@ from typing import Optional
 from app.pipeline.orchestrator import run_pipeline
 from app.storage.db import get_gallery_photos, get_gallery
 from app.config import get_supabase
+from app.storage.style_cache import StyleProfileEntry, get_style_profile_cached
 
 router = APIRouter()
 log = logging.getLogger(__name__)
@@ -134,15 +137,188 @@ class RestyleRequest(BaseModel):
     photo_id: str
     style_profile_id: str
     gallery_id: Optional[str] = None
+    # Render a web-res preview from a cached proxy and return straight away;
+    # the full-res render runs in the background and replaces edited_key when done
+    preview: bool = False
+
+
+# ── Restyle helpers ──────────────────────────────────────────
+
+PROXY_CACHE_SIZE = 16  # decoded web-res originals kept per worker (~8 MB each)
+RESTYLE_WORKERS = 2    # full-res background renders running at once
+
+_proxy_cache: "OrderedDict[str, object]" = OrderedDict()
+_proxy_lock = Lock()
+# photo_id → number of the latest restyle request; background renders that
+# have been overtaken by a newer request are dropped instead of uploaded
+_restyle_generation: dict[str, int] = {}
+_generation_lock = Lock()
+# photo_id → latest full-res render waiting for a worker. A newer request
+# replaces the waiting one, so each photo has at most one job queued and one
+# running (photos in _active_renders have a pool task draining their queue).
+# Every full-res render goes through here, so a photo's check → upload →
+# record update never interleaves with another render of the same photo.
+_pending_renders: dict[str, tuple] = {}
+_active_renders: set[str] = set()
+_pending_lock = Lock()
+_render_pool = ThreadPoolExecutor(max_workers=RESTYLE_WORKERS, thread_name_prefix="restyle")
+
+
+def _derived_key(original_key: str, folder: str) -> str:
+    """originals/<name>.<ext> → <folder>/<name>.jpg"""
+    return original_key.replace("/originals/", f"/{folder}/").rsplit(".", 1)[0] + ".jpg"
+
+
+def _load_proxy(original_key: str):
+    """
+    Web-res (web_res_max_px) version of an original for previews.
+    Checks the worker cache, then the stored proxy, then decodes the original
+    and stores a proxy for next time. Returns (proxy, full_img_or_None) so a
+    freshly decoded original can be reused by the full-res render.
+    """
+    import cv2
+    import numpy as np
+    from app.config import get_settings
+    from app.pipeline.phase1_style import load_image_from_bytes
+    from app.pipeline.phase5_output import encode_jpeg, resize_image
+    from app.storage.supabase_storage import download_photo, upload_photo
+
+    with _proxy_lock:
+        proxy = _proxy_cache.get(original_key)
+        if proxy is not None:
+            _proxy_cache.move_to_end(original_key)
+            return proxy, None
+
+    full = None
+    proxy_key = _derived_key(original_key, "proxies")
+    data = download_photo(proxy_key)
+    if data:
+        proxy = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if proxy is None:
+        data = download_photo(original_key)
+        full = load_image_from_bytes(data) if data else None
+        if full is None:
+            return None, None
+        proxy = resize_image(full, get_settings().web_res_max_px)
+        upload_photo(proxy_key, encode_jpeg(proxy, 95), "image/jpeg")
+
+    with _proxy_lock:
+        _proxy_cache[original_key] = proxy
+        while len(_proxy_cache) > PROXY_CACHE_SIZE:
+            _proxy_cache.popitem(last=False)
+    return proxy, full
+
+
+def _next_generation(photo_id: str) -> int:
+    with _generation_lock:
+        gen = _restyle_generation.get(photo_id, 0) + 1
+        _restyle_generation[photo_id] = gen
+        return gen
+
+
+def _is_current(photo_id: str, generation: int) -> bool:
+    with _generation_lock:
+        return _restyle_generation.get(photo_id) == generation
+
+
+def _render_full_restyle(photo: dict, profile: StyleProfileEntry, generation: int, img=None) -> dict:
+    """
+    Full-res restyle: decode (unless given), style, encode, then swap it in.
+    The edited key is only written once the complete JPEG is in memory (a
+    single upsert, so readers see the old or the new file, never a partial
+    one), and the photo record is updated right after. Superseded renders
+    are dropped without touching either.
+    """
+    import cv2
+    from app.pipeline.phase1_style import load_image_from_bytes
+    from app.storage.supabase_storage import download_photo, upload_photo
+
+    photo_id = photo["id"]
+    original_key = photo["original_key"]
+
+    if img is None:
+        if not _is_current(photo_id, generation):
+            return {"status": "superseded"}
+        img_bytes = download_photo(original_key)
+        if not img_bytes:
+            return {"error": "Could not download original photo", "status": "error"}
+        img = load_image_from_bytes(img_bytes)
+        if img is None:
+            return {"error": "Could not decode photo", "status": "error"}
+
+    if not _is_current(photo_id, generation):
+        return {"status": "superseded"}
+    result_img = profile.render(img)
+
+    # Encode result as JPEG
+    encode_params = [cv2.IMWRITE_JPEG_QUALITY, 95]
+    _, buffer = cv2.imencode('.jpg', result_img, encode_params)
+    result_bytes = buffer.tobytes()
+
+    if not _is_current(photo_id, generation):
+        return {"status": "superseded"}
+
+    # Upload to edited location
+    edited_key = _derived_key(original_key, "edited")
+    if not upload_photo(edited_key, result_bytes, "image/jpeg"):
+        return {"error": "Could not upload restyled photo", "status": "error"}
+
+    # Update photo record
+    ai_edits = {
+        **(photo.get("ai_edits") or {}),
+        "style_applied": True,
+        "style_profile_id": profile.id,
+        "style_profile_name": profile.row.get("name", "Unknown"),
+    }
+    get_supabase().update("photos", photo_id, {"edited_key": edited_key, "ai_edits": ai_edits})
+    return {"status": "success", "edited_key": edited_key}
+
+
+def _drain_renders(photo_id: str):
+    """Pool task for one photo: render its newest queued job until none is left."""
+    while True:
+        with _pending_lock:
+            job = _pending_renders.pop(photo_id, None)
+            if job is None:
+                _active_renders.discard(photo_id)
+                return
+        photo, profile, generation, img, done = job
+        try:
+            res = _render_full_restyle(photo, profile, generation, img=img)
+        except Exception as e:
+            res = {"status": "error", "error": str(e)}
+        done.set_result(res)
+        if res.get("status") == "error":
+            log.error(f"Background restyle of {photo_id} failed: {res.get('error')}")
+        elif res.get("status") == "superseded":
+            log.info(f"Restyle of {photo_id} superseded — dropped full-res render")
+
+
+def _queue_full_restyle(photo: dict, profile: StyleProfileEntry, generation: int, img=None) -> Future:
+    """
+    Queue a full-res render on the bounded render pool. A job already
+    waiting for this photo is replaced (coalesced to the latest generation),
+    and a photo never has more than one render running. Returns a future
+    for the render's result dict.
+    """
+    photo_id = photo["id"]
+    done: Future = Future()
+    with _pending_lock:
+        replaced = _pending_renders.get(photo_id)
+        _pending_renders[photo_id] = (photo, profile, generation, img, done)
+        start = photo_id not in _active_renders
+        _active_renders.add(photo_id)
+    if replaced is not None:
+        replaced[4].set_result({"status": "superseded"})
+    if start:
+        _render_pool.submit(_drain_renders, photo_id)
+    return done
 
 
 @router.post("/restyle")
 async def restyle_photo(request: RestyleRequest):
     """Re-apply a different style profile to a single photo."""
-    from app.pipeline.phase1_style import apply_style, load_image_from_bytes, compute_channel_stats
-    from app.storage.supabase_storage import download_photo, upload_photo
-    import cv2
-    import numpy as np
+    from app.storage.supabase_storage import get_signed_url, upload_photo
 
     try:
         sb = get_supabase()
@@ -156,62 +332,50 @@ async def restyle_photo(request: RestyleRequest):
         if not original_key:
             return {"error": "Photo has no original file", "status": "error"}
 
-        # Get the style profile
-        profile = sb.select_single("style_profiles", filters={"id": request.style_profile_id})
-        if not profile:
+        # Get the style profile (decoded, cached per worker)
+        cached = get_style_profile_cached(request.style_profile_id)
+        if not cached:
             return {"error": "Style profile not found", "status": "error"}
+        profile = cached.row
 
         if profile.get("status") != "ready":
             return {"error": "Style profile is not trained yet", "status": "error"}
 
-        settings = profile.get("settings") or {}
+        generation = _next_generation(request.photo_id)
 
-        # Download the original photo
-        img_bytes = download_photo(original_key)
-        if not img_bytes:
-            return {"error": "Could not download original photo", "status": "error"}
+        if request.preview:
+            from app.config import get_settings
+            from app.pipeline.phase5_output import encode_jpeg
 
-        img = load_image_from_bytes(img_bytes)
-        if img is None:
-            return {"error": "Could not decode photo", "status": "error"}
+            proxy, full_img = await asyncio.to_thread(_load_proxy, original_key)
+            if proxy is None:
+                return {"error": "Could not load photo", "status": "error"}
 
-        # Apply the style
-        ref = settings.get("reference")
-        preset = settings.get("preset")
-        if ref:
-            from app.pipeline.phase1_style import _apply_reference_style
-            result_img = _apply_reference_style(img, ref, intensity=0.75)
-            if preset:
-                from app.pipeline.phase1_style import apply_preset_params
-                result_img = apply_preset_params(result_img, preset, intensity=0.5)
-        elif preset:
-            from app.pipeline.phase1_style import apply_preset_params
-            result_img = apply_preset_params(img, preset, intensity=0.85)
-        else:
-            result_img = apply_style(img, settings)
-
-        # Encode result as JPEG
-        encode_params = [cv2.IMWRITE_JPEG_QUALITY, 95]
-        _, buffer = cv2.imencode('.jpg', result_img, encode_params)
-        result_bytes = buffer.tobytes()
-
-        # Upload to edited location
-        edited_key = original_key.replace("/originals/", "/edited/").rsplit(".", 1)[0] + ".jpg"
-        upload_photo(edited_key, result_bytes, "image/jpeg")
-
-        # Update photo record
-        sb.update("photos", request.photo_id, {
-            "edited_key": edited_key,
-            "ai_edits": {
-                **(photo.get("ai_edits") or {}),
-                "style_applied": True,
-                "style_profile_id": request.style_profile_id,
-                "style_profile_name": profile.get("name", "Unknown"),
-            },
-        })
+            preview_img = await asyncio.to_thread(cached.render, proxy)
+            preview_key = _derived_key(original_key, "previews")
+            preview_jpeg = await asyncio.to_thread(encode_jpeg, preview_img, get_settings().web_quality)
+            await asyncio.to_thread(upload_photo, preview_key, preview_jpeg, "image/jpeg")
+
+            _queue_full_restyle(photo, cached, generation, img=full_img)
+
+            return {
+                "photo_id": request.photo_id,
+                "status": "preview",
+                "preview_key": preview_key,
+                "preview_url": get_signed_url(preview_key) or "",
+                "edited_key": _derived_key(original_key, "edited"),
+                "style_name": profile.get("name"),
+                "message": f"Preview of '{profile.get('name')}' ready — full resolution rendering",
+            }
+
+        res = await asyncio.wrap_future(_queue_full_restyle(photo, cached, generation))
+        if res.get("status") == "error":
+            return res
+        if res.get("status") == "superseded":
+            return {"photo_id": request.photo_id, **res, "message": "A newer restyle was requested"}
 
         # Generate a fresh signed URL for the edited image
-        from app.storage.supabase_storage import get_signed_url
+        edited_key = res["edited_key"]
         edited_url = get_signed_url(edited_key) or ""
 
         return {
@@ -1,6 +1,7 @@
 """
 Style training router — supports both:
-1. Before/after pair training (GPU neural LUT method via Modal)
+1. Before/after pair training (GPU neural LUT method via Modal, or a
+   closed-form CPU LUT fit when Modal isn't configured / mode="cpu")
 2. Reference-only training (CPU histogram method — legacy)
 """
 
@@ -11,18 +12,50 @@ import asyncio
 import logging
 
 from app.config import settings, supabase
-from app.modal.client import ModalClient
+from app.modal.client import MODAL_BASE_URL, ModalClient
+from app.storage.style_cache import invalidate_style_profile
 
 router = APIRouter()
 logger = logging.getLogger("apelier.style")
 
 
+def _update_profile(style_profile_id: str, fields: dict):
+    """Write a style profile row and drop this worker's cached copy of it."""
+    supabase.update("style_profiles", style_profile_id, fields)
+    invalidate_style_profile(style_profile_id)
+
+
+def _owned_key(photographer_id: Optional[str], key: str) -> bool:
+    """True if a storage key lives under the photographer's own prefix."""
+    return bool(photographer_id) and key.startswith(f"{photographer_id}/") and ".." not in key.split("/")
+
+
+def _settings_with_pairs(style_profile_id: str, pairs: list[dict], profile: Optional[dict] = None) -> dict:
+    """Profile settings with the training pairs recorded, so retrain can reuse them."""
+    if profile is None:
+        profile = supabase.select_single("style_profiles", filters={"id": style_profile_id}) or {}
+    return {**(profile.get("settings") or {}), "training_pairs": pairs}
+
+
 class TrainStyleRequest(BaseModel):
     photographer_id: str
     style_profile_id: str
     reference_keys: Optional[list[str]] = None
     pairs: Optional[list[dict]] = None
     epochs: int = 200
+    mode: Optional[str] = None  # "gpu" | "cpu"; default: GPU when MODAL_BASE_URL is set
+
+
+class RetrainStyleRequest(BaseModel):
+    pairs: Optional[list[dict]] = None  # pair-trained profiles: full new pair list
+    epochs: int = 200
+
+
+class ImportLutRequest(BaseModel):
+    photographer_id: str
+    name: str
+    lut_file_key: str
+    description: Optional[str] = None
 
 
 class CreateStyleRequest(BaseModel):
@@ -39,11 +72,28 @@ class CreateStyleRequest(BaseModel):
 @router.post("/train")
 async def train_style(req: TrainStyleRequest, background_tasks: BackgroundTasks):
     """Start style model training."""
-    if req.pairs and len(req.pairs) >= 5:
+    use_cpu_fit = req.mode == "cpu" or (req.mode != "gpu" and not MODAL_BASE_URL)
+    if req.pairs and len(req.pairs) >= 5 and use_cpu_fit:
+        logger.info(f"Starting CPU LUT fit: {len(req.pairs)} pairs")
+        _update_profile(req.style_profile_id, {
+            "training_status": "training",
+            "training_method": "lut_fit",
+            "settings": _settings_with_pairs(req.style_profile_id, req.pairs),
+        })
+        background_tasks.add_task(
+            _train_lut_fit_sync,
+            req.photographer_id,
+            req.style_profile_id,
+            req.pairs,
+        )
+        return {"status": "training", "message": f"CPU LUT fit started with {len(req.pairs)} pairs"}
+
+    elif req.pairs and len(req.pairs) >= 5:
         logger.info(f"Starting GPU style training: {len(req.pairs)} pairs")
-        supabase.update("style_profiles", req.style_profile_id, {
+        _update_profile(req.style_profile_id, {
             "training_status": "training",
             "training_method": "neural_lut",
+            "settings": _settings_with_pairs(req.style_profile_id, req.pairs),
         })
         background_tasks.add_task(
             _train_neural_style_sync,
@@ -56,7 +106,7 @@ async def train_style(req: TrainStyleRequest, background_tasks: BackgroundTasks)
 
     elif req.reference_keys and len(req.reference_keys) >= 5:
         logger.info(f"Starting CPU style training: {len(req.reference_keys)} references")
-        supabase.update("style_profiles", req.style_profile_id, {
+        _update_profile(req.style_profile_id, {
             "training_status": "training",
             "training_method": "histogram",
         })
@@ -112,6 +162,80 @@ async def create_style(req: CreateStyleRequest):
         return {"status": "error", "message": str(e)}
 
 
+@router.post("/import-lut")
+async def import_lut(req: ImportLutRequest):
+    """Create a ready-to-use style profile from an uploaded .cube LUT."""
+    from app.pipeline.cube_lut import parse_cube
+    from app.storage.supabase_storage import download_photo
+
+    # The LUT must live under the photographer's own storage prefix
+    key = req.lut_file_key
+    if not _owned_key(req.photographer_id, key):
+        logger.warning(f"Rejected LUT import of {key} for photographer {req.photographer_id}")
+        return {"status": "error", "message": "LUT file does not belong to this photographer"}
+
+    data = download_photo(key)
+    if not data:
+        return {"status": "error", "message": "Could not download LUT file"}
+    try:
+        parsed = parse_cube(data.decode("utf-8", errors="replace"))
+    except ValueError as e:
+        return {"status": "error", "message": f"Invalid .cube file: {e}"}
+
+    profile = supabase.insert("style_profiles", {
+        "photographer_id": req.photographer_id,
+        "name": req.name,
+        "description": req.description or parsed["title"],
+        "reference_image_keys": [],
+        "settings": {
+            "version": "2.0",
+            "lut": {"key": req.lut_file_key, "size": parsed["size"], "title": parsed["title"]},
+        },
+        "status": "ready",
+        "training_method": "cube_lut",
+    })
+    if not profile:
+        return {"status": "error", "message": "Failed to create style profile"}
+    return {"status": "ready", "id": profile["id"], "lut_size": parsed["size"]}
+
+
+@router.get("/{style_profile_id}/export.cube")
+async def export_lut(style_profile_id: str, size: int = 33, anchor_key: Optional[str] = None):
+    """
+    Export a style profile as a .cube 3D LUT. Reference-style transfer is
+    fitted on `anchor_key` (a representative original of the profile's
+    photographer) when given.
+    """
+    from fastapi.responses import PlainTextResponse
+    from app.pipeline.cube_lut import MAX_CUBE_SIZE, export_style_cube
+    from app.pipeline.phase1_style import load_image_proxy
+    from app.storage.supabase_storage import download_photo
+    from app.workers.style_trainer import TRAIN_MAX_DIM
+
+    profile = supabase.select_single("style_profiles", filters={"id": style_profile_id})
+    if not profile:
+        return {"status": "error", "message": "Style profile not found"}
+    if not 2 <= size <= MAX_CUBE_SIZE:
+        return {"status": "error", "message": f"size must be 2..{MAX_CUBE_SIZE}"}
+
+    anchor = None
+    if anchor_key:
+        if not _owned_key(profile.get("photographer_id"), anchor_key):
+            logger.warning(f"Rejected LUT export anchor {anchor_key} for style profile {style_profile_id}")
+            return {"status": "error", "message": "Anchor photo does not belong to this photographer"}
+        data = download_photo(anchor_key)
+        # Reference stats are taken at TRAIN_MAX_DIM, so fit the anchor at the same size
+        anchor = load_image_proxy(data, TRAIN_MAX_DIM, anchor_key) if data else None
+
+    name = profile.get("name") or style_profile_id
+    try:
+        text = await asyncio.to_thread(export_style_cube, profile.get("settings") or {}, name, size, anchor)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    filename = "".join(c if c.isalnum() or c in "-_" else "_" for c in name) + ".cube"
+    return PlainTextResponse(text, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
 @router.get("/status/{style_profile_id}")
 async def get_training_status(style_profile_id: str):
     """Check training status for a style profile."""
@@ -122,26 +246,55 @@ async def get_training_status(style_profile_id: str):
         "status": profile.get("training_status") or profile.get("status", "unknown"),
         "training_method": profile.get("training_method"),
         "model_key": profile.get("model_key") or profile.get("model_weights_key"),
+        "training": (profile.get("settings") or {}).get("training"),
     }
 
 
 @router.post("/{style_profile_id}/retrain")
-async def retrain_style(style_profile_id: str):
-    """Re-train an existing style profile."""
+async def retrain_style(style_profile_id: str, full: bool = False,
+                        req: Optional[RetrainStyleRequest] = None):
+    """
+    Re-train an existing style profile. Only references added or removed
+    since the last training are processed unless full=true.
+
+    Pair-trained profiles (neural_lut / lut_fit) retrain on `pairs` when
+    given, else on the pairs recorded at the last training. Modal keeps
+    resized training images cached by object key + ETag, so only new or
+    replaced pairs are downloaded again.
+    """
     profile = supabase.select_single("style_profiles", filters={"id": style_profile_id})
     if not profile:
         return {"status": "error", "message": "Style profile not found"}
 
-    supabase.update("style_profiles", style_profile_id, {
+    req = req or RetrainStyleRequest()
+    photographer_id = profile["photographer_id"]
+    method = profile.get("training_method")
+    from threading import Thread
+
+    if method in ("neural_lut", "lut_fit"):
+        pairs = req.pairs or (profile.get("settings") or {}).get("training_pairs") or []
+        if len(pairs) < 5:
+            return {"status": "error", "message": "Need at least 5 before/after pairs to retrain"}
+        _update_profile(style_profile_id, {
+            "status": "training",
+            "training_status": "training",
+            "settings": _settings_with_pairs(style_profile_id, pairs, profile),
+        })
+        if method == "lut_fit":
+            target, args = _train_lut_fit_sync, (photographer_id, style_profile_id, pairs)
+        else:
+            target, args = _train_neural_style_sync, (photographer_id, style_profile_id, pairs, req.epochs)
+        Thread(target=target, args=args, daemon=True).start()
+        return {"status": "training", "message": f"Retraining started with {len(pairs)} pairs"}
+
+    _update_profile(style_profile_id, {
         "status": "training",
     })
 
     ref_keys = profile.get("reference_image_keys", [])
-    photographer_id = profile["photographer_id"]
 
-    from threading import Thread
     def retrain_bg():
-        asyncio.run(_train_histogram_style(photographer_id, style_profile_id, ref_keys))
+        asyncio.run(_train_histogram_style(photographer_id, style_profile_id, ref_keys, full))
 
     thread = Thread(target=retrain_bg, daemon=True)
     thread.start()
@@ -157,6 +310,12 @@ def _train_neural_style_sync(photographer_id, style_profile_id, pairs, epochs):
     asyncio.run(_train_neural_style(photographer_id, style_profile_id, pairs, epochs))
 
 
+def _train_lut_fit_sync(photographer_id, style_profile_id, pairs):
+    """Background task: closed-form LUT fit on CPU (sets status itself)."""
+    from app.workers.lut_trainer import train_lut_profile
+    train_lut_profile(photographer_id, style_profile_id, pairs)
+
+
 def _train_histogram_style_sync(photographer_id, style_profile_id, reference_keys):
     """Synchronous wrapper for background task."""
     asyncio.run(_train_histogram_style(photographer_id, style_profile_id, reference_keys))
@@ -178,20 +337,37 @@ async def _train_neural_style(
             epochs=epochs,
         )
         if result.get("status") == "success":
-            supabase.update("style_profiles", style_profile_id, {
+            profile = supabase.select_single("style_profiles", filters={"id": style_profile_id}) or {}
+            training = {
+                key: result.get(key)
+                for key in ("epochs_run", "epochs_max", "best_epoch", "stopped", "final_loss",
+                            "loss_curve", "pairs_validation", "images_from_cache")
+            }
+            _update_profile(style_profile_id, {
                 "status": "ready",
+                "training_status": "ready",
                 "model_key": result["model_key"],
                 "model_weights_key": result["model_key"],
+                "model_filename": result.get("model_filename"),
+                "training_time_s": result.get("training_time_s"),
+                "pairs_used": result.get("pairs_used"),
+                "settings": {**(profile.get("settings") or {}), "training": training},
             })
-            logger.info(f"Neural style training complete: {result['model_key']}")
+            logger.info(f"Neural style training complete: {result['model_key']} "
+                        f"({training['epochs_run']}/{epochs} epochs, best {training['best_epoch']}, "
+                        f"{training['stopped']})")
         else:
-            supabase.update("style_profiles", style_profile_id, {
+            _update_profile(style_profile_id, {
                 "status": "error",
+                "training_status": "error",
+                "training_error": result.get("message"),
             })
             logger.error(f"Neural style training failed: {result.get('message')}")
     except Exception as e:
-        supabase.update("style_profiles", style_profile_id, {
+        _update_profile(style_profile_id, {
             "status": "error",
+            "training_status": "error",
+            "training_error": str(e),
         })
         logger.error(f"Neural style training error: {e}")
     finally:
@@ -202,16 +378,18 @@ async def _train_histogram_style(
     photographer_id: str,
     style_profile_id: str,
     reference_keys: list[str],
+    full: bool = False,
 ):
-    """Background task: train histogram-based style (CPU method)."""
+    """Background task: train histogram-based style (CPU method, incremental)."""
     try:
-        from app.workers.style_trainer import train_style_profile
-        await train_style_profile(photographer_id, style_profile_id, reference_keys)
-        supabase.update("style_profiles", style_profile_id, {
-            "status": "ready",
+        from app.workers.style_trainer import train_profile
+        _update_profile(style_profile_id, {
+            "reference_image_keys": reference_keys,
         })
+        # train_profile sets status ready / error itself
+        await asyncio.to_thread(train_profile, style_profile_id, full)
     except Exception as e:
-        supabase.update("style_profiles", style_profile_id, {
+        _update_profile(style_profile_id, {
             "status": "error",
         })
         logger.error(f"Histogram style training error: {e}")
@@ -5,6 +5,7 @@ import logging
 from typing import Optional
 from datetime import datetime, timezone
 from app.config import get_supabase
+from app.storage.style_cache import invalidate_style_profile
 
 log = logging.getLogger(__name__)
 
@@ -146,3 +147,5 @@ def update_style_profile(profile_id: str, **fields):
         sb.update("style_profiles", profile_id, fields)
     except Exception as e:
         log.error(f"Failed to update style profile {profile_id}: {e}")
+    finally:
+        invalidate_style_profile(profile_id)
@@ -0,0 +1,223 @@
+"""
+Per-image feature store — reuse Phase 0 / style-training features across runs.
+
+Features are keyed by the SHA-256 of the original file bytes plus the
+pipeline version, so a re-run of the same gallery (or a style-training run
+over the same images) loads them instead of recomputing. Each namespace also
+maps (storage key, ETag) → content hash, so a re-run can find an unchanged
+original's features from a HEAD request, without downloading it to hash.
+
+Two layers:
+- Remote: one columnar .npz per namespace (e.g. "{photographer_id}/{gallery_id}")
+  in Supabase Storage under "{namespace}/features/features-v{version}.npz"
+- Local: one small .npz per content hash under settings.feature_cache_dir,
+  shared by every namespace on the same worker and pruned oldest-first to
+  settings.feature_cache_max_mb
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+from typing import Optional
+
+import numpy as np
+
+from app.config import get_settings
+from app.storage.supabase_storage import download_photo, upload_photo
+
+log = logging.getLogger(__name__)
+
+def _json_default(obj):
+    """numpy scalars → native, anything else (bytes, IFDRational tuples) → str."""
+    if hasattr(obj, "item"):
+        return obj.item()
+    return str(obj)
+
+
+def _pack(entries: dict[str, dict], aliases: Optional[dict[str, str]] = None) -> bytes:
+    """Entries (and ETag aliases) → columnar .npz bytes."""
+    hashes = sorted(entries)
+    alias_keys = sorted(aliases or {})
+    buf = io.BytesIO()
+    np.savez_compressed(
+        buf,
+        content_hash=np.array(hashes, dtype=str),
+        meta=np.array([json.dumps(entries[h], default=_json_default) for h in hashes], dtype=str),
+        alias_key=np.array(alias_keys, dtype=str),
+        alias_hash=np.array([aliases[k] for k in alias_keys], dtype=str),
+    )
+    return buf.getvalue()
+
+
+def _unpack(data: bytes) -> tuple[dict[str, dict], dict[str, str]]:
+    """Columnar .npz bytes → (entries, ETag aliases). Unknown columns are ignored."""
+    with np.load(io.BytesIO(data), allow_pickle=False) as npz:
+        entries = {str(h): json.loads(str(meta)) for h, meta in zip(npz["content_hash"], npz["meta"])}
+        aliases = {}
+        if "alias_key" in npz.files:
+            aliases = {str(k): str(h) for k, h in zip(npz["alias_key"], npz["alias_hash"])}
+    return entries, aliases
+
+
+def _prune_local_cache(root: str, max_bytes: int) -> int:
+    """Delete the least recently used cache files under root until it fits max_bytes."""
+    files = []
+    for dirpath, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in files)
+    removed = 0
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+class FeatureStore:
+    """
+    Content-addressed feature cache for one namespace.
+
+    Usage:
+        store = FeatureStore(f"{photographer_id}/{gallery_id}", PIPELINE_VERSION).load()
+        key = store.hash_for(storage_key, etag) or FeatureStore.content_hash(img_bytes)
+        features = store.get(key) or compute(...)
+        store.put(key, features)
+        store.link(storage_key, etag, key)
+        store.save()
+
+    get() and put() are safe to call from worker threads.
+    """
+
+    def __init__(self, namespace: str, version: str, cache_dir: Optional[str] = None):
+        self.namespace = namespace.strip("/")
+        self.version = str(version)
+        self.cache_root = cache_dir or get_settings().feature_cache_dir
+        self.cache_dir = os.path.join(self.cache_root, f"v{self.version}")
+        self._entries: dict[str, dict] = {}
+        self._aliases: dict[str, str] = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def content_hash(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    @property
+    def storage_key(self) -> str:
+        return f"{self.namespace}/features/features-v{self.version}.npz"
+
+    def _local_path(self, content_hash: str) -> str:
+        return os.path.join(self.cache_dir, content_hash[:2], f"{content_hash}.npz")
+
+    def load(self) -> "FeatureStore":
+        """Pull the namespace's columnar file from storage (missing file = empty store)."""
+        try:
+            data = download_photo(self.storage_key)
+            if data:
+                entries, aliases = _unpack(data)
+                with self._lock:
+                    self._entries.update(entries)
+                    self._aliases.update(aliases)
+                log.info(f"Feature store {self.storage_key}: {len(self._entries)} cached images")
+        except Exception as e:
+            log.warning(f"Could not load feature store {self.storage_key}: {e}")
+        return self
+
+    def get(self, content_hash: str) -> Optional[dict]:
+        """Cached features for an image, checking memory then the local disk cache."""
+        with self._lock:
+            entry = self._entries.get(content_hash)
+        if entry is not None:
+            return entry
+        path = self._local_path(content_hash)
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    entry = _unpack(f.read())[0].get(content_hash)
+                os.utime(path)  # mtime is the LRU clock for pruning
+            except Exception as e:
+                log.warning(f"Corrupt feature cache file {path}: {e}")
+                entry = None
+            if entry is not None:
+                # Known locally but not yet in this namespace's remote file
+                with self._lock:
+                    entry = self._entries.setdefault(content_hash, entry)
+                    self._dirty = True
+        return entry
+
+    def put(self, content_hash: str, features: dict):
+        """Store features for an image. Merges with anything already cached."""
+        with self._lock:
+            entry = {**self._entries.get(content_hash, {}), **features}
+            self._entries[content_hash] = entry
+            self._dirty = True
+        try:
+            path = self._local_path(content_hash)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(_pack({content_hash: entry}))
+            os.replace(tmp, path)
+        except Exception as e:
+            log.warning(f"Could not write local feature cache for {content_hash[:12]}: {e}")
+
+    def hash_for(self, storage_key: str, etag: Optional[str]) -> Optional[str]:
+        """Content hash last seen for this object version, or None if unknown."""
+        if not etag:
+            return None
+        with self._lock:
+            return self._aliases.get(f"{storage_key}@{etag}")
+
+    def link(self, storage_key: str, etag: Optional[str], content_hash: str):
+        """Remember which content hash a (storage key, ETag) pair holds."""
+        if not etag:
+            return
+        with self._lock:
+            if self._aliases.get(f"{storage_key}@{etag}") != content_hash:
+                self._aliases[f"{storage_key}@{etag}"] = content_hash
+                self._dirty = True
+
+    def prune_local(self) -> int:
+        """Bound the worker's local cache (every namespace and version) to feature_cache_max_mb."""
+        try:
+            removed = _prune_local_cache(self.cache_root, get_settings().feature_cache_max_mb * 1024 * 1024)
+        except Exception as e:
+            log.warning(f"Could not prune local feature cache {self.cache_root}: {e}")
+            return 0
+        if removed:
+            log.info(f"Feature cache {self.cache_root}: pruned {removed} least recently used files")
+        return removed
+
+    def save(self) -> bool:
+        """Upload the columnar file if anything changed since load(), then prune the local cache."""
+        self.prune_local()
+        with self._lock:
+            if not self._dirty:
+                return True
+            data = _pack(self._entries, self._aliases)
+            self._dirty = False
+        try:
+            ok = upload_photo(self.storage_key, data, "application/octet-stream") is not None
+        except Exception as e:
+            log.warning(f"Could not save feature store {self.storage_key}: {e}")
+            ok = False
+        if not ok:
+            with self._lock:
+                self._dirty = True
+        return ok
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,162 @@
+"""
+Per-worker cache of decoded style profiles.
+
+A style_profiles row carries its trained statistics as JSON lists (six
+256-bin histograms plus scalars) and an optional preset. Restyle requests
+fetch and decode the same profile on every slider change, so we keep the
+decoded form — histograms as numpy arrays, compiled presets — keyed by
+(profile id, updated_at).
+
+Each lookup still asks PostgREST for the row's updated_at (one tiny
+request) so edits made by other workers or the dashboard are picked up;
+only when it changed is the full row fetched and decoded again. Writes that
+go through this worker (update_style_profile, training jobs) invalidate the
+entry straight away.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from app.config import get_supabase
+
+log = logging.getLogger(__name__)
+
+STYLE_CACHE_SIZE = 32
+
+
+def _decode_settings(settings: dict) -> dict:
+    """JSON settings → settings with reference histograms as float64 arrays."""
+    decoded = dict(settings or {})
+    ref = decoded.get("reference")
+    if ref:
+        decoded["reference"] = {
+            k: np.asarray(v, dtype=np.float64) if isinstance(v, list) else v
+            for k, v in ref.items()
+        }
+    return decoded
+
+
+class StyleProfileEntry:
+    """A decoded style profile. `row` is the raw DB row, `settings` the decoded settings."""
+
+    __slots__ = ("row", "settings", "updated_at", "_compiled", "_lock")
+
+    def __init__(self, row: dict):
+        self.row = row
+        self.settings = _decode_settings(row.get("settings") or {})
+        self.updated_at = row.get("updated_at")
+        self._compiled: dict[float, object] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def id(self) -> str:
+        return self.row["id"]
+
+    def compiled_preset(self, intensity: float):
+        """CompiledPreset for this profile's preset at `intensity` (None without a preset)."""
+        preset = self.settings.get("preset")
+        if not preset:
+            return None
+        with self._lock:
+            compiled = self._compiled.get(intensity)
+        if compiled is None:
+            from app.pipeline.preset_compiler import compile_preset
+            compiled = compile_preset(preset, intensity)
+            with self._lock:
+                self._compiled[intensity] = compiled
+        return compiled
+
+    def apply_preset(self, img: np.ndarray, intensity: float) -> np.ndarray:
+        """This profile's preset on a BGR image, through the configured preset engine."""
+        from app.pipeline.phase1_style import apply_preset_params
+        from app.pipeline.preset_compiler import preset_engine_compiled
+
+        preset = self.settings.get("preset")
+        if not preset:
+            return img
+        if preset_engine_compiled():
+            return self.compiled_preset(intensity).apply(img)
+        return apply_preset_params(img, preset, intensity)
+
+    @property
+    def has_cpu_style(self) -> bool:
+        """Whether render() has anything to apply (a .cube LUT, reference stats or a preset)."""
+        return any(self.settings.get(k) for k in ("lut", "reference", "preset"))
+
+    def render(self, img: np.ndarray) -> np.ndarray:
+        """Apply this profile to a decoded BGR image on the CPU."""
+        from app.pipeline.phase1_style import (
+            PRESET_INTENSITY, PRESET_OVER_REFERENCE_INTENSITY, REFERENCE_INTENSITY,
+            apply_style, _apply_reference_style,
+        )
+
+        ref = self.settings.get("reference")
+        preset = self.settings.get("preset")
+        if self.settings.get("lut"):
+            return apply_style(img, self.settings)
+        if ref:
+            result_img = _apply_reference_style(img, ref, intensity=REFERENCE_INTENSITY)
+            if preset:
+                result_img = self.apply_preset(result_img, PRESET_OVER_REFERENCE_INTENSITY)
+            return result_img
+        if preset:
+            return self.apply_preset(img, PRESET_INTENSITY)
+        return apply_style(img, self.settings)
+
+
+_cache: "OrderedDict[str, StyleProfileEntry]" = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0}
+
+
+def get_style_profile_cached(profile_id: str) -> Optional[StyleProfileEntry]:
+    """Decoded style profile, re-fetched only when its updated_at changed."""
+    sb = get_supabase()
+    with _cache_lock:
+        entry = _cache.get(profile_id)
+
+    if entry is not None:
+        try:
+            head = sb.select_single("style_profiles", columns="id,updated_at", filters={"id": profile_id})
+        except Exception as e:
+            # A failed check says nothing about the row: keep serving what we have
+            log.warning(f"Could not check style profile {profile_id}, using cached copy: {e}")
+            return entry
+        if head is None:
+            invalidate_style_profile(profile_id)
+            return None
+        if head.get("updated_at") == entry.updated_at:
+            with _cache_lock:
+                _cache.move_to_end(profile_id)
+                _cache_stats["hits"] += 1
+            return entry
+
+    try:
+        row = sb.select_single("style_profiles", filters={"id": profile_id})
+    except Exception as e:
+        log.error(f"Failed to fetch style profile {profile_id}: {e}")
+        return None
+    if not row:
+        return None
+
+    entry = StyleProfileEntry(row)
+    with _cache_lock:
+        _cache_stats["misses"] += 1
+        _cache[profile_id] = entry
+        _cache.move_to_end(profile_id)
+        while len(_cache) > STYLE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return entry
+
+
+def invalidate_style_profile(profile_id: str):
+    with _cache_lock:
+        _cache.pop(profile_id, None)
+
+
+def style_cache_info() -> dict:
+    with _cache_lock:
+        return {**_cache_stats, "size": len(_cache)}
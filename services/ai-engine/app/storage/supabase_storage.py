@@ -19,6 +19,28 @@ def download_photo(storage_key: str) -> Optional[bytes]:
         return None
 
 
+def download_photo_range(storage_key: str, start: int, end: int) -> Optional[bytes]:
+    """Download an inclusive byte range of a photo — used for header-only metadata probes."""
+    try:
+        sb = get_supabase()
+        bucket = get_settings().storage_bucket
+        return sb.storage_download_range(bucket, storage_key, start, end)
+    except Exception as e:
+        log.error(f"Failed to download range {start}-{end} of {storage_key}: {e}")
+        return None
+
+
+def photo_etag(storage_key: str) -> Optional[str]:
+    """ETag of a stored photo without downloading it — None if unavailable."""
+    try:
+        sb = get_supabase()
+        bucket = get_settings().storage_bucket
+        return sb.storage_etag(bucket, storage_key)
+    except Exception as e:
+        log.error(f"Failed to read ETag of {storage_key}: {e}")
+        return None
+
+
 def upload_photo(storage_key: str, data: bytes, content_type: str = "image/jpeg") -> Optional[str]:
     """Upload a processed photo to Supabase Storage. Returns the key on success."""
     try:
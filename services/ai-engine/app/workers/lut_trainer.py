@@ -0,0 +1,172 @@
+"""
+LUT Fitting Worker — CPU alternative to Modal neural style training.
+
+Fits one image-independent 33³ LUT to a photographer's before/after pairs
+by regularised least squares (app.pipeline.lut_fit):
+1. Downloads pairs concurrently, decoded straight to small proxies
+2. Samples corresponding pixels from each pair
+3. Fits on most pairs and measures error on the held-out rest
+4. Refits on all pairs, stores the LUT as a .cube file and marks the
+   profile ready as a LUT profile (applied like an imported .cube)
+"""
+import logging
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+
+from app.config import get_settings
+from app.pipeline.cube_lut import CUBE_SIZE, format_cube
+from app.pipeline.lut_fit import fit_lut, lut_error, sample_pixel_pairs
+from app.pipeline.phase1_style import load_image_proxy
+from app.storage.supabase_storage import download_photo, upload_photo
+from app.storage.db import get_style_profile, update_style_profile
+
+log = logging.getLogger(__name__)
+
+FIT_MAX_DIM = 512          # Long side of the proxies pixels are sampled from
+SAMPLES_PER_PAIR = 20_000
+HOLDOUT_FRACTION = 0.2     # Share of pairs kept out of the first fit for error
+MIN_PAIRS = 5
+
+
+def _fetch_pair_samples(pair: dict, seed: int) -> Optional[tuple[np.ndarray, np.ndarray]]:
+    """Download one before/after pair and sample corresponding pixels; None if unusable."""
+    try:
+        orig_data = download_photo(pair["original_key"])
+        edit_data = download_photo(pair["edited_key"])
+        if not orig_data or not edit_data:
+            return None
+        original = load_image_proxy(orig_data, FIT_MAX_DIM, pair["original_key"])
+        edited = load_image_proxy(edit_data, FIT_MAX_DIM, pair["edited_key"])
+        if original is None or edited is None:
+            return None
+        return sample_pixel_pairs(original, edited, SAMPLES_PER_PAIR, np.random.default_rng(seed))
+    except Exception as e:
+        log.warning(f"Failed to load pair {pair.get('original_key')}: {e}")
+        return None
+
+
+def _fail(profile_id: str, message: str, pairs_used: int = 0):
+    """Mark a fit as failed, in the same fields the status endpoint reads for GPU training."""
+    log.error(f"LUT fit for {profile_id} failed: {message}")
+    update_style_profile(
+        profile_id,
+        status="error",
+        training_status="error",
+        training_error=message,
+        pairs_used=pairs_used,
+    )
+
+
+def train_lut_profile(photographer_id: str, profile_id: str, pairs: list[dict]):
+    """
+    Fit a LUT style profile from before/after pairs on CPU.
+
+    Updates the style_profiles record with:
+    - status / training_status: training → ready (or error, with
+      training_error), training_method "lut_fit", pairs_used
+      (and clears model_key, so the GPU path stops using an older model)
+    - settings.lut: the stored .cube, as for imported LUTs (other settings
+      are kept)
+    - settings.fit: train / held-out / identity error in 8-bit levels
+    """
+    log.info(f"Starting LUT fit for profile {profile_id}: {len(pairs)} pairs")
+    started = time.time()
+
+    try:
+        update_style_profile(
+            profile_id,
+            status="training",
+            training_status="training",
+            training_error=None,
+            training_started_at=datetime.now(timezone.utc).isoformat(),
+        )
+
+        profile = get_style_profile(profile_id)
+        if not profile:
+            _fail(profile_id, "Style profile not found")
+            return
+
+        # Same ownership rule as reference training
+        owned = [p for p in pairs
+                 if p.get("original_key", "").startswith(f"{photographer_id}/")
+                 and p.get("edited_key", "").startswith(f"{photographer_id}/")]
+        if not owned:
+            log.warning("No pairs matched photographer prefix — using all pairs (legacy mode)")
+            owned = pairs
+
+        workers = max(1, min(get_settings().style_train_concurrency, len(owned)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            samples = [s for s in pool.map(_fetch_pair_samples, owned, range(len(owned))) if s is not None]
+
+        if len(samples) < MIN_PAIRS:
+            _fail(profile_id, f"Only {len(samples)} valid pairs — need at least {MIN_PAIRS}", len(samples))
+            return
+
+        # Held-out error: fit without a random subset of whole pairs
+        order = np.random.default_rng(0).permutation(len(samples))
+        n_holdout = max(1, int(round(len(samples) * HOLDOUT_FRACTION)))
+        held = [samples[i] for i in order[:n_holdout]]
+        train = [samples[i] for i in order[n_holdout:]]
+        held_src = np.concatenate([s for s, _ in held])
+        held_dst = np.concatenate([d for _, d in held])
+
+        split = fit_lut(np.concatenate([s for s, _ in train]), np.concatenate([d for _, d in train]))
+        heldout_mae = lut_error(split["lut"], held_src, held_dst)
+        identity_mae = lut_error(None, held_src, held_dst)
+
+        # The stored LUT uses every pair
+        all_src = np.concatenate([s for s, _ in samples])
+        all_dst = np.concatenate([d for _, d in samples])
+        fitted = fit_lut(all_src, all_dst)
+        train_mae = lut_error(fitted["lut"], all_src, all_dst)
+        log.info(f"LUT fit: held-out MAE {heldout_mae:.2f} (identity {identity_mae:.2f}), "
+                 f"train MAE {train_mae:.2f}, {fitted['iterations']} iterations")
+
+        # New key per fit — load_cube_lut caches by storage key
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        lut_key = f"{photographer_id}/styles/{profile_id}/lut/fitted-{stamp}.cube"
+        name = profile.get("name") or profile_id
+        if not upload_photo(lut_key, format_cube(fitted["lut"], name).encode("utf-8"), "text/plain"):
+            _fail(profile_id, f"Could not store fitted LUT {lut_key}", len(samples))
+            return
+
+        # Keep the rest of the settings; the neural run summary no longer applies
+        settings = {k: v for k, v in (profile.get("settings") or {}).items() if k != "training"}
+        update_style_profile(
+            profile_id,
+            status="ready",
+            training_status="ready",
+            training_error=None,
+            training_method="lut_fit",
+            training_time_s=round(time.time() - started, 1),
+            pairs_used=len(samples),
+            # A LUT fit replaces any earlier neural model for this profile
+            model_key=None,
+            model_weights_key=None,
+            model_filename=None,
+            settings={
+                **settings,
+                "version": "2.0",
+                "lut": {"key": lut_key, "size": CUBE_SIZE, "title": name},
+                "training_pairs": pairs,
+                "fit": {
+                    "pairs_used": len(samples),
+                    "pairs_held_out": n_holdout,
+                    "samples": int(len(all_src)),
+                    "train_mae": round(train_mae, 3),
+                    "heldout_mae": round(heldout_mae, 3),
+                    "identity_mae": round(identity_mae, 3),
+                },
+            },
+            training_completed_at=datetime.now(timezone.utc).isoformat(),
+        )
+        log.info(f"Style profile {profile_id} LUT fit complete — ready to use")
+
+    except Exception as e:
+        log.error(f"LUT fit failed: {e}\n{traceback.format_exc()}")
+        _fail(profile_id, str(e))
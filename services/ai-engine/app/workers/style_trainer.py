@@ -3,29 +3,69 @@ Style Training Worker (v2.0)
 
 Handles async training of style profiles:
 1. Validates photographer_id ownership
-2. Downloads reference images from Supabase Storage
+2. Downloads reference images from Supabase Storage (concurrently,
+   decoded straight to small proxies)
 3. Optionally parses uploaded Lightroom preset (.xmp / .lrtemplate)
-4. Trains combined profile (preset baseline + reference learning)
+4. Trains combined profile (preset baseline + reference learning),
+   merging into the statistics persisted by the previous run
 5. Saves profile to DB scoped to photographer_id
 """
 import logging
 import traceback
-import numpy as np
-import cv2
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from typing import Optional
 
-from app.pipeline.phase1_style import compute_channel_stats, load_image_from_bytes
+from app.config import PIPELINE_VERSION, get_settings
+from app.pipeline.phase1_style import compute_channel_stats, load_image_proxy
 from app.pipeline.preset_parser import parse_preset_file
-from app.storage.supabase_storage import download_photo
+from app.pipeline.style_stats import (
+    StyleStatsAccumulator, load_style_stats, save_style_stats, style_stats_key,
+)
+from app.storage.supabase_storage import download_photo, photo_etag
 from app.storage.db import get_style_profile, update_style_profile
+from app.storage.feature_store import FeatureStore
 
 log = logging.getLogger(__name__)
 
+TRAIN_MAX_DIM = 800  # Long side of the proxy used for stats
 
-def train_profile(profile_id: str):
+
+def _fetch_reference_stats(key: str, feature_store: FeatureStore) -> Optional[tuple[str, Optional[str], dict, bool]]:
+    """
+    Download one reference and reduce it to (content_hash, etag, channel stats, computed).
+    Decodes straight to a TRAIN_MAX_DIM proxy; None if it can't be loaded.
+
+    The ETag is read before the download, so if the object is replaced in
+    between, the next training sees a changed ETag and reads it again.
+    """
+    try:
+        etag = photo_etag(key)
+        data = download_photo(key)
+        if not data:
+            return None
+        content_hash = FeatureStore.content_hash(data)
+        cached = feature_store.get(content_hash)
+        if cached and cached.get("channel_stats"):
+            return content_hash, etag, cached["channel_stats"], False
+        img = load_image_proxy(data, TRAIN_MAX_DIM, key)
+        del data  # Free raw bytes
+        if img is None:
+            return None
+        return content_hash, etag, compute_channel_stats(img), True
+    except Exception as e:
+        log.warning(f"Failed to load reference image {key}: {e}")
+        return None
+
+
+def train_profile(profile_id: str, full: bool = False):
     """
     Train a style profile from its reference images + optional preset.
 
+    Incremental by default: reference stats persisted by the previous run
+    are reused and only added / removed references are processed. Pass
+    full=True to rebuild the statistics from scratch.
+
     Updates the style_profiles record with:
     - status: training → ready (or error)
     - settings: the computed style profile (JSON)
@@ -75,30 +115,59 @@ def train_profile(profile_id: str):
             log.warning("No keys matched photographer prefix — using all keys (legacy mode)")
             valid_keys = ref_keys
 
-        # Download, decode, and compute stats one image at a time (memory safe)
-        # Don't hold all images in memory — compute stats per image and accumulate
-        all_stats = []
-        valid_count = 0
-        TRAIN_MAX_DIM = 800  # Resize for stats computation — saves memory
-
-        for key in valid_keys:
-            try:
-                data = download_photo(key)
-                if data:
-                    img = load_image_from_bytes(data)
-                    del data  # Free raw bytes
-                    if img is not None:
-                        # Resize for stats computation
-                        h, w = img.shape[:2]
-                        if max(h, w) > TRAIN_MAX_DIM:
-                            scale = TRAIN_MAX_DIM / max(h, w)
-                            img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
-                        stats = compute_channel_stats(img)
-                        all_stats.append(stats)
-                        del img  # Free image immediately
-                        valid_count += 1
-            except Exception as e:
-                log.warning(f"Failed to load reference image {key}: {e}")
+        # Stats are accumulated per reference (see style_stats) and persisted,
+        # so a retrain only downloads references added since the last run.
+        # Stats from earlier trainings of the same images are reused by content hash
+        feature_store = FeatureStore(f"{photographer_id}/styles/{profile_id}", PIPELINE_VERSION).load()
+        stats_key = style_stats_key(photographer_id, profile_id, PIPELINE_VERSION)
+        acc = StyleStatsAccumulator() if full else load_style_stats(stats_key)
+
+        # References already trained are only trusted while their storage
+        # ETag is unchanged; one replaced under the same key is taken out and
+        # read again like a new one. A reference whose ETag can't be read
+        # right now is kept (re-reading every one would undo the incremental
+        # training), while one trained before ETags were recorded is re-read once
+        workers = get_settings().style_train_concurrency
+        kept = [k for k in acc.members if k in valid_keys]
+        if kept:
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(kept)))) as pool:
+                etags = dict(zip(kept, pool.map(photo_etag, kept)))
+        else:
+            etags = {}
+        unknown = [k for k in kept if not etags[k]]
+        if unknown:
+            log.warning(f"No ETag for {len(unknown)} trained references — keeping their stats unchecked")
+        replaced = [k for k in kept if etags[k] and etags[k] != acc.etags.get(k)]
+        if replaced:
+            log.info(f"{len(replaced)} references changed in storage since the last training")
+
+        # Take out references that were removed or replaced since the last training
+        for key in [k for k in acc.members if k not in valid_keys] + replaced:
+            cached = feature_store.get(acc.members[key])
+            if not cached or not cached.get("channel_stats"):
+                log.info(f"No cached stats for outdated reference {key} — retraining from scratch")
+                acc = StyleStatsAccumulator()
+                break
+            acc.remove(cached["channel_stats"], key)
+
+        new_keys = [k for k in valid_keys if k not in acc]
+        log.info(f"{len(acc)} references already trained, {len(new_keys)} to add")
+
+        # Download and reduce references concurrently; each worker holds at
+        # most one file and one proxy, and the accumulator is only touched here
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(new_keys)))) as pool:
+            results = pool.map(lambda k: _fetch_reference_stats(k, feature_store), new_keys)
+            for key, fetched in zip(new_keys, results):
+                if fetched is None:
+                    continue
+                content_hash, etag, stats, computed = fetched
+                if computed:
+                    feature_store.put(content_hash, {"channel_stats": stats})
+                acc.add(stats, key, content_hash, etag)
+
+        feature_store.save()
+        save_style_stats(stats_key, acc)
+        valid_count = len(acc)
 
         if valid_count < 10:
             update_style_profile(profile_id, status="error")
@@ -131,15 +200,8 @@ def train_profile(profile_id: str):
         if preset_params:
             profile_data["preset"] = preset_params
 
-        if all_stats:
-            ref = {}
-            for key in all_stats[0].keys():
-                vals = [s[key] for s in all_stats if key in s]
-                if isinstance(vals[0], list):
-                    ref[key] = np.mean(np.array(vals), axis=0).tolist()
-                else:
-                    ref[key] = float(np.mean(vals))
-            profile_data["reference"] = ref
+        if valid_count:
+            profile_data["reference"] = acc.reference()
             profile_data["num_reference_images"] = valid_count
 
         style_data = profile_data
@@ -0,0 +1,67 @@
+"""
+Batch Phase 0 analysis: per-image parity, style proxies and bounded RAW decodes.
+"""
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from app.pipeline import phase0_analysis
+
+
+def _jpeg(seed: int) -> bytes:
+    rng = np.random.default_rng(seed)
+    img = rng.integers(0, 256, (64, 96, 3), dtype=np.uint8)
+    ok, buf = cv2.imencode(".jpg", img)
+    assert ok
+    return buf.tobytes()
+
+
+def test_batch_matches_single_image_analysis():
+    images = [_jpeg(0), b"not an image", _jpeg(1)]
+    names = ["a.jpg", "b.jpg", "c.jpg"]
+    batch = phase0_analysis.analyse_images(images, filenames=names, max_workers=2)
+
+    assert "proxies" not in batch
+    assert batch["error"][1] is not None
+    for idx in (0, 2):
+        single = phase0_analysis.analyse_image(images[idx], names[idx])
+        row = phase0_analysis.analysis_row(batch, idx)
+        assert row["phash"] == single["phash"]
+        assert row["quality_score"] == single["quality_score"]
+        assert row["characteristics"] == single["characteristics"]
+
+
+def test_proxies_only_when_requested():
+    images = [_jpeg(0), b"not an image"]
+    batch = phase0_analysis.analyse_images(images, filenames=["a.jpg", "b.jpg"], return_proxies=True)
+
+    size = phase0_analysis.BATCH_PROXY_SIZE
+    assert batch["proxies"].shape == (2, size, size, 3)
+    assert batch["proxies"][0].any() and not batch["proxies"][1].any()
+
+
+def test_raw_decodes_are_bounded(monkeypatch):
+    in_flight = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def fake_decode(image_bytes):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.05)
+        with lock:
+            in_flight -= 1
+        return np.full((32, 48, 3), 128, dtype=np.uint8)
+
+    monkeypatch.setattr(phase0_analysis, "_decode_raw_full", fake_decode)
+    n = 4 * phase0_analysis.MAX_PARALLEL_RAW_DECODES
+    batch = phase0_analysis.analyse_images(
+        [b"raw"] * n, filenames=[f"{i}.cr2" for i in range(n)], max_workers=n,
+    )
+
+    assert all(err is None for err in batch["error"])
+    assert peak == phase0_analysis.MAX_PARALLEL_RAW_DECODES
@@ -0,0 +1,46 @@
+"""Burst grouping: capture-time sweep plus hashes, and re-runs clearing old groups."""
+from app.pipeline import orchestrator
+from app.pipeline.phase0_analysis import detect_bursts
+
+SAME = (1 << 64) - 1
+OTHER = 0
+
+
+def _photo(pid, t, phash=SAME):
+    return {"id": pid, "_capture_time": t, "_phash": phash}
+
+
+def _state(*ids, **ai_edits):
+    return {pid: {"ai_edits": dict(ai_edits)} for pid in ids}
+
+
+def test_bursts_need_close_capture_times():
+    photos = [_photo("a", 0.0), _photo("b", 0.5), _photo("c", 3600.0), _photo("d", 3600.4, OTHER)]
+    groups = [sorted(m) for m in detect_bursts(photos).values() if len(m) > 1]
+    assert groups == [["a", "b"]]
+
+
+def test_continuous_shooting_is_cut_into_bounded_windows():
+    # An hour at 1 fps of near-identical frames: every gap is within window_s
+    photos = [_photo(f"p{i}", float(i)) for i in range(3600)]
+    groups = list(detect_bursts(photos, max_span_s=10.0).values())
+
+    assert sorted(pid for m in groups for pid in m) == sorted(p["id"] for p in photos)
+    assert max(len(m) for m in groups) == 11
+    for members in groups:
+        times = [float(pid[1:]) for pid in members]
+        assert max(times) - min(times) <= 10.0
+
+
+def test_rerun_clears_stale_burst_groups():
+    # "c" was in a burst on the previous run; its neighbour has since been culled
+    state = _state("a", "b", "c")
+    state["c"]["ai_edits"]["burst_group"] = "old-group"
+    state["c"]["ai_edits"]["style_applied"] = "profile"
+
+    photos = [_photo("a", 0.0), _photo("b", 0.5), _photo("c", 7200.0)]
+    orchestrator._assign_burst_groups(state, detect_bursts(photos))
+
+    assert state["a"]["ai_edits"]["burst_group"] == state["b"]["ai_edits"]["burst_group"]
+    assert "burst_group" not in state["c"]["ai_edits"]
+    assert state["c"]["ai_edits"]["style_applied"] == "profile"
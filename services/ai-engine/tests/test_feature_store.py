@@ -0,0 +1,92 @@
+"""
+FeatureStore: local disk cache, remote round trip, ETag aliases, local
+pruning and concurrent get/put.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.storage import feature_store as fs
+from app.storage.feature_store import FeatureStore
+
+
+@pytest.fixture
+def remote(monkeypatch):
+    objects: dict[str, bytes] = {}
+    monkeypatch.setattr(fs, "download_photo", lambda key: objects.get(key))
+
+    def upload(key, data, content_type="image/jpeg"):
+        objects[key] = data
+        return key
+
+    monkeypatch.setattr(fs, "upload_photo", upload)
+    return objects
+
+
+def test_round_trip_through_remote(remote, tmp_path):
+    store = FeatureStore("p1/g1", "test", cache_dir=str(tmp_path / "a")).load()
+    store.put("abc", {"analysis": {"quality_score": 71}})
+    assert store.save()
+    assert store.save()  # nothing dirty, no second upload needed
+
+    reloaded = FeatureStore("p1/g1", "test", cache_dir=str(tmp_path / "b")).load()
+    assert reloaded.get("abc") == {"analysis": {"quality_score": 71}}
+
+
+def test_etag_alias_round_trip(remote, tmp_path):
+    store = FeatureStore("p1/g1", "test", cache_dir=str(tmp_path)).load()
+    assert store.hash_for("p1/originals/a.jpg", "etag-1") is None
+    store.put("abc", {"analysis": {"quality_score": 71}})
+    store.link("p1/originals/a.jpg", "etag-1", "abc")
+    store.link("p1/originals/b.jpg", None, "def")  # no ETag, nothing to remember
+    assert store.save()
+
+    reloaded = FeatureStore("p1/g1", "test", cache_dir=str(tmp_path)).load()
+    assert reloaded.hash_for("p1/originals/a.jpg", "etag-1") == "abc"
+    # A replaced object gets a new ETag and misses
+    assert reloaded.hash_for("p1/originals/a.jpg", "etag-2") is None
+    assert reloaded.hash_for("p1/originals/b.jpg", None) is None
+
+
+def test_local_cache_pruned_least_recently_used_first(remote, tmp_path):
+    cache_dir = str(tmp_path)
+    store = FeatureStore("p1/g1", "test", cache_dir=cache_dir)
+    hashes = [f"{i:064x}" for i in range(6)]
+    for age, h in enumerate(hashes):
+        store.put(h, {"analysis": {"blob": "x" * 4000}})
+        os.utime(store._local_path(h), (1000 + age, 1000 + age))
+    size = os.path.getsize(store._local_path(hashes[0]))
+
+    # Reading the oldest file makes it the most recently used
+    assert FeatureStore("p1/g2", "test", cache_dir=cache_dir).get(hashes[0]) is not None
+
+    assert fs._prune_local_cache(cache_dir, 3 * size + size // 2) == 3
+    kept = [h for h in hashes if os.path.exists(store._local_path(h))]
+    assert kept == [hashes[0], hashes[4], hashes[5]]
+
+
+def test_concurrent_get_and_put(remote, tmp_path):
+    cache_dir = str(tmp_path)
+    seed = FeatureStore("p1/seed", "test", cache_dir=cache_dir)
+    hashes = [f"{i:064x}" for i in range(200)]
+    for h in hashes:
+        seed.put(h, {"channel_stats": {"mean": int(h, 16)}})
+
+    # A fresh namespace sees the same hashes only through the local disk
+    # cache, so every get() promotes an entry and marks the store dirty
+    store = FeatureStore("p1/other", "test", cache_dir=cache_dir)
+
+    def work(h):
+        got = store.get(h)
+        store.put(h, {"seen": True})
+        return got["channel_stats"]["mean"]
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        means = list(pool.map(work, hashes * 3))
+
+    assert means == [int(h, 16) for h in hashes * 3]
+    assert len(store) == len(hashes)
+    assert store.save()
+    reloaded = FeatureStore("p1/other", "test", cache_dir=str(tmp_path / "empty")).load()
+    assert all(reloaded.get(h) == {"channel_stats": {"mean": int(h, 16)}, "seen": True} for h in hashes)
@@ -0,0 +1,113 @@
+"""
+Header-only metadata probe: EXIF / capture time from ranged reads, and the
+orchestrator's pre-sort by capture time.
+"""
+import io
+from datetime import datetime
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.pipeline import orchestrator, phase0_analysis
+from app.storage import supabase_storage
+
+
+def _jpeg_with_exif(taken: str, size=(1600, 1200), seed: int = 0) -> bytes:
+    rng = np.random.default_rng(seed)
+    img = Image.fromarray(rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8))
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation
+    exif.get_ifd(0x8769)[0x9003] = taken  # DateTimeOriginal
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=90, exif=exif)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def ranged_storage(monkeypatch):
+    objects: dict[str, bytes] = {}
+    fetched: dict[str, int] = {}
+
+    def download_range(key, start, end):
+        data = objects.get(key)
+        if data is None:
+            return None
+        fetched[key] = fetched.get(key, 0) + len(data[start:end + 1])
+        return data[start:end + 1]
+
+    monkeypatch.setattr(supabase_storage, "download_photo_range", download_range)
+    return objects, fetched
+
+
+def test_probe_reads_header_only(ranged_storage):
+    objects, fetched = ranged_storage
+    objects["a.jpg"] = _jpeg_with_exif("2026:05:01 14:03:07")
+
+    meta = phase0_analysis.probe_metadata("a.jpg")
+
+    assert meta["width"] == 1600 and meta["height"] == 1200
+    assert meta["orientation"] == 6
+    assert meta["capture_time"] == datetime(2026, 5, 1, 14, 3, 7).timestamp()
+    assert fetched["a.jpg"] <= phase0_analysis.HEADER_PROBE_BYTES < len(objects["a.jpg"])
+
+
+def test_probe_missing_object(ranged_storage):
+    assert phase0_analysis.probe_metadata("missing.jpg") is None
+
+
+def test_capture_times_probed_before_download(ranged_storage):
+    objects, _ = ranged_storage
+    objects["late.jpg"] = _jpeg_with_exif("2026:05:01 15:00:00", seed=1)
+    objects["early.jpg"] = _jpeg_with_exif("2026:05:01 09:00:00", seed=2)
+    photos = [
+        {"id": "late", "original_key": "late.jpg"},
+        {"id": "gone", "original_key": "gone.jpg"},
+        {"id": "early", "original_key": "early.jpg"},
+    ]
+
+    assert orchestrator._probe_capture_times(photos) == 2
+    photos.sort(key=lambda p: (p["_capture_time"] is None, p["_capture_time"] or 0.0))
+    assert [p["id"] for p in photos] == ["early", "late", "gone"]
+
+
+def test_failed_probe_only_loses_that_photos_time(ranged_storage, monkeypatch):
+    objects, _ = ranged_storage
+    objects["ok.jpg"] = _jpeg_with_exif("2026:05:01 09:00:00")
+    real_probe = phase0_analysis.probe_metadata
+
+    def flaky_probe(key, *args, **kwargs):
+        if key == "bad.jpg":
+            raise ConnectionError("range request reset")
+        return real_probe(key, *args, **kwargs)
+
+    monkeypatch.setattr(orchestrator, "probe_metadata", flaky_probe)
+    photos = [{"id": "bad", "original_key": "bad.jpg"}, {"id": "ok", "original_key": "ok.jpg"}]
+
+    assert orchestrator._probe_capture_times(photos) == 1
+    assert photos[0]["_capture_time"] is None and photos[1]["_capture_time"] is not None
+
+
+def test_header_with_unparseable_dimensions():
+    img = Image.fromarray(np.zeros((20, 30, 3), dtype=np.uint8))
+    exif = Image.Exif()
+    exif.get_ifd(0x8769)[0xA002] = "wide"  # ExifImageWidth
+    exif.get_ifd(0x8769)[0xA003] = "tall"  # ExifImageHeight
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", exif=exif)
+
+    meta = phase0_analysis.parse_image_header(buf.getvalue())
+    assert (meta["width"], meta["height"]) == (30, 20)
+
+
+def test_failed_etag_probe_falls_back_to_download(monkeypatch):
+    class FlakySupabase:
+        def storage_etag(self, bucket, path):
+            if path == "bad.jpg":
+                raise ConnectionError("HEAD timed out")
+            return f'"{path}"'
+
+    monkeypatch.setattr(orchestrator, "supabase", FlakySupabase())
+    photos = [{"id": "bad", "original_key": "bad.jpg"}, {"id": "ok", "original_key": "ok.jpg"}]
+    orchestrator._probe_etags(photos, "photos")
+    assert [p["_etag"] for p in photos] == [None, '"ok.jpg"']
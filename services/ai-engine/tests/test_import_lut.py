@@ -0,0 +1,93 @@
+""".cube import and export: only storage keys under the photographer's own prefix."""
+import asyncio
+
+import pytest
+
+from app.routers import style
+from app.storage import supabase_storage
+
+CUBE = "\n".join(
+    ['TITLE "Test"', "LUT_3D_SIZE 2"]
+    + [f"{r} {g} {b}" for b in (0, 1) for g in (0, 1) for r in (0, 1)]
+).encode()
+
+
+class _FakeSupabase:
+    def __init__(self):
+        self.inserted = []
+
+    def insert(self, table, data):
+        self.inserted.append((table, data))
+        return {"id": "profile-1", **data}
+
+
+@pytest.fixture
+def fake_storage(monkeypatch):
+    downloads = []
+
+    def download(key):
+        downloads.append(key)
+        return CUBE
+
+    monkeypatch.setattr(supabase_storage, "download_photo", download)
+    db = _FakeSupabase()
+    monkeypatch.setattr(style, "supabase", db)
+    return downloads, db
+
+
+def _import(photographer_id, key):
+    req = style.ImportLutRequest(photographer_id=photographer_id, name="Test", lut_file_key=key)
+    return asyncio.run(style.import_lut(req))
+
+
+def test_imports_own_lut(fake_storage):
+    downloads, db = fake_storage
+    result = _import("ph-1", "ph-1/luts/film.cube")
+    assert result == {"status": "ready", "id": "profile-1", "lut_size": 2}
+    assert downloads == ["ph-1/luts/film.cube"]
+    assert db.inserted[0][1]["settings"]["lut"]["key"] == "ph-1/luts/film.cube"
+
+
+@pytest.mark.parametrize("key", [
+    "ph-2/luts/film.cube",
+    "ph-10/luts/film.cube",
+    "ph-1",
+    "ph-1/../ph-2/luts/film.cube",
+    "luts/film.cube",
+])
+def test_rejects_foreign_lut(fake_storage, key):
+    downloads, db = fake_storage
+    result = _import("ph-1", key)
+    assert result["status"] == "error"
+    assert downloads == [] and db.inserted == []
+
+
+class _ProfileDb:
+    def select_single(self, table, columns="*", filters=None):
+        return {"id": filters["id"], "photographer_id": "ph-1", "name": "Warm",
+                "settings": {"preset": {"exposure": 0.3}}}
+
+
+@pytest.mark.parametrize("key", ["ph-2/originals/a.jpg", "ph-1/../ph-2/originals/a.jpg", "originals/a.jpg"])
+def test_export_rejects_foreign_anchor(fake_storage, monkeypatch, key):
+    downloads, _ = fake_storage
+    monkeypatch.setattr(style, "supabase", _ProfileDb())
+    result = asyncio.run(style.export_lut("sp-1", size=2, anchor_key=key))
+    assert result["status"] == "error"
+    assert downloads == []
+
+
+def test_export_decodes_own_anchor_as_proxy(fake_storage, monkeypatch):
+    from app.pipeline import phase1_style
+    from app.workers.style_trainer import TRAIN_MAX_DIM
+
+    downloads, _ = fake_storage
+    decoded = []
+    monkeypatch.setattr(style, "supabase", _ProfileDb())
+    monkeypatch.setattr(phase1_style, "load_image_proxy",
+                        lambda data, max_dim, filename="": decoded.append((filename, max_dim)))
+    result = asyncio.run(style.export_lut("sp-1", size=2, anchor_key="ph-1/originals/a.jpg"))
+
+    assert result.status_code == 200
+    assert downloads == ["ph-1/originals/a.jpg"]
+    assert decoded == [("ph-1/originals/a.jpg", TRAIN_MAX_DIM)]
@@ -0,0 +1,45 @@
+"""Closed-form LUT fitting (lut_fit) on a known global colour grade."""
+import numpy as np
+
+from app.pipeline.lut_fit import fit_lut, lut_error, sample_pixel_pairs
+
+
+def _grade(bgr: np.ndarray) -> np.ndarray:
+    """A smooth global look: gamma lift, warm balance, mild desaturation."""
+    x = bgr.astype(np.float64) / 255.0
+    x = x ** 0.8
+    x *= np.array([0.9, 1.0, 1.08])
+    grey = x.mean(axis=-1, keepdims=True)
+    x = grey + (x - grey) * 0.8
+    return np.clip(np.round(x * 255.0), 0, 255).astype(np.uint8)
+
+
+def test_fit_recovers_global_grade():
+    rng = np.random.default_rng(0)
+    src = rng.integers(0, 256, (60_000, 3), dtype=np.uint8)
+    held = rng.integers(0, 256, (20_000, 3), dtype=np.uint8)
+
+    fitted = fit_lut(src, _grade(src), size=17)
+
+    identity_mae = lut_error(None, held, _grade(held))
+    heldout_mae = lut_error(fitted["lut"], held, _grade(held))
+    assert fitted["lut"].shape == (17, 17, 17, 3)
+    assert identity_mae > 10
+    assert heldout_mae < 1.0
+    assert heldout_mae < identity_mae / 10
+
+
+def test_fit_of_identity_is_identity():
+    rng = np.random.default_rng(1)
+    src = rng.integers(0, 256, (20_000, 3), dtype=np.uint8)
+    fitted = fit_lut(src, src, size=9)
+    assert lut_error(fitted["lut"], src, src) < 0.5
+
+
+def test_sample_pixel_pairs_resizes_edit():
+    rng = np.random.default_rng(2)
+    original = rng.integers(0, 256, (40, 60, 3), dtype=np.uint8)
+    edited = np.full((20, 30, 3), 128, dtype=np.uint8)
+    src, dst = sample_pixel_pairs(original, edited, 500, rng)
+    assert src.shape == dst.shape == (500, 3)
+    assert (dst == 128).all()
@@ -0,0 +1,41 @@
+"""
+modal_app imports style_model at module level, so every container image a
+Modal function runs in must ship it. Checked on the source (modal isn't
+needed to run the tests).
+"""
+import ast
+from pathlib import Path
+
+MODAL_APP = Path(__file__).resolve().parents[1] / "app" / "modal" / "modal_app.py"
+
+
+def _ships_style_model(node: ast.AST) -> bool:
+    return any(
+        isinstance(call, ast.Call)
+        and isinstance(call.func, ast.Attribute)
+        and call.func.attr == "add_local_python_source"
+        and any(isinstance(a, ast.Constant) and a.value == "style_model" for a in call.args)
+        for call in ast.walk(node)
+    )
+
+
+def test_every_function_image_ships_style_model():
+    tree = ast.parse(MODAL_APP.read_text())
+    images = {
+        target.id: node.value
+        for node in tree.body if isinstance(node, ast.Assign)
+        for target in node.targets if isinstance(target, ast.Name)
+    }
+
+    used = []
+    for call in ast.walk(tree):
+        if not isinstance(call, ast.Call):
+            continue
+        for kw in call.keywords:
+            if kw.arg != "image":
+                continue
+            image = images.get(kw.value.id) if isinstance(kw.value, ast.Name) else kw.value
+            used.append(ast.unparse(kw.value))
+            assert image is not None and _ships_style_model(image), ast.unparse(kw.value)
+
+    assert "health_image" in used
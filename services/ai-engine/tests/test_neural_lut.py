@@ -0,0 +1,66 @@
+"""CPU application of model-predicted style LUTs (neural_lut) against a numpy trilinear reference."""
+import base64
+
+import numpy as np
+import pytest
+
+from app.pipeline.neural_lut import apply_neural_lut, decode_lut, neural_lut_to_bgr
+
+D = 33
+
+
+def _model_lut(seed: int = 0) -> np.ndarray:
+    """A graded (D, D, D, 3) model LUT: [r, g, b] indexed, RGB 0..1 at k / (D - 1)."""
+    rng = np.random.default_rng(seed)
+    coords = np.linspace(0.0, 1.0, D)
+    r, g, b = np.meshgrid(coords, coords, coords, indexing="ij")
+    lut = np.stack([r, g, b], axis=-1) ** 0.8 * np.array([1.05, 0.97, 0.9])
+    return np.clip(lut + rng.normal(0, 0.02, lut.shape), 0, 1).astype(np.float32)
+
+
+def _reference(img_bgr: np.ndarray, lut: np.ndarray) -> np.ndarray:
+    """Textbook trilinear lookup in float64, clamped and truncated like the GPU path."""
+    rgb = img_bgr[..., ::-1].astype(np.float64) / 255.0 * (D - 1)
+    base = np.minimum(np.floor(rgb), D - 2).astype(np.int64)
+    frac = rgb - base
+    out = np.zeros(rgb.shape)
+    for dr in (0, 1):
+        for dg in (0, 1):
+            for db in (0, 1):
+                w = ((frac[..., 0] if dr else 1 - frac[..., 0])
+                     * (frac[..., 1] if dg else 1 - frac[..., 1])
+                     * (frac[..., 2] if db else 1 - frac[..., 2]))
+                out += w[..., None] * lut[base[..., 0] + dr, base[..., 1] + dg, base[..., 2] + db]
+    return (np.clip(out, 0, 1) * 255).astype(np.uint8)[..., ::-1]
+
+
+def test_apply_neural_lut_matches_trilinear_reference():
+    rng = np.random.default_rng(1)
+    img = rng.integers(0, 256, (317, 411, 3), dtype=np.uint8)
+    img[0, :4] = [[0, 0, 0], [255, 255, 255], [255, 0, 0], [0, 0, 255]]
+    lut = _model_lut()
+
+    out = apply_neural_lut(img, lut)
+    ref = _reference(img, lut)
+    diff = np.abs(out.astype(np.int16) - ref.astype(np.int16))
+    assert out.dtype == np.uint8 and out.shape == img.shape
+    # remap's 1/32 sub-pixel grid costs at most one level
+    assert diff.max() <= 1
+    assert diff.mean() < 0.1
+
+
+def test_converted_lut_gives_same_result():
+    rng = np.random.default_rng(2)
+    img = rng.integers(0, 256, (64, 80, 3), dtype=np.uint8)
+    lut = _model_lut(3)
+    bgr = neural_lut_to_bgr(lut)
+    assert not bgr.flags.writeable
+    assert np.array_equal(apply_neural_lut(img, bgr, converted=True), apply_neural_lut(img, lut))
+
+
+def test_decode_lut_round_trip_and_shape_check():
+    lut = _model_lut(4)
+    payload = base64.b64encode(lut.astype(np.float16).tobytes()).decode("ascii")
+    assert np.allclose(decode_lut(payload, D), lut, atol=1e-3)
+    with pytest.raises(ValueError):
+        neural_lut_to_bgr(lut[:, :, :-1])
@@ -0,0 +1,44 @@
+"""estimate_noise: deterministic, and calibrated against synthetic Gaussian noise."""
+import cv2
+import numpy as np
+import pytest
+
+from app.pipeline.phase0_analysis import estimate_noise
+
+
+def _residual_gain() -> float:
+    """Std of (image - 5x5 Gaussian blur) per unit of white-noise std."""
+    k1 = cv2.getGaussianKernel(5, 0)
+    k = k1 @ k1.T
+    delta = np.zeros_like(k)
+    delta[2, 2] = 1.0
+    return float(np.sqrt(((delta - k) ** 2).sum()))
+
+
+def _noisy(sigma: float, seed: int = 0, shape=(960, 1280)) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return (128.0 + rng.normal(0.0, sigma, shape)).astype(np.float32)
+
+
+def test_repeated_calls_are_identical():
+    rng = np.random.default_rng(7)
+    img = rng.integers(0, 256, (480, 640, 3), dtype=np.uint8)
+    first = estimate_noise(img)
+    assert all(estimate_noise(img) == first for _ in range(5))
+    assert estimate_noise(img.copy()) == first
+
+
+@pytest.mark.parametrize("sigma", [2.0, 5.0, 12.0])
+def test_recovers_known_gaussian_sigma(sigma):
+    # Mean absolute residual of N(0, gain * sigma) noise
+    expected = sigma * _residual_gain() * np.sqrt(2.0 / np.pi)
+    assert estimate_noise(_noisy(sigma)) == pytest.approx(expected, rel=0.05)
+
+
+def test_ignores_edge_heavy_tiles():
+    img = _noisy(4.0)
+    clean = estimate_noise(img)
+    # Hard edges in a few tiles must not move the median-of-tiles estimate much
+    img[:120, :160:8] += 100.0
+    img[-120:, -160::8] -= 100.0
+    assert estimate_noise(img) == pytest.approx(clean, rel=0.05)
@@ -0,0 +1,101 @@
+"""
+Packed-int pHash: same bit order as the old '0'/'1' strings, and the same
+greedy duplicate groups as the old string-based implementation.
+"""
+import cv2
+import numpy as np
+import pytest
+
+from app.pipeline.phase0_analysis import compute_image_hash, group_duplicates, hamming_distance, hash_to_int
+
+
+# ── Previous implementation (string hashes), kept as the reference ──
+
+def _old_compute_image_hash(img_array: np.ndarray) -> str:
+    resized = cv2.resize(img_array, (32, 32))
+    if len(resized.shape) == 3:
+        resized = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
+    dct = cv2.dct(np.float32(resized))
+    dct_low = dct[:8, :8]
+    median = np.median(dct_low)
+    bits = (dct_low > median).flatten()
+    return "".join(str(int(b)) for b in bits)
+
+
+def _old_hamming_distance(hash1: str, hash2: str) -> int:
+    return sum(c1 != c2 for c1, c2 in zip(hash1, hash2))
+
+
+def _old_group_duplicates(photos: list[dict], threshold: int = 10) -> dict[str, list[str]]:
+    if not photos:
+        return {}
+    groups: dict[str, list[str]] = {}
+    group_leaders: list[tuple[str, str]] = []
+    for photo in photos:
+        p_hash = photo.get("_phash", "")
+        p_id = photo["id"]
+        if not p_hash:
+            groups[p_id] = [p_id]
+            continue
+        matched = False
+        for leader_id, leader_hash in group_leaders:
+            if _old_hamming_distance(p_hash, leader_hash) < threshold:
+                groups[leader_id].append(p_id)
+                matched = True
+                break
+        if not matched:
+            groups[p_id] = [p_id]
+            group_leaders.append((p_id, p_hash))
+    return groups
+
+
+def _images(n: int = 12):
+    rng = np.random.default_rng(3)
+    yy, xx = np.mgrid[0:96, 0:128]
+    for i in range(n):
+        base = np.stack([xx * (i + 1), yy * (i + 2), xx + yy * i], axis=-1) % 256
+        yield (base + rng.integers(0, 30, base.shape)).clip(0, 255).astype(np.uint8)
+
+
+def _clustered_hashes(seed: int, n: int = 300) -> list[str]:
+    """Bit strings around a few centres, flipped by 0-12 bits, in shuffled order."""
+    rng = np.random.default_rng(seed)
+    centres = rng.integers(0, 2, (8, 64))
+    out = []
+    for _ in range(n):
+        bits = centres[rng.integers(0, len(centres))].copy()
+        flips = rng.choice(64, size=rng.integers(0, 13), replace=False)
+        bits[flips] ^= 1
+        out.append("".join(str(b) for b in bits))
+    return out
+
+
+@pytest.mark.parametrize("img", list(_images()))
+def test_packed_hash_keeps_string_bit_order(img):
+    old = _old_compute_image_hash(img)
+    new = compute_image_hash(img)
+    assert new == hash_to_int(old)
+    assert format(new, "064b") == old
+
+
+def test_hamming_distance_matches_string_distance():
+    hashes = _clustered_hashes(0, n=40)
+    for a in hashes:
+        for b in hashes[:10]:
+            assert hamming_distance(hash_to_int(a), hash_to_int(b)) == _old_hamming_distance(a, b)
+            assert hamming_distance(a, b) == _old_hamming_distance(a, b)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("threshold", [5, 10, 16])
+def test_groups_match_old_greedy_grouping(seed, threshold):
+    hashes = _clustered_hashes(seed)
+    old_photos = [{"id": f"p{i}", "_phash": h} for i, h in enumerate(hashes)]
+    old_photos[7]["_phash"] = ""  # unhashed photos stay on their own
+    old_photos[150]["_phash"] = ""
+    expected = _old_group_duplicates(old_photos, threshold=threshold)
+
+    int_photos = [{"id": p["id"], "_phash": hash_to_int(p["_phash"])} for p in old_photos]
+    assert list(group_duplicates(int_photos, threshold=threshold).items()) == list(expected.items())
+    # Legacy string hashes from older rows group the same way
+    assert list(group_duplicates(old_photos, threshold=threshold).items()) == list(expected.items())
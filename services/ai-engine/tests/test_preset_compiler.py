@@ -0,0 +1,112 @@
+"""Compiled presets (preset_compiler) against the per-step engine (apply_preset_params)."""
+import cv2
+import numpy as np
+import pytest
+
+from app.pipeline.phase1_style import apply_preset_params
+from app.pipeline.preset_compiler import (
+    LUT_SIZE, CompiledPreset, apply_lut3d, identity_lattice, lattice_step,
+)
+
+INTENSITY = 0.85
+
+PRESETS = {
+    "warm_portrait": {
+        "exposure": 0.3, "temperature": 25, "tint": 5, "contrast": 20, "highlights": -30,
+        "shadows": 25, "vibrance": 20,
+        "tone_curve": [[0, 10], [64, 60], [128, 132], [192, 200], [255, 250]],
+    },
+    "moody_hsl": {
+        "exposure": -0.2, "contrast": 35, "hsl_hue_orange": -10, "hsl_sat_blue": -40,
+        "hsl_lum_green": -30, "hsl_sat_green": -30, "split_highlight_sat": 20,
+        "split_highlight_hue": 45, "split_shadow_sat": 25, "split_shadow_hue": 210, "saturation": -15,
+    },
+    "bright_airy": {
+        "exposure": 0.6, "whites": 30, "blacks": -20, "highlights": -40, "contrast": -15,
+        "vibrance": 15, "saturation": -10, "temperature": -10,
+    },
+    "faded_film": {
+        "contrast": -25, "blacks": 40, "tone_curve": [[0, 30], [128, 128], [255, 235]],
+        "saturation": -25, "split_shadow_sat": 15, "split_shadow_hue": 200,
+    },
+    "vignette_grain": {
+        "exposure": 0.2, "contrast": 15, "vignette_amount": -30, "grain_amount": 20, "saturation": 10,
+    },
+}
+
+# Measured on the images below; the engine truncates to uint8 after every
+# step and its hue masks are hard thresholds, so the LUT can't match it
+# exactly between lattice points (see the preset_compiler docstring).
+MAX_MEAN = 1.5
+MAX_P99 = 6
+MAX_ABS = 48
+
+
+def _photo_like(rng: np.random.Generator) -> np.ndarray:
+    """Smooth colour field at photo-like saturation, with the full 0..255 range present."""
+    small = rng.integers(0, 256, (12, 16, 3), dtype=np.uint8)
+    img = cv2.resize(small, (320, 240), interpolation=cv2.INTER_CUBIC).astype(np.float32)
+    grey = img.mean(axis=2, keepdims=True)
+    img = grey + (img - grey) * 0.6
+    img[:8] = np.linspace(0, 255, 320)[None, :, None]
+    return np.clip(img + rng.normal(0, 3, img.shape), 0, 255).astype(np.uint8)
+
+
+@pytest.fixture(scope="module")
+def images() -> list[np.ndarray]:
+    rng = np.random.default_rng(0)
+    ramp = np.zeros((96, 256, 3), dtype=np.uint8)
+    ramp[:32] = np.arange(256, dtype=np.uint8)[None, :, None]   # greys, incl. 0 and 255
+    ramp[32:64, :, 2] = np.arange(256)                           # reds
+    ramp[64:, :, 0] = 255                                        # blue → cyan
+    ramp[64:, :, 1] = np.arange(256)
+    return [_photo_like(rng) for _ in range(3)] + [ramp]
+
+
+def test_lattice_endpoints_exact():
+    lattice = identity_lattice(LUT_SIZE)
+    assert lattice[0, 0, 0].tolist() == [0.0, 0.0, 0.0]
+    assert lattice[-1, -1, -1].tolist() == [255.0, 255.0, 255.0]
+    assert lattice_step(LUT_SIZE) * (LUT_SIZE - 1) == 255.0
+    # apply_lut3d's default spacing puts every level back on itself
+    levels = np.arange(256, dtype=np.uint8).reshape(16, 16, 1).repeat(3, axis=2)
+    out = apply_lut3d(levels, lattice)
+    assert out[0, 0].tolist() == [0.0, 0.0, 0.0]
+    assert out[-1, -1].tolist() == [255.0, 255.0, 255.0]
+    # Between points only remap's 1/32 sub-pixel grid is lost
+    assert np.abs(out - levels).max() <= lattice_step(LUT_SIZE) / 64 + 1e-3
+
+
+@pytest.mark.parametrize("name", sorted(PRESETS))
+def test_lattice_corners_match_engine(name):
+    preset = {k: v for k, v in PRESETS[name].items() if not k.startswith(("vignette", "grain"))}
+    compiled = CompiledPreset(preset, INTENSITY)
+    for corner in [(b, g, r) for b in (0, 255) for g in (0, 255) for r in (0, 255)]:
+        # One pixel per image, so the HSL mask feather has no neighbours to mix in
+        img = np.array(corner, dtype=np.uint8).reshape(1, 1, 3)
+        expected = apply_preset_params(img, preset, INTENSITY).astype(np.int16)
+        got = compiled.apply(img).astype(np.int16)
+        assert np.abs(got - expected).max() <= 1, corner
+
+
+@pytest.mark.parametrize("name", sorted(PRESETS))
+def test_compiled_matches_per_step(name, images):
+    preset = PRESETS[name]
+    compiled = CompiledPreset(preset, INTENSITY)
+    errors = []
+    for img in images:
+        # Grain is random per call; draw the same field for both engines
+        np.random.seed(1)
+        expected = apply_preset_params(img, preset, INTENSITY)
+        np.random.seed(1)
+        got = compiled.apply(img)
+        errors.append(np.abs(got.astype(np.int16) - expected.astype(np.int16)).ravel())
+    err = np.concatenate(errors)
+    mean, p99, worst = err.mean(), np.percentile(err, 99), err.max()
+    assert mean <= MAX_MEAN, f"mean {mean:.2f}"
+    assert p99 <= MAX_P99, f"p99 {p99}"
+    assert worst <= MAX_ABS, f"max {worst}"
+
+
+def test_identity_preset_has_no_stages():
+    assert CompiledPreset({"exposure": 0.0, "contrast": 0.0}, INTENSITY).stages == ()
@@ -0,0 +1,243 @@
+"""
+PresetPlan (the per-step engine's cached tables) against the formulas it
+replaced: the colour steps below are copies of the original per-pixel
+implementations, run in PRESET_STEPS order. Results must be identical.
+"""
+import cv2
+import numpy as np
+import pytest
+
+from app.pipeline import phase1_style
+from app.pipeline.phase1_style import PRESET_STEPS, _to_u8, apply_preset_params, preset_plan
+
+
+# ── Original per-pixel colour steps ──────────────────────────
+
+def _old_step_exposure(result: np.ndarray, preset: dict, intensity: float) -> np.ndarray:
+    """Exposure (stops)."""
+    exp = preset.get('exposure', 0.0)
+    if abs(exp) > 0.01:
+        result *= 2.0 ** (exp * intensity)
+    return result
+
+
+def _old_step_temperature(result: np.ndarray, preset: dict, intensity: float) -> np.ndarray:
+    """Temperature / Tint."""
+    temp, tint = preset.get('temperature', 0.0), preset.get('tint', 0.0)
+    if abs(temp) > 0.5 or abs(tint) > 0.5:
+        lab = cv2.cvtColor(_to_u8(result), cv2.COLOR_BGR2LAB).astype(np.float32)
+        lab[:, :, 2] += (temp / 100.0) * 10.0 * intensity
+        lab[:, :, 1] += (tint / 100.0) * 8.0 * intensity
+        result = cv2.cvtColor(_to_u8(lab), cv2.COLOR_LAB2BGR).astype(np.float32)
+    return result
+
+
+def _old_step_contrast(result: np.ndarray, preset: dict, intensity: float) -> np.ndarray:
+    """Contrast (S-curve on luminance)."""
+    con = preset.get('contrast', 0.0)
+    if abs(con) > 0.5:
+        lab = cv2.cvtColor(_to_u8(result), cv2.COLOR_BGR2LAB).astype(np.float32)
+        L = lab[:, :, 0]
+        amt = (con / 100.0) * intensity
+        lab[:, :, 0] = np.clip((L - 128.0) * (1.0 + amt * 0.5) + 128.0, 0, 255)
+        result = cv2.cvtColor(lab.astype(np.uint8), cv2.COLOR_LAB2BGR).astype(np.float32)
+    return result
+
+
+def _old_step_tones(result: np.ndarray, preset: dict, intensity: float) -> np.ndarray:
+    """Highlights / Shadows / Whites / Blacks."""
+    hi = preset.get('highlights', 0.0)
+    sh = preset.get('shadows', 0.0)
+    wh = preset.get('whites', 0.0)
+    bl = preset.get('blacks', 0.0)
+    if any(abs(v) > 0.5 for v in [hi, sh, wh, bl]):
+        lab = cv2.cvtColor(_to_u8(result), cv2.COLOR_BGR2LAB).astype(np.float32)
+        L = lab[:, :, 0]
+        if abs(hi) > 0.5:
+            L += np.clip((L - 192.0) / 63.0, 0, 1) * (hi / 100.0) * 40.0 * intensity
+        if abs(sh) > 0.5:
+            L += np.clip((63.0 - L) / 63.0, 0, 1) * (sh / 100.0) * 40.0 * intensity
+        if abs(wh) > 0.5:
+            L += np.clip((L - 230.0) / 25.0, 0, 1) * (wh / 100.0) * 30.0 * intensity
+        if abs(bl) > 0.5:
+            L += np.clip((25.0 - L) / 25.0, 0, 1) * (bl / 100.0) * 30.0 * intensity
+        lab[:, :, 0] = np.clip(L, 0, 255)
+        result = cv2.cvtColor(lab.astype(np.uint8), cv2.COLOR_LAB2BGR).astype(np.float32)
+    return result
+
+
+_OLD_HSL_RANGES = {
+    'red': (0, 15, 165, 180), 'orange': (15, 30), 'yellow': (30, 45),
+    'green': (45, 90), 'aqua': (90, 105), 'blue': (105, 135),
+    'purple': (135, 150), 'magenta': (150, 165),
+}
+
+
+def _old_step_hsl(result: np.ndarray, preset: dict, intensity: float, blur_mask: bool = True) -> np.ndarray:
+    """HSL adjustments. `blur_mask=False` drops the 5x5 mask feathering (used when sampling a LUT)."""
+    hsl_keys = [k for k in preset if k.startswith('hsl_')]
+    if hsl_keys:
+        hsv = cv2.cvtColor(_to_u8(result), cv2.COLOR_BGR2HSV).astype(np.float32)
+        H, S, V = hsv[:, :, 0], hsv[:, :, 1], hsv[:, :, 2]
+        for color, hr in _OLD_HSL_RANGES.items():
+            dh = preset.get(f'hsl_hue_{color}', 0.0)
+            ds = preset.get(f'hsl_sat_{color}', 0.0)
+            dl = preset.get(f'hsl_lum_{color}', 0.0)
+            if all(abs(v) < 0.5 for v in [dh, ds, dl]):
+                continue
+            if len(hr) == 4:
+                mask = ((H >= hr[0]) & (H < hr[1])) | ((H >= hr[2]) & (H <= hr[3]))
+            else:
+                mask = (H >= hr[0]) & (H < hr[1])
+            mf = mask.astype(np.float32)
+            if blur_mask:
+                mf = cv2.GaussianBlur(mf, (5, 5), 0)
+            if abs(dh) > 0.5:
+                H += mf * (dh / 100.0) * 15.0 * intensity
+            if abs(ds) > 0.5:
+                S += mf * (ds / 100.0) * 50.0 * intensity
+            if abs(dl) > 0.5:
+                V += mf * (dl / 100.0) * 40.0 * intensity
+        hsv[:, :, 0] = H % 180
+        hsv[:, :, 1] = np.clip(S, 0, 255)
+        hsv[:, :, 2] = np.clip(V, 0, 255)
+        result = cv2.cvtColor(hsv.astype(np.uint8), cv2.COLOR_HSV2BGR).astype(np.float32)
+    return result
+
+
+def _old_step_split_toning(result: np.ndarray, preset: dict, intensity: float) -> np.ndarray:
+    """Split toning."""
+    hh_sat = preset.get('split_highlight_sat', 0.0)
+    sh_sat = preset.get('split_shadow_sat', 0.0)
+    if hh_sat > 0.5 or sh_sat > 0.5:
+        lab = cv2.cvtColor(_to_u8(result), cv2.COLOR_BGR2LAB).astype(np.float32)
+        L = lab[:, :, 0]
+        bal = preset.get('split_balance', 0.0)
+        mid = 128.0 + bal * 0.5
+        if hh_sat > 0.5:
+            m = np.clip((L - mid) / (255.0 - mid + 1e-6), 0, 1)
+            rad = preset.get('split_highlight_hue', 0.0) / 360.0 * 2 * np.pi
+            lab[:, :, 1] += m * np.cos(rad) * hh_sat / 100.0 * 20.0 * intensity
+            lab[:, :, 2] += m * np.sin(rad) * hh_sat / 100.0 * 20.0 * intensity
+        if sh_sat > 0.5:
+            m = np.clip((mid - L) / (mid + 1e-6), 0, 1)
+            rad = preset.get('split_shadow_hue', 0.0) / 360.0 * 2 * np.pi
+            lab[:, :, 1] += m * np.cos(rad) * sh_sat / 100.0 * 20.0 * intensity
+            lab[:, :, 2] += m * np.sin(rad) * sh_sat / 100.0 * 20.0 * intensity
+        result = cv2.cvtColor(_to_u8(lab), cv2.COLOR_LAB2BGR).astype(np.float32)
+    return result
+
+
+def _old_step_vibrance(result: np.ndarray, preset: dict, intensity: float) -> np.ndarray:
+    """Vibrance & Saturation."""
+    vib = preset.get('vibrance', 0.0)
+    sat = preset.get('saturation', 0.0)
+    if abs(vib) > 0.5 or abs(sat) > 0.5:
+        hsv = cv2.cvtColor(_to_u8(result), cv2.COLOR_BGR2HSV).astype(np.float32)
+        Sc = hsv[:, :, 1]
+        if abs(sat) > 0.5:
+            Sc *= 1.0 + (sat / 100.0) * intensity
+        if abs(vib) > 0.5:
+            wt = 1.0 - Sc / 255.0
+            skin = ((hsv[:, :, 0] >= 5) & (hsv[:, :, 0] <= 25) & (Sc > 30)).astype(np.float32)
+            Sc += wt * (1.0 - skin * 0.7) * (vib / 100.0) * intensity * 80.0
+        hsv[:, :, 1] = np.clip(Sc, 0, 255)
+        result = cv2.cvtColor(hsv.astype(np.uint8), cv2.COLOR_HSV2BGR).astype(np.float32)
+    return result
+
+
+def _old_step_tone_curve(result: np.ndarray, preset: dict, intensity: float) -> np.ndarray:
+    """Tone curve (custom points)."""
+    tc = preset.get('tone_curve')
+    if tc and len(tc) >= 2:
+        pts = np.array(tc, dtype=np.float64)
+        lut = np.interp(np.arange(256), pts[:, 0], pts[:, 1]).astype(np.float32)
+        ident = np.arange(256, dtype=np.float32)
+        blut = np.clip(ident * (1 - intensity) + lut * intensity, 0, 255).astype(np.uint8)
+        lab = cv2.cvtColor(_to_u8(result), cv2.COLOR_BGR2LAB)
+        lab[:, :, 0] = blut[lab[:, :, 0]]
+        result = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR).astype(np.float32)
+    return result
+
+
+_OLD_COLOUR_STEPS = {
+    "exposure": _old_step_exposure,
+    "temperature": _old_step_temperature,
+    "contrast": _old_step_contrast,
+    "tones": _old_step_tones,
+    "hsl": _old_step_hsl,
+    "split_toning": _old_step_split_toning,
+    "vibrance": _old_step_vibrance,
+    "tone_curve": _old_step_tone_curve,
+}
+
+
+def _old_engine(img: np.ndarray, preset: dict, intensity: float) -> np.ndarray:
+    result = img.astype(np.float32)
+    for name, step, spatial in PRESET_STEPS:
+        if spatial:
+            result = step(result, preset, intensity)
+        else:
+            result = _OLD_COLOUR_STEPS[name](result, preset, intensity)
+    return np.clip(result, 0, 255).astype(np.uint8)
+
+
+PRESETS = {
+    "warm_punch": {
+        "exposure": 0.35, "temperature": 18.0, "tint": -6.0, "contrast": 25.0,
+        "highlights": -40.0, "shadows": 30.0, "whites": 12.0, "blacks": -15.0,
+        "vibrance": 20.0, "saturation": 8.0,
+    },
+    "moody_hsl": {
+        "exposure": -0.2, "contrast": 15.0,
+        "hsl_hue_red": 20.0, "hsl_hue_orange": -30.0, "hsl_sat_orange": -20.0,
+        "hsl_hue_green": 40.0, "hsl_sat_green": -60.0, "hsl_lum_blue": -25.0,
+        "hsl_sat_aqua": 0.2,
+        "split_highlight_hue": 45.0, "split_highlight_sat": 25.0,
+        "split_shadow_hue": 210.0, "split_shadow_sat": 30.0, "split_balance": -20.0,
+        "clarity": 20.0,
+    },
+    "faded_curve": {
+        "tone_curve": [[0, 30], [64, 70], [128, 128], [192, 190], [255, 235]],
+        "saturation": -35.0, "vibrance": -10.0, "sharpness": 40.0,
+        "vignette_amount": -20.0,
+    },
+}
+
+
+def _images():
+    rng = np.random.default_rng(7)
+    yield rng.integers(0, 256, (61, 83, 3), dtype=np.uint8)
+    yy, xx = np.mgrid[0:64, 0:96]
+    yield np.stack([xx * 2.6, yy * 4, (xx + yy) * 1.6], axis=-1).astype(np.uint8)
+    hsv = np.stack([np.tile(np.arange(180, dtype=np.uint8), (40, 1)),
+                    np.full((40, 180), 200, np.uint8), np.full((40, 180), 180, np.uint8)], axis=-1)
+    yield cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+
+
+@pytest.mark.parametrize("name", sorted(PRESETS))
+@pytest.mark.parametrize("intensity", [1.0, 0.65])
+def test_plan_matches_original_steps(name, intensity):
+    for img in _images():
+        expected = _old_engine(img, PRESETS[name], intensity)
+        np.testing.assert_array_equal(apply_preset_params(img, PRESETS[name], intensity), expected)
+
+
+def test_tables_match_full_value_range():
+    # Every 8-bit level through each L-channel table vs the original formula
+    levels = np.arange(256, dtype=np.uint8)
+    img = cv2.cvtColor(np.stack([levels, np.full(256, 128, np.uint8), np.full(256, 128, np.uint8)],
+                                axis=-1)[None], cv2.COLOR_LAB2BGR)
+    preset = {**PRESETS["warm_punch"], **PRESETS["faded_curve"]}
+    np.testing.assert_array_equal(apply_preset_params(img, preset, 0.8), _old_engine(img, preset, 0.8))
+
+
+def test_plans_are_cached_per_preset_and_intensity():
+    preset = {**PRESETS["warm_punch"], "exposure": 0.123}
+    plan = preset_plan(preset, 0.7)
+    before = phase1_style.preset_plan_cache_info()
+    assert preset_plan(dict(preset), 0.7) is plan
+    assert preset_plan(preset, 0.5) is not plan
+    after = phase1_style.preset_plan_cache_info()
+    assert after["hits"] == before["hits"] + 1
+    assert after["misses"] == before["misses"] + 1
@@ -0,0 +1,121 @@
+"""Background full-res restyles: bounded, one per photo, coalesced to the latest request."""
+import asyncio
+import threading
+import time
+
+from app.routers import process
+
+
+def _wait_idle(timeout: float = 5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with process._pending_lock:
+            if not process._active_renders:
+                return
+        time.sleep(0.01)
+    raise AssertionError("render queue did not drain")
+
+
+def test_renders_coalesce_to_latest_generation(monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+    rendered = []
+
+    def fake_render(photo, profile, generation, img=None):
+        rendered.append((photo["id"], generation))
+        if generation == 1:
+            started.set()
+            release.wait(5)
+        return {"status": "success"}
+
+    monkeypatch.setattr(process, "_render_full_restyle", fake_render)
+    photo = {"id": "photo-a", "original_key": "p/originals/a.jpg"}
+
+    process._queue_full_restyle(photo, None, 1)
+    assert started.wait(5)
+    # While generation 1 renders, newer requests replace each other in the queue
+    for generation in (2, 3, 4):
+        process._queue_full_restyle(photo, None, generation)
+    with process._pending_lock:
+        assert process._pending_renders["photo-a"][2] == 4
+    release.set()
+    _wait_idle()
+
+    assert rendered == [("photo-a", 1), ("photo-a", 4)]
+
+
+def test_superseded_render_skips_decode(monkeypatch):
+    downloads = []
+    monkeypatch.setattr("app.storage.supabase_storage.download_photo", lambda key: downloads.append(key))
+    photo = {"id": "photo-b", "original_key": "p/originals/b.jpg"}
+
+    old = process._next_generation("photo-b")
+    process._next_generation("photo-b")
+    res = process._render_full_restyle(photo, None, old)
+
+    assert res == {"status": "superseded"}
+    assert downloads == []
+
+
+def test_replaced_job_resolves_superseded(monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+
+    def fake_render(photo, profile, generation, img=None):
+        if generation == 1:
+            started.set()
+            release.wait(5)
+        return {"status": "success", "generation": generation}
+
+    monkeypatch.setattr(process, "_render_full_restyle", fake_render)
+    photo = {"id": "photo-c", "original_key": "p/originals/c.jpg"}
+
+    first = process._queue_full_restyle(photo, None, 1)
+    assert started.wait(5)
+    waiting = process._queue_full_restyle(photo, None, 2)
+    latest = process._queue_full_restyle(photo, None, 3)
+    assert waiting.result(5) == {"status": "superseded"}
+    release.set()
+
+    assert first.result(5)["generation"] == 1
+    assert latest.result(5)["generation"] == 3
+    _wait_idle()
+
+
+def test_direct_restyle_is_serialised_with_background_render(monkeypatch):
+    in_flight = 0
+    overlaps = []
+    lock = threading.Lock()
+    started = threading.Event()
+
+    def fake_render(photo, profile, generation, img=None):
+        nonlocal in_flight
+        with lock:
+            in_flight += 1
+            overlaps.append(in_flight)
+        started.set()
+        time.sleep(0.1)
+        with lock:
+            in_flight -= 1
+        return {"status": "success", "edited_key": "p/edited/d.jpg"}
+
+    class FakeSupabase:
+        def select_single(self, table, columns="*", filters=None):
+            return {"id": "photo-d", "original_key": "p/originals/d.jpg"}
+
+    class FakeProfile:
+        row = {"status": "ready", "name": "Warm"}
+
+    monkeypatch.setattr(process, "_render_full_restyle", fake_render)
+    monkeypatch.setattr(process, "get_supabase", lambda: FakeSupabase())
+    monkeypatch.setattr(process, "get_style_profile_cached", lambda profile_id: FakeProfile())
+    monkeypatch.setattr("app.storage.supabase_storage.get_signed_url", lambda key: f"https://signed/{key}")
+
+    photo = {"id": "photo-d", "original_key": "p/originals/d.jpg"}
+    process._queue_full_restyle(photo, None, process._next_generation("photo-d"))
+    assert started.wait(5)
+    res = asyncio.run(process.restyle_photo(process.RestyleRequest(photo_id="photo-d", style_profile_id="sp")))
+    _wait_idle()
+
+    assert res["status"] == "success"
+    assert max(overlaps) == 1 and len(overlaps) == 2
@@ -0,0 +1,74 @@
+"""Cached style profile entries: CPU rendering and the pipeline's use of them."""
+import cv2
+import numpy as np
+
+from app.pipeline import orchestrator
+from app.pipeline.phase1_style import PRESET_INTENSITY, apply_preset_params
+from app.storage import style_cache
+from app.storage.style_cache import StyleProfileEntry
+
+PRESET = {"exposure": 0.4, "contrast": 20.0, "temperature": 10.0, "saturation": -15.0}
+
+
+def _image(seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, (48, 64, 3), dtype=np.uint8)
+
+
+def test_has_cpu_style():
+    assert not StyleProfileEntry({"id": "a", "settings": {"version": "2.0"}}).has_cpu_style
+    assert StyleProfileEntry({"id": "b", "settings": {"preset": PRESET}}).has_cpu_style
+    assert StyleProfileEntry({"id": "c", "settings": {"lut": {"key": "x.cube"}}}).has_cpu_style
+
+
+def test_render_preset_matches_per_step_engine():
+    entry = StyleProfileEntry({"id": "p", "settings": {"version": "2.0", "preset": PRESET}})
+    img = _image()
+    np.testing.assert_array_equal(entry.render(img), apply_preset_params(img, PRESET, PRESET_INTENSITY))
+
+
+def test_pipeline_renders_cached_entry_on_full_res_frame():
+    entry = StyleProfileEntry({"id": "p", "settings": {"version": "2.0", "preset": PRESET}})
+    # Smooth gradient so JPEG loss stays small next to the style's effect
+    yy, xx = np.mgrid[0:48, 0:64]
+    img = np.stack([xx * 4, yy * 5, (xx + yy) * 2], axis=-1).astype(np.uint8)
+    photo = {"id": "ph", "original_key": "p/g/originals/a.cr2", "_processed_img": img}
+
+    jpeg = orchestrator._apply_style_profile_cpu(photo, entry, "photos")
+
+    decoded = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+    expected = entry.render(img)
+    assert decoded.shape == img.shape
+    assert np.abs(decoded.astype(int) - expected.astype(int)).mean() < 4
+
+
+class _FlakyProfiles:
+    """style_profiles table whose freshness check can fail or find no row."""
+
+    def __init__(self, row):
+        self.row = row
+        self.head_error = None
+
+    def select_single(self, table, columns="*", filters=None):
+        if columns == "id,updated_at":
+            if self.head_error:
+                raise self.head_error
+            return {"id": self.row["id"], "updated_at": self.row["updated_at"]} if self.row else None
+        return self.row
+
+
+def test_failed_freshness_check_keeps_cached_entry(monkeypatch):
+    table = _FlakyProfiles({"id": "sp-flaky", "updated_at": "t1", "settings": {"preset": PRESET}})
+    monkeypatch.setattr(style_cache, "get_supabase", lambda: table)
+    entry = style_cache.get_style_profile_cached("sp-flaky")
+    assert entry is not None
+
+    table.head_error = RuntimeError("PostgREST 503")
+    assert style_cache.get_style_profile_cached("sp-flaky") is entry
+
+    # Only a check that really finds no row drops the entry
+    table.head_error = None
+    table.row = None
+    assert style_cache.get_style_profile_cached("sp-flaky") is None
+    table.row = {"id": "sp-flaky", "updated_at": "t2", "settings": {"preset": PRESET}}
+    assert style_cache.get_style_profile_cached("sp-flaky") is not entry
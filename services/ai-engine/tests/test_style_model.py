@@ -0,0 +1,110 @@
+"""Torch side of the Modal style endpoints (app.modal.style_model), run on CPU."""
+import io
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from app.modal.style_model import (  # noqa: E402
+    LUT_DIM, TRAIN_MIN_DELTA, TRAIN_SIZE, _PairDataset, _apply_lut, _apply_lut_reference,
+    _apply_lut_u8, _build_lut_model, _style_batch_pipelined, _style_batch_sequential,
+    _train_lut_model,
+)
+
+
+def _random_model(seed: int = 0):
+    """LUT model with randomised head weights (an untrained one is the identity)."""
+    torch.manual_seed(seed)
+    model = _build_lut_model()
+    with torch.no_grad():
+        model.head[-1].weight.normal_(0, 1e-3)
+    return model.eval()
+
+
+def test_pipelined_batch_matches_sequential():
+    pytest.importorskip("torchvision")
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    model = _random_model()
+    device = torch.device("cpu")
+
+    source = {}
+    for i in range(12):
+        h, w = int(rng.integers(200, 900)), int(rng.integers(200, 900))
+        buf = io.BytesIO()
+        Image.fromarray(rng.integers(0, 256, (h, w, 3), dtype=np.uint8)).save(buf, format="PNG")
+        source[f"in/{i}.png"] = buf.getvalue()
+    items = [{"image_key": f"in/{i}.png", "output_key": f"out/{i}.jpg"} for i in range(12)]
+    items.insert(5, {"image_key": "in/missing.png", "output_key": "out/missing.jpg"})
+
+    sequential, pipelined = {}, {}
+    res_seq = _style_batch_sequential(items, model, device, source.__getitem__, sequential.__setitem__, 95)
+    # Small window and batches, so prefetch and upload back-pressure both kick in
+    res_pipe = _style_batch_pipelined(items, model, device, source.__getitem__, pipelined.__setitem__, 95,
+                                      io_workers=3, upload_workers=2, forward_batch=5, prefetch=6)
+
+    assert [r["status"] for r in res_seq] == [r["status"] for r in res_pipe]
+    assert res_pipe[5]["status"] == "error"
+    assert sequential.keys() == pipelined.keys()
+    for key, data in sequential.items():
+        a = np.asarray(Image.open(io.BytesIO(data)), dtype=np.int16)
+        b = np.asarray(Image.open(io.BytesIO(pipelined[key])), dtype=np.int16)
+        # Batched convolutions may sum in a different order
+        assert np.abs(a - b).max() <= 1, key
+
+
+def _graded_lut(seed: int = 0):
+    torch.manual_seed(seed)
+    coords = torch.linspace(0, 1, LUT_DIM)
+    r, g, b = torch.meshgrid(coords, coords, coords, indexing="ij")
+    return (torch.stack([r, g, b], dim=-1) ** 0.8 + 0.02 * torch.randn(LUT_DIM, LUT_DIM, LUT_DIM, 3)).clamp(0, 1)
+
+
+def test_grid_sample_lut_matches_gather_reference():
+    lut = _graded_lut()
+    img = torch.randint(0, 256, (613, 977, 3), dtype=torch.uint8).float() / 255.0
+    assert (_apply_lut_reference(img, lut) - _apply_lut(img, lut)).abs().max().item() < 1e-5
+
+
+def test_banded_uint8_lut_matches_reference():
+    lut = _graded_lut(1)
+    img_u8 = torch.randint(0, 256, (613, 977, 3), dtype=torch.uint8)
+    ref_u8 = (_apply_lut_reference(img_u8.float() / 255.0, lut) * 255).to(torch.uint8)
+    # Bands much smaller than the image
+    out = _apply_lut_u8(img_u8, lut, band_pixels=50_000)
+    assert (ref_u8.int() - out.int()).abs().max().item() <= 1
+
+
+def test_lut_is_differentiable():
+    lut = _graded_lut(2).requires_grad_(True)
+    img = torch.rand(64, 64, 3)
+    _apply_lut(img, lut).mean().backward()
+    assert lut.grad is not None and lut.grad.abs().sum() > 0
+
+
+def test_train_loop_learns_global_grade_and_keeps_best_epoch():
+    """Pairs are smooth random images and a fixed global grade of them, which a LUT can represent."""
+    from PIL import Image
+
+    torch.manual_seed(0)
+    rng = np.random.default_rng(0)
+    originals, editeds = [], []
+    for _ in range(24):
+        small = rng.integers(0, 256, (16, 16, 3), dtype=np.uint8)
+        orig = np.asarray(Image.fromarray(small).resize((TRAIN_SIZE, TRAIN_SIZE), Image.BICUBIC))
+        graded = (orig / 255.0) ** 0.8 * np.array([1.0, 0.97, 0.9])
+        originals.append(orig)
+        editeds.append(np.clip(graded * 255 + 0.5, 0, 255).astype(np.uint8))
+
+    train_ds = _PairDataset(originals[6:], editeds[6:])
+    val_ds = _PairDataset(originals[:6], editeds[:6])
+    _, info = _train_lut_model(train_ds, val_ds, torch.device("cpu"), 15,
+                               patience=5, batch_size=4, log_every=0)
+
+    val = info["loss_curve"]["val"]
+    assert info["epochs_run"] == len(info["loss_curve"]["train"]) == len(val)
+    assert min(val) < val[0]
+    assert val[info["best_epoch"] - 1] <= min(val) + TRAIN_MIN_DELTA
+    assert info["stopped"] in ("converged", "max_epochs")
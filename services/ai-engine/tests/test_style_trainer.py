@@ -0,0 +1,117 @@
+"""Incremental style training: references replaced under the same key are re-read."""
+import cv2
+import numpy as np
+import pytest
+
+from app.config import Settings
+from app.storage import feature_store
+from app.pipeline import style_stats
+from app.workers import style_trainer
+
+PHOTOGRAPHER = "ph-1"
+PROFILE = "profile-1"
+
+
+def _jpeg(seed: int, tint=(0, 0, 0)) -> bytes:
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:120, 0:160]
+    img = np.stack([xx, yy, xx + yy], axis=-1) % 256 + rng.integers(0, 20, (120, 160, 3))
+    img = np.clip(img + np.array(tint), 0, 255).astype(np.uint8)
+    ok, buf = cv2.imencode(".jpg", img)
+    assert ok
+    return buf.tobytes()
+
+
+class _Storage:
+    """In-memory bucket with an ETag that changes on every write."""
+
+    def __init__(self):
+        self.objects: dict[str, bytes] = {}
+        self.versions: dict[str, int] = {}
+        self.downloads: list[str] = []
+
+    def upload(self, key, data, content_type="image/jpeg"):
+        self.objects[key] = data
+        self.versions[key] = self.versions.get(key, 0) + 1
+        return key
+
+    def download(self, key):
+        self.downloads.append(key)
+        return self.objects.get(key)
+
+    def etag(self, key):
+        return f'"{key}:{self.versions[key]}"' if key in self.objects else None
+
+
+@pytest.fixture
+def trainer_env(monkeypatch, tmp_path):
+    storage = _Storage()
+    profiles = {}
+    for module in (style_trainer, style_stats, feature_store):
+        monkeypatch.setattr(module, "download_photo", storage.download)
+    for module in (style_stats, feature_store):
+        monkeypatch.setattr(module, "upload_photo", storage.upload)
+    monkeypatch.setattr(style_trainer, "photo_etag", storage.etag)
+    monkeypatch.setattr(feature_store, "get_settings", lambda: Settings(feature_cache_dir=str(tmp_path)))
+    monkeypatch.setattr(style_trainer, "get_style_profile", lambda pid: profiles[pid])
+
+    def update(pid, **fields):
+        profiles[pid].update(fields)
+
+    monkeypatch.setattr(style_trainer, "update_style_profile", update)
+    refs = [f"{PHOTOGRAPHER}/refs/{i}.jpg" for i in range(12)]
+    for i, key in enumerate(refs):
+        storage.upload(key, _jpeg(i))
+    profiles[PROFILE] = {"id": PROFILE, "photographer_id": PHOTOGRAPHER,
+                         "reference_image_keys": refs, "settings": {}}
+    return storage, profiles, refs
+
+
+def _reference(profiles):
+    return profiles[PROFILE]["settings"]["reference"]
+
+
+def test_retrain_skips_unchanged_references(trainer_env):
+    storage, profiles, refs = trainer_env
+    style_trainer.train_profile(PROFILE)
+    assert profiles[PROFILE]["status"] == "ready"
+
+    storage.downloads.clear()
+    style_trainer.train_profile(PROFILE)
+    assert not [k for k in storage.downloads if k in refs]
+
+
+def test_replaced_reference_is_reread(trainer_env):
+    storage, profiles, refs = trainer_env
+    style_trainer.train_profile(PROFILE)
+    before = _reference(profiles)
+
+    # Same key, different content
+    storage.upload(refs[3], _jpeg(3, tint=(0, 40, 90)))
+    storage.downloads.clear()
+    style_trainer.train_profile(PROFILE)
+    incremental = _reference(profiles)
+    assert [k for k in storage.downloads if k in refs] == [refs[3]]
+    assert incremental != before
+
+    style_trainer.train_profile(PROFILE, full=True)
+    full = _reference(profiles)
+    assert incremental.keys() == full.keys()
+    for name in full:
+        np.testing.assert_allclose(incremental[name], full[name], rtol=1e-9, atol=1e-9)
+
+
+def test_unreadable_etags_keep_trained_references(trainer_env, monkeypatch, caplog):
+    storage, profiles, refs = trainer_env
+    style_trainer.train_profile(PROFILE)
+    before = _reference(profiles)
+
+    monkeypatch.setattr(style_trainer, "photo_etag", lambda key: None)
+    storage.downloads.clear()
+    with caplog.at_level("WARNING", logger=style_trainer.log.name):
+        style_trainer.train_profile(PROFILE)
+
+    assert not [k for k in storage.downloads if k in refs]
+    assert _reference(profiles) == before
+    warnings = [r for r in caplog.records if "No ETag" in r.getMessage()]
+    assert len(warnings) == 1 and warnings[0].levelname == "WARNING"
@@ -0,0 +1,42 @@
+"""Strip tiling: default worker count and pixel-identical tiled output."""
+import cv2
+import numpy as np
+import pytest
+
+from app.config import Settings
+from app.pipeline import tiling
+
+
+@pytest.mark.parametrize("cpus, concurrent, configured, expected", [
+    (16, 4, 0, 4),    # cores shared between the images styled at once
+    (64, 4, 0, 8),    # capped
+    (2, 4, 0, 1),     # never below one thread
+    (16, 0, 0, 8),    # max_concurrent_images misconfigured as 0
+    (16, 4, 12, 12),  # explicit setting wins
+])
+def test_style_workers(monkeypatch, cpus, concurrent, configured, expected):
+    monkeypatch.setattr(tiling, "get_settings",
+                        lambda: Settings(style_workers=configured, max_concurrent_images=concurrent))
+    monkeypatch.setattr(tiling, "available_cpus", lambda: cpus)
+    assert tiling.style_workers() == expected
+
+
+def test_available_cpus_respects_affinity(monkeypatch):
+    monkeypatch.setattr(tiling.os, "sched_getaffinity", lambda pid: {0, 1, 2}, raising=False)
+    assert tiling.available_cpus() == 3
+
+
+def test_strips_match_untiled():
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 256, (517, 301, 3), dtype=np.uint8)
+    sigma = 3.0
+    halo = tiling.gaussian_radius(sigma)
+
+    def blur(strip, y0):
+        return cv2.GaussianBlur(strip, (0, 0), sigma)
+
+    # Full-frame reference; halos make every strip see the same neighbourhood
+    # except at the frame's own top/bottom border, which strips share
+    expected = blur(img, 0)
+    out = tiling.run_in_strips(img, blur, halo, rows=tiling.MIN_STRIP_ROWS, workers=3)
+    np.testing.assert_array_equal(out, expected)